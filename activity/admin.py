@@ -1,3 +1,10 @@
 from django.contrib import admin
+from .models import Activity
 
-# Register your models here.
+
+@admin.register(Activity)
+class ActivityAdmin(admin.ModelAdmin):
+    list_display = ('timestamp', 'shop', 'user', 'action')
+    list_filter = ('shop', 'timestamp')
+    search_fields = ('action', 'user__username')
+    date_hierarchy = 'timestamp'
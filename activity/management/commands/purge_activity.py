@@ -0,0 +1,27 @@
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from activity.models import Activity
+
+
+class Command(BaseCommand):
+    help = "Delete activity records older than the retention period, in chunks."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--days', type=int, default=90, help="Keep records from the last N days.")
+        parser.add_argument('--batch-size', type=int, default=5000)
+
+    def handle(self, *args, **options):
+        cutoff = timezone.now() - timedelta(days=options['days'])
+        expired = Activity.objects.filter(timestamp__lt=cutoff).order_by('pk')
+        total = 0
+        # Short DELETEs keep locks and WAL bursts small while the API keeps writing
+        while True:
+            ids = list(expired.values_list('pk', flat=True)[:options['batch_size']])
+            if not ids:
+                break
+            deleted, _ = Activity.objects.filter(pk__in=ids).delete()
+            total += deleted
+        self.stdout.write(self.style.SUCCESS(f"Deleted {total} activity records older than {cutoff:%Y-%m-%d}."))
@@ -0,0 +1,30 @@
+# Generated by Django 5.1.4 on 2026-10-18 18:04
+
+import django.utils.timezone
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('activity', '0001_initial'),
+        ('shop', '0019_product_low_stock_alerted_product_reorder_level'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AlterModelOptions(
+            name='activity',
+            options={'ordering': ['-timestamp']},
+        ),
+        migrations.AlterField(
+            model_name='activity',
+            name='timestamp',
+            field=models.DateTimeField(default=django.utils.timezone.now),
+        ),
+        migrations.AddIndex(
+            model_name='activity',
+            index=models.Index(fields=['shop', 'timestamp'], name='activity_shop_timestamp_idx'),
+        ),
+    ]
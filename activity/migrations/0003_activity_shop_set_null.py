@@ -0,0 +1,20 @@
+# Generated by Django 5.1.4 on 2026-10-18 18:33
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('activity', '0002_alter_activity_options_alter_activity_timestamp_and_more'),
+        ('shop', '0022_receiptsequence'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='activity',
+            name='shop',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='activities', to='shop.shop'),
+        ),
+    ]
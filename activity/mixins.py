@@ -0,0 +1,46 @@
+from django.db import transaction
+
+from shop.models import Shop, SaleItem
+from .recorder import record_activity
+
+
+def activity_shop_id(instance):
+    if isinstance(instance, Shop):
+        return instance.pk
+    if isinstance(instance, SaleItem):
+        return instance.sale.shop_id
+    return instance.shop_id
+
+
+class ActivityLoggingMixin:
+    """
+    Record an Activity for every create, update and delete made through the viewset.
+
+    Events are queued once the surrounding transaction commits, so rolled back
+    writes are never logged, and are written in batches by the recorder.
+    """
+
+    def perform_create(self, serializer):
+        super().perform_create(serializer)
+        self.log_activity('created', serializer.instance)
+
+    def perform_update(self, serializer):
+        super().perform_update(serializer)
+        self.log_activity('updated', serializer.instance)
+
+    def perform_destroy(self, instance):
+        # A deleted shop can't be referenced by the event recording it
+        shop_id = None if isinstance(instance, Shop) else activity_shop_id(instance)
+        action = f"deleted {self.activity_label(instance)}"
+        super().perform_destroy(instance)
+        self.queue_activity(shop_id, action)
+
+    def activity_label(self, instance):
+        return f"{instance._meta.verbose_name} #{instance.pk}"
+
+    def log_activity(self, verb, instance, label=None):
+        self.queue_activity(activity_shop_id(instance), f"{verb} {label or self.activity_label(instance)}")
+
+    def queue_activity(self, shop_id, action):
+        user_id = self.request.user.pk
+        transaction.on_commit(lambda: record_activity(shop_id, user_id, action))
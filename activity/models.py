@@ -1,13 +1,22 @@
 from django.db import models
 from django.conf import settings
+from django.utils import timezone
 from shop.models import Shop
 
 
 class Activity(models.Model):
-    shop = models.ForeignKey(Shop, on_delete=models.CASCADE, related_name='activities')
+    # Kept, without its shop, once the shop is deleted; its own deletion is logged that way too
+    shop = models.ForeignKey(Shop, on_delete=models.SET_NULL, null=True, blank=True, related_name='activities')
     user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name='activities')
     action = models.CharField(max_length=255)
-    timestamp = models.DateTimeField(auto_now_add=True)
+    # Set by the recorder when the event happens, not when the batch is flushed
+    timestamp = models.DateTimeField(default=timezone.now)
 
     def __str__(self):
         return f"{self.user.username} - {self.action}"
+
+    class Meta:
+        ordering = ['-timestamp']
+        indexes = [
+            models.Index(fields=['shop', 'timestamp'], name='activity_shop_timestamp_idx'),
+        ]
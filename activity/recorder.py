@@ -0,0 +1,99 @@
+import atexit
+import logging
+import os
+import threading
+
+from django.conf import settings
+from django.db import close_old_connections, connection
+from django.utils import timezone
+
+from .models import Activity
+
+logger = logging.getLogger(__name__)
+
+
+class ActivityRecorder:
+    """
+    Buffer Activity rows in-process and write them with one bulk_create.
+
+    A daemon thread flushes the buffer every ACTIVITY_FLUSH_INTERVAL seconds,
+    or as soon as ACTIVITY_BATCH_SIZE events are waiting. With ACTIVITY_SYNC
+    (tests, management commands) every event is written immediately.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.wakeup = threading.Event()
+        self.buffer = []
+        self.thread = None
+        self.pid = None
+
+    @property
+    def batch_size(self):
+        return getattr(settings, 'ACTIVITY_BATCH_SIZE', 200)
+
+    @property
+    def flush_interval(self):
+        return getattr(settings, 'ACTIVITY_FLUSH_INTERVAL', 5)
+
+    def record(self, shop_id, user_id, action):
+        activity = Activity(shop_id=shop_id, user_id=user_id, action=action, timestamp=timezone.now())
+        if getattr(settings, 'ACTIVITY_SYNC', False):
+            self.write([activity])
+            return
+
+        with self.lock:
+            self.ensure_thread()
+            self.buffer.append(activity)
+            full = len(self.buffer) >= self.batch_size
+        if full:
+            self.wakeup.set()
+
+    def ensure_thread(self):
+        # A forked worker inherits the buffer but not the thread; start over in the child
+        if self.pid != os.getpid():
+            self.pid = os.getpid()
+            self.buffer = []
+            self.thread = threading.Thread(target=self.run, name='activity-recorder', daemon=True)
+            self.thread.start()
+
+    def run(self):
+        while True:
+            self.wakeup.wait(self.flush_interval)
+            self.wakeup.clear()
+            self.flush()
+            close_old_connections()
+
+    def flush(self):
+        with self.lock:
+            pending, self.buffer = self.buffer, []
+        if pending:
+            self.write(pending)
+
+    def write(self, activities):
+        try:
+            Activity.objects.bulk_create(activities, batch_size=self.batch_size)
+            return
+        except Exception:
+            # Losing audit rows must never take the API down with it
+            if len(activities) == 1:
+                logger.exception("Could not write activity record %r.", activities[0].action)
+                return
+            logger.warning("Could not write %d activity records at once, retrying one by one.", len(activities))
+
+        # A single bad row must not cost the rest of the batch
+        for activity in activities:
+            self.write([activity])
+
+    def shutdown(self):
+        if self.pid == os.getpid():
+            self.flush()
+            connection.close()
+
+
+recorder = ActivityRecorder()
+atexit.register(recorder.shutdown)
+
+
+def record_activity(shop_id, user_id, action):
+    recorder.record(shop_id, user_id, action)
@@ -1,3 +1,48 @@
-from django.test import TestCase
+from django.test import TestCase, TransactionTestCase
+from rest_framework.test import APIClient
 
-# Create your tests here.
+from core.models import User
+from shop.models import Shop
+from .models import Activity
+from .recorder import ActivityRecorder
+
+
+class ActivityRecorderTests(TransactionTestCase):
+    # Foreign keys may only be checked on commit, which a TestCase never reaches
+
+    def setUp(self):
+        self.user = User.objects.create_user('alice', 'alice@example.com', 'password')
+        self.shop = Shop.objects.create(name='Corner Shop', owner=self.user)
+
+    def test_a_bad_row_does_not_lose_the_batch(self):
+        recorder = ActivityRecorder()
+        recorder.buffer = [
+            Activity(shop_id=self.shop.pk, user=self.user, action='created product #1'),
+            Activity(shop_id=self.shop.pk + 1000, user=self.user, action='created product #2'),
+            Activity(shop_id=self.shop.pk, user=self.user, action='created product #3'),
+        ]
+        with self.assertLogs('activity.recorder', 'ERROR'):
+            recorder.flush()
+
+        self.assertQuerySetEqual(
+            Activity.objects.order_by('action').values_list('action', flat=True),
+            ['created product #1', 'created product #3'],
+        )
+
+
+class ActivityLoggingTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('alice', 'alice@example.com', 'password')
+        cls.shop = Shop.objects.create(name='Corner Shop', owner=cls.user)
+
+    def test_shop_deletes_are_recorded_without_the_shop(self):
+        client = APIClient()
+        client.force_authenticate(self.user)
+        with self.settings(ACTIVITY_SYNC=True), self.captureOnCommitCallbacks(execute=True):
+            response = client.delete(f'/shop/api/shops/{self.shop.pk}/')
+
+        self.assertEqual(response.status_code, 204)
+        activity = Activity.objects.get()
+        self.assertEqual((activity.shop_id, activity.action), (None, f'deleted shop #{self.shop.pk}'))
@@ -0,0 +1,24 @@
+# Generated by Django 5.1.4 on 2026-10-18 18:01
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('notification', '0001_initial'),
+        ('shop', '0019_product_low_stock_alerted_product_reorder_level'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AlterModelOptions(
+            name='notification',
+            options={'ordering': ['-created_at']},
+        ),
+        migrations.AddIndex(
+            model_name='notification',
+            index=models.Index(fields=['user', 'is_read', '-created_at'], name='notification_user_unread_idx'),
+        ),
+    ]
@@ -12,3 +12,9 @@ class Notification(models.Model):
 
     def __str__(self):
         return f"Notification for {self.user.username} in {self.shop.name}"
+
+    class Meta:
+        ordering = ['-created_at']
+        indexes = [
+            models.Index(fields=['user', 'is_read', '-created_at'], name='notification_user_unread_idx'),
+        ]
@@ -0,0 +1,9 @@
+from rest_framework import serializers
+from .models import Notification
+
+
+class NotificationSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = Notification
+        fields = ['id', 'shop', 'message', 'is_read', 'created_at']
+        read_only_fields = ['shop', 'message', 'created_at']
@@ -0,0 +1,53 @@
+from django.db import transaction
+from django.db.models import F, Q
+from django.db.models.signals import post_save
+from django.dispatch import receiver
+
+from shop.models import Product
+from shop.signals import inventory_changed
+from .models import Notification
+
+
+def notify_low_stock(product_ids):
+    """
+    Notify shop owners about products that have just dropped to their reorder level.
+
+    Each product alerts once per crossing: the low_stock_alerted flag is set
+    under a row lock together with the notification, and cleared again once
+    stock is back above the threshold.
+    """
+    with transaction.atomic():
+        Product.objects.filter(
+            Q(reorder_level__isnull=True) | Q(inventory__gt=F('reorder_level')),
+            pk__in=product_ids, low_stock_alerted=True,
+        ).update(low_stock_alerted=False)
+
+        crossed = list(
+            Product.objects.select_for_update(of=('self',)).filter(
+                pk__in=product_ids, low_stock_alerted=False, inventory__lte=F('reorder_level'),
+            ).values_list('pk', 'name', 'inventory', 'shop_id', 'shop__owner_id')
+        )
+        if not crossed:
+            return
+
+        Product.objects.filter(pk__in=[product_id for product_id, *_ in crossed]).update(low_stock_alerted=True)
+        Notification.objects.bulk_create([
+            Notification(shop_id=shop_id, user_id=owner_id, message=f"{name} is low on stock ({inventory} left).")
+            for product_id, name, inventory, shop_id, owner_id in crossed
+        ])
+
+
+@receiver(inventory_changed)
+def check_low_stock(sender, product_ids, **kwargs):
+    notify_low_stock(product_ids)
+
+
+@receiver(post_save, sender=Product)
+def check_saved_product_stock(sender, instance, created, update_fields=None, **kwargs):
+    # Only saves that change the stock or its threshold can cross it. post_save
+    # runs inside Product.save(), before the stored values are refreshed.
+    if update_fields is not None and not {'inventory', 'reorder_level'} & set(update_fields):
+        return
+    if (created and instance.reorder_level is None) or not instance.stock_changed():
+        return
+    notify_low_stock([instance.pk])
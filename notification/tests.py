@@ -1,3 +1,124 @@
+from decimal import Decimal
+from unittest import mock
+
 from django.test import TestCase
+from rest_framework.test import APIClient
+
+from core.models import User
+from shop.models import Shop, Product
+from .models import Notification
+from .signals import notify_low_stock
+
+
+class LowStockNotificationTests(TestCase):
+    """
+    Products notify their shop's owner once when stock drops to reorder_level,
+    and again only after it has been back above it.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.owners = [User.objects.create_user(f'owner{i}', f'owner{i}@example.com', 'password') for i in range(2)]
+        cls.shops = [Shop.objects.create(name=f'Shop {i}', owner=owner) for i, owner in enumerate(cls.owners)]
+        cls.products = [
+            Product.objects.create(name='Tea', price=Decimal('5.00'), inventory=10, reorder_level=5, shop=shop)
+            for shop in cls.shops
+        ]
+
+    def setUp(self):
+        self.client = APIClient()
+
+    def sell(self, product, quantity):
+        self.client.force_authenticate(product.shop.owner)
+        response = self.client.post('/shop/api/sales/checkout/', {
+            'shop': product.shop_id, 'items': [{'product': product.pk, 'quantity': quantity}],
+        }, format='json')
+        self.assertEqual(response.status_code, 201, response.content)
+
+    def set_inventory(self, product, inventory):
+        self.client.force_authenticate(product.shop.owner)
+        response = self.client.patch(f'/shop/api/products/{product.pk}/', {'inventory': inventory}, format='json')
+        self.assertEqual(response.status_code, 200, response.content)
+
+    def test_one_notification_per_owner_per_crossing(self):
+        for product in self.products:
+            self.sell(product, 4)
+            self.assertFalse(Notification.objects.filter(user=product.shop.owner).exists())
+            self.sell(product, 1)
+            self.sell(product, 2)
+
+        for owner, shop in zip(self.owners, self.shops):
+            notifications = Notification.objects.filter(user=owner)
+            self.assertEqual(notifications.count(), 1)
+            self.assertEqual(notifications.get().shop, shop)
+            self.assertIn('Tea is low on stock (5 left)', notifications.get().message)
+
+    def test_alert_rearms_after_restock(self):
+        product = self.products[0]
+        self.sell(product, 6)
+        self.set_inventory(product, 3)
+        self.assertEqual(Notification.objects.filter(user=self.owners[0]).count(), 1)
+
+        self.set_inventory(product, 20)
+        product.refresh_from_db()
+        self.assertFalse(product.low_stock_alerted)
+        self.sell(product, 16)
+        self.assertEqual(Notification.objects.filter(user=self.owners[0]).count(), 2)
+
+    def test_saves_leaving_stock_alone_skip_the_check(self):
+        product = Product.objects.get(pk=self.products[0].pk)
+        self.client.force_authenticate(product.shop.owner)
+        with mock.patch('notification.signals.notify_low_stock', wraps=notify_low_stock) as notify:
+            product.save()
+            product.save(update_fields=['price'])
+            response = self.client.patch(f'/shop/api/products/{product.pk}/', {'price': '6.00'}, format='json')
+            self.assertEqual(response.status_code, 200)
+            notify.assert_not_called()
+
+            product.refresh_from_db()
+            product.reorder_level = 12
+            product.save()
+            notify.assert_called_once_with([product.pk])
+        self.assertEqual(Notification.objects.count(), 1)
+
+
+class NotificationListTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('alice', 'alice@example.com', 'password')
+        cls.shop = Shop.objects.create(name='Corner Shop', owner=cls.user)
+        Notification.objects.bulk_create([
+            Notification(shop=cls.shop, user=cls.user, message=f'Message {i}', is_read=i % 4 == 0)
+            for i in range(10)
+        ])
+        other = User.objects.create_user('bob', 'bob@example.com', 'password')
+        Notification.objects.create(shop=Shop.objects.create(name='Other', owner=other), user=other, message='Bob')
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def test_unread_notifications_are_paginated(self):
+        response = self.client.get('/notification/api/notifications/', {'page_size': 3})
+        messages = []
+        pages = 0
+        while True:
+            self.assertEqual(response.status_code, 200)
+            self.assertLessEqual(len(response.data['results']), 3)
+            messages += [row['message'] for row in response.data['results']]
+            pages += 1
+            if not response.data['next']:
+                break
+            response = self.client.get(response.data['next'])
+
+        unread = Notification.objects.filter(user=self.user, is_read=False).order_by('-created_at', '-id')
+        self.assertEqual(messages, [notification.message for notification in unread])
+        self.assertEqual((len(messages), pages), (7, 3))
 
-# Create your tests here.
+    def test_mark_all_read(self):
+        response = self.client.post('/notification/api/notifications/mark-all-read/')
+        self.assertEqual(response.data, {'updated': 7})
+        self.assertEqual(self.client.get('/notification/api/notifications/').data['results'], [])
+        everything = self.client.get('/notification/api/notifications/', {'include_read': 'true'})
+        self.assertEqual(len(everything.data['results']), 10)
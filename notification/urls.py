@@ -0,0 +1,12 @@
+from django.urls import path, include
+from rest_framework.routers import DefaultRouter
+from .views import NotificationViewSet
+
+router = DefaultRouter()
+
+
+router.register(r'notifications', NotificationViewSet, basename='notification')
+
+urlpatterns = [
+    path('api/', include(router.urls)),
+]
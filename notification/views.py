@@ -1,3 +1,33 @@
-from django.shortcuts import render
+from rest_framework import mixins, viewsets
+from rest_framework.decorators import action
+from rest_framework.permissions import IsAuthenticated
+from rest_framework.response import Response
+from shop.pagination import KeysetPagination
+from .models import Notification
+from .serializers import NotificationSerializer
 
-# Create your views here.
+
+class NotificationCursorPagination(KeysetPagination):
+    ordering = ('-created_at', '-id')
+
+
+class NotificationViewSet(mixins.ListModelMixin, mixins.RetrieveModelMixin, mixins.UpdateModelMixin,
+                          viewsets.GenericViewSet):
+    """
+    The authenticated user's notifications, unread only unless ?include_read=true.
+    Marking one as read is a PATCH with {"is_read": true}.
+    """
+    serializer_class = NotificationSerializer
+    permission_classes = [IsAuthenticated]
+    pagination_class = NotificationCursorPagination
+
+    def get_queryset(self):
+        queryset = Notification.objects.filter(user=self.request.user)
+        if self.action == 'list' and self.request.query_params.get('include_read') != 'true':
+            queryset = queryset.filter(is_read=False)
+        return queryset
+
+    @action(detail=False, methods=['post'], url_path='mark-all-read')
+    def mark_all_read(self, request):
+        updated = Notification.objects.filter(user=request.user, is_read=False).update(is_read=True)
+        return Response({"updated": updated})
@@ -1,6 +1,8 @@
 from django.contrib import admin
+from django.db import transaction
 from django.utils.html import format_html
-from .models import Shop, ProductCategory, Product, Sale, SaleItem
+from .models import Shop, ProductCategory, Product, Sale, SaleItem, DailyProductSales, InventoryMovement, \
+    InventorySnapshot
 
 
 @admin.register(Shop)
@@ -30,6 +32,19 @@ class ProductAdmin(admin.ModelAdmin):
     search_fields = ('name', 'category__name', 'shop__name')
     ordering = ('name',)
 
+    @transaction.atomic
+    def save_model(self, request, obj, form, change):
+        # Stock edited here goes into the inventory ledger like any other adjustment
+        previous = 0
+        if change:
+            previous = Product.objects.select_for_update().values_list('inventory', flat=True).get(pk=obj.pk)
+        super().save_model(request, obj, form, change)
+        if obj.inventory != previous:
+            InventoryMovement.objects.create(
+                shop_id=obj.shop_id, product=obj, kind=InventoryMovement.ADJUSTMENT,
+                quantity=obj.inventory - previous, reason='Changed in admin', user=request.user,
+            )
+
 
 @admin.register(Sale)
 class SaleAdmin(admin.ModelAdmin):
@@ -38,11 +53,11 @@ class SaleAdmin(admin.ModelAdmin):
     search_fields = ['receipt_number']
     date_hierarchy = 'sale_date'
 
-    # Dynamic total sale amount
     def amount(self, obj):
-        return sum(item.quantity * item.unit_price for item in obj.items.all())
+        return obj.total_amount
 
     amount.short_description = 'Total Amount'
+    amount.admin_order_field = 'total_amount'
 
     def view_sale(self, obj):
         return format_html('<a href="/admin/{}/sale/{}/">View Sale</a>', obj._meta.app_label, obj.pk)
@@ -56,7 +71,26 @@ class SaleItemAdmin(admin.ModelAdmin):
     list_filter = ['product__category']
     search_fields = ('sale__receipt_number', 'product__name')
 
-    def unit_price(self, obj):
-        return obj.product.price
 
-    unit_price.short_description = 'Unit Price'
+@admin.register(DailyProductSales)
+class DailyProductSalesAdmin(admin.ModelAdmin):
+    list_display = ('day', 'shop', 'product', 'quantity', 'revenue', 'cost')
+    list_filter = ('shop', 'day')
+    search_fields = ('product__name', 'shop__name')
+    date_hierarchy = 'day'
+
+
+@admin.register(InventoryMovement)
+class InventoryMovementAdmin(admin.ModelAdmin):
+    list_display = ('created_at', 'shop', 'product', 'kind', 'quantity', 'reason', 'user')
+    list_filter = ('kind', 'shop', 'created_at')
+    search_fields = ('product__name', 'reason')
+    date_hierarchy = 'created_at'
+
+
+@admin.register(InventorySnapshot)
+class InventorySnapshotAdmin(admin.ModelAdmin):
+    list_display = ('day', 'shop', 'product', 'quantity')
+    list_filter = ('shop', 'day')
+    search_fields = ('product__name',)
+    date_hierarchy = 'day'
@@ -0,0 +1,142 @@
+"""
+Async read endpoints for the catalog and sales reports.
+
+These are plain Django async views over the async ORM, so under an ASGI
+server (uvicorn shop_management.asgi:application) a slow report no longer
+holds a worker thread while catalog reads wait. They authenticate with the
+same DRF tokens, their rows are rendered by the viewsets' serializers
+(through the values fast path) and the lists page with the viewsets' cursor
+paginations, so fields, formatting, pages and next/previous links are the same.
+"""
+from functools import wraps
+
+from asgiref.sync import sync_to_async
+from django.db.models import F
+from django.http import JsonResponse
+from django.views.decorators.http import require_GET
+from rest_framework.authtoken.models import Token
+from rest_framework.exceptions import APIException
+from rest_framework.request import Request
+
+from .fastpath import ValuesSerializer
+from .filters import ProductFilter, SaleFilter
+from .models import Shop, Product, Sale, SaleItem, DailyProductSales
+from .pagination import ProductCursorPagination, SaleCursorPagination
+from .reports import parse_bound, parse_ids, product_sales_querysets, merge_sales_totals
+from .serializers import ProductSerializer, ProductSoldSerializer, SaleListSerializer
+
+MAX_LIMIT = 500
+
+
+def token_required(view):
+    """
+    Authenticate `Authorization: Token <key>` with one async query and load
+    the caller's shop ids into the same per-request cache user_shop_ids uses.
+    """
+    @wraps(view)
+    async def wrapper(request, *args, **kwargs):
+        scheme, _, key = request.headers.get('Authorization', '').partition(' ')
+        if scheme.lower() != 'token' or not key:
+            return JsonResponse({"detail": "Authentication credentials were not provided."}, status=401)
+        try:
+            token = await Token.objects.select_related('user').aget(key=key.strip())
+        except Token.DoesNotExist:
+            return JsonResponse({"detail": "Invalid token."}, status=401)
+        if not token.user.is_active:
+            return JsonResponse({"detail": "User inactive or deleted."}, status=401)
+
+        request.user = token.user
+        shop_ids = Shop.objects.filter(owner=token.user).order_by().values_list('pk', flat=True)
+        request._user_shop_ids = (token.user.pk, frozenset([pk async for pk in shop_ids]))
+        return await view(request, *args, **kwargs)
+    return wrapper
+
+
+def shop_ids(request):
+    return request._user_shop_ids[1]
+
+
+async def filtered(filterset_class, request, queryset):
+    # Building the filterset may validate choices against the database
+    filterset = await sync_to_async(filterset_class)(request.GET, queryset=queryset)
+    if not await sync_to_async(filterset.is_valid)():
+        return None, filterset.errors
+    return filterset.qs, None
+
+
+async def paginated(request, queryset, fast, pagination_class):
+    """
+    One cursor page of `queryset`, rendered like the serializer `fast` was
+    derived from. The page is the one the sync list returns for the same
+    query string: pagination_class applies its ordering and cursor, and
+    there is no COUNT(*) or OFFSET into the whole list.
+    """
+    request = Request(request)
+    paginator = pagination_class()
+    # The cursor is built from the ordering fields of the last row
+    ordering = paginator.get_ordering(request, queryset, None)
+    rows = fast.values(queryset, *(field.lstrip('-') for field in ordering))
+    try:
+        # The async ORM runs its queries through sync_to_async as well
+        page = await sync_to_async(paginator.paginate_queryset)(rows, request)
+    except APIException as exc:
+        return JsonResponse({"detail": str(exc.detail)}, status=exc.status_code)
+    return JsonResponse({
+        "next": paginator.get_next_link(),
+        "previous": paginator.get_previous_link(),
+        "results": fast.render(page),
+    })
+
+
+@require_GET
+@token_required
+async def product_list(request):
+    queryset = Product.objects.filter(shop_id__in=shop_ids(request))
+    queryset, errors = await filtered(ProductFilter, request, queryset)
+    if errors:
+        return JsonResponse(errors, status=400)
+    fast = ValuesSerializer.for_serializer(ProductSerializer(context={'request': request}))
+    return await paginated(request, queryset, fast, ProductCursorPagination)
+
+
+@require_GET
+@token_required
+async def sale_list(request):
+    queryset = Sale.objects.filter(shop_id__in=shop_ids(request))
+    queryset, errors = await filtered(SaleFilter, request, queryset)
+    if errors:
+        return JsonResponse(errors, status=400)
+    queryset = queryset.annotate(
+        sales_total=F('total_amount'),
+        profit_total=F('total_amount') - F('total_cost'),
+    )
+    fast = ValuesSerializer.for_serializer(SaleListSerializer())
+    return await paginated(request, queryset, fast, SaleCursorPagination)
+
+
+@require_GET
+@token_required
+async def products_sold(request):
+    if not request.GET.getlist('product'):
+        return JsonResponse({"error": "Product ID is required."}, status=400)
+    try:
+        product_ids = parse_ids(request.GET.getlist('product'))
+    except ValueError:
+        return JsonResponse({"error": "Invalid Product ID."}, status=400)
+    if not product_ids or len(product_ids) > MAX_LIMIT:
+        return JsonResponse({"error": f"Between 1 and {MAX_LIMIT} product IDs are allowed."}, status=400)
+
+    try:
+        start = parse_bound(request.GET.get('start_date'))
+        end = parse_bound(request.GET.get('end_date'))
+    except ValueError:
+        return JsonResponse({"error": "Invalid date range."}, status=400)
+
+    rows = []
+    for queryset in product_sales_querysets(
+        SaleItem.objects.filter(product_id__in=product_ids, sale__shop_id__in=shop_ids(request)),
+        DailyProductSales.objects.filter(product_id__in=product_ids, shop_id__in=shop_ids(request)),
+        start, end,
+    ):
+        rows += [row async for row in queryset]
+    return JsonResponse(ProductSoldSerializer(merge_sales_totals(rows), many=True).data, safe=False)
@@ -0,0 +1,35 @@
+import time
+
+from django.core.cache import cache
+
+
+def _version_key(namespace, shop_id):
+    return f'{namespace}:version:{shop_id}'
+
+
+def get_versions(namespace, shop_ids):
+    """
+    Current version of each shop's data in a namespace, in shop id order.
+
+    A missing version starts at the current time rather than 0, so entries
+    cached before an eviction of the version key can never be served again.
+    """
+    keys = [_version_key(namespace, shop_id) for shop_id in sorted(shop_ids)]
+    versions = cache.get_many(keys)
+    for key in keys:
+        if key not in versions:
+            cache.add(key, time.time_ns(), None)
+            versions[key] = cache.get(key)
+    return tuple(versions[key] for key in keys)
+
+
+def bump_version(namespace, shop_ids):
+    """
+    Invalidate everything cached for these shops in a namespace.
+    """
+    for shop_id in set(shop_ids):
+        key = _version_key(namespace, shop_id)
+        try:
+            cache.incr(key)
+        except ValueError:
+            cache.set(key, time.time_ns(), None)
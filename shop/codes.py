@@ -0,0 +1,81 @@
+import threading
+from collections import OrderedDict
+
+from django.db.models import Q
+
+from .cache import get_versions
+from .models import Product
+
+MISSING = object()
+
+
+class CodeCache:
+    """
+    In-process LRU of scanned code lookups, keyed by (shop_id, code).
+
+    Entries remember the catalog version they were read at and are ignored once
+    the shop's version moves on, so any product write invalidates them without
+    having to find the codes it touched. Misses are cached too.
+    """
+
+    def __init__(self, maxsize=10000):
+        self.maxsize = maxsize
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+
+    def get(self, key, version):
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None or entry[0] != version:
+                return MISSING
+            self.entries.move_to_end(key)
+            return entry[1]
+
+    def set(self, key, version, value):
+        with self.lock:
+            self.entries[key] = (version, value)
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.maxsize:
+                self.entries.popitem(last=False)
+
+
+code_cache = CodeCache()
+
+
+def resolve_codes(shop_ids, codes, render):
+    """
+    Find the products of the given shops whose SKU or barcode is one of `codes`.
+
+    Returns {(shop_id, code): data or None}. Cached lookups cost only the
+    catalog version read; all the others are resolved with one query and
+    rendered with `render(products) -> list of data`.
+    """
+    versions = dict(zip(sorted(shop_ids), get_versions('catalog', shop_ids)))
+    results = {}
+    missing = []
+    for shop_id in versions:
+        for code in codes:
+            value = code_cache.get((shop_id, code), versions[shop_id])
+            if value is MISSING:
+                missing.append((shop_id, code))
+            else:
+                results[shop_id, code] = value
+
+    if missing:
+        missing_shops = {shop_id for shop_id, _ in missing}
+        missing_codes = {code for _, code in missing}
+        products = list(
+            Product.objects.filter(shop_id__in=missing_shops)
+            .filter(Q(sku__in=missing_codes) | Q(barcode__in=missing_codes))
+            .select_related('category')
+        )
+        found = {}
+        for product, data in zip(products, render(products)):
+            for code in (product.sku, product.barcode):
+                if code in missing_codes:
+                    found[product.shop_id, code] = data
+        for key in missing:
+            results[key] = found.get(key)
+            code_cache.set(key, versions[key[0]], results[key])
+
+    return results
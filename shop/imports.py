@@ -0,0 +1,106 @@
+from django.db import transaction
+from rest_framework.exceptions import ValidationError
+
+from .models import InventoryMovement, Product, ProductCategory
+from .serializers import ProductImportRowSerializer
+from .signals import bump_catalog_on_commit, inventory_changed
+
+IMPORT_BATCH_SIZE = 1000
+OPTIONAL_FIELDS = ('description', 'mrp', 'inventory', 'category')
+
+
+def _batches(rows, size):
+    batch = []
+    for index, row in enumerate(rows):
+        batch.append((index, row))
+        if len(batch) >= size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def import_products(shop, rows, batch_size=IMPORT_BATCH_SIZE):
+    """
+    Create or update the products of a shop from an iterable of dicts.
+
+    Rows are validated without per-row queries, categories are resolved by
+    name, and each batch is written as one INSERT ... ON CONFLICT (name, shop)
+    DO UPDATE. Invalid rows are skipped and reported by their input position.
+    Existing products only have the optional fields a row actually includes
+    overwritten, so a feed without e.g. inventory leaves stock untouched.
+    """
+    row_serializer = ProductImportRowSerializer()
+    result = {'created': 0, 'updated': 0, 'errors': []}
+
+    for batch in _batches(rows, batch_size):
+        valid = {}
+        for index, row in batch:
+            try:
+                data = row_serializer.run_validation(row)
+            except ValidationError as exc:
+                result['errors'].append({'row': index, 'errors': exc.detail})
+                continue
+            # A later row for the same name wins; ON CONFLICT can't touch a row twice
+            valid[data['name']] = (index, data)
+
+        category_names = {data['category'] for _, data in valid.values() if data.get('category')}
+        categories = dict(
+            ProductCategory.objects.filter(shop=shop, name__in=category_names).values_list('name', 'id')
+        )
+
+        # Rows providing the same optional fields share one upsert statement
+        groups = {}
+        for name, (index, data) in valid.items():
+            category_name = data.get('category')
+            if category_name and category_name not in categories:
+                result['errors'].append({'row': index, 'errors': {'category': [f"Unknown category {category_name}."]}})
+                continue
+            product = Product(
+                shop=shop,
+                name=name,
+                description=data.get('description'),
+                price=data['price'],
+                mrp=data.get('mrp'),
+                inventory=data.get('inventory', 0),
+                category_id=categories.get(category_name),
+            )
+            provided = tuple(field for field in OPTIONAL_FIELDS if field in data)
+            groups.setdefault(provided, []).append(product)
+
+        names = [product.name for products in groups.values() for product in products]
+        with transaction.atomic():
+            # Locked so the ledger records exactly the change this import makes
+            existing = dict(
+                Product.objects.select_for_update().filter(shop=shop, name__in=names).values_list('name', 'inventory')
+            )
+            stocked = []
+            for provided, products in groups.items():
+                Product.objects.bulk_create(
+                    products,
+                    update_conflicts=True,
+                    unique_fields=['name', 'shop'],
+                    update_fields=['price', 'updated_at', *provided],
+                )
+                if 'inventory' in provided:
+                    stocked.extend(
+                        product for product in products if product.inventory != existing.get(product.name, 0)
+                    )
+            if stocked:
+                InventoryMovement.objects.bulk_create([
+                    InventoryMovement(
+                        shop=shop, product_id=product.pk, kind=InventoryMovement.IMPORT,
+                        quantity=product.inventory - existing.get(product.name, 0),
+                    )
+                    for product in stocked
+                ])
+                inventory_changed.send(
+                    sender=Product, product_ids=[product.pk for product in stocked], shop_ids=[shop.pk]
+                )
+            bump_catalog_on_commit([shop.pk])
+
+        result['updated'] += len(existing)
+        result['created'] += len(names) - len(existing)
+
+    result['errors'].sort(key=lambda error: error['row'])
+    return result
@@ -0,0 +1,36 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import OuterRef, Subquery
+
+from shop.models import Product, SaleItem
+
+
+class Command(BaseCommand):
+    help = "Populate the unit_price/unit_mrp snapshot of sale items recorded before it existed."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000)
+
+    def handle(self, *args, **options):
+        batch_size = options['batch_size']
+        product = Product.objects.filter(pk=OuterRef('product_id'))
+        last_pk = 0
+        total = 0
+
+        while True:
+            batch = list(
+                SaleItem.objects.filter(pk__gt=last_pk, unit_price__isnull=True)
+                .order_by('pk').values_list('pk', flat=True)[:batch_size]
+            )
+            if not batch:
+                break
+
+            with transaction.atomic():
+                total += SaleItem.objects.filter(pk__in=batch, unit_price__isnull=True).update(
+                    unit_price=Subquery(product.values('price')[:1]),
+                    unit_mrp=Subquery(product.values('mrp')[:1]),
+                )
+            last_pk = batch[-1]
+            self.stdout.write(f"Backfilled {total} sale items...")
+
+        self.stdout.write(self.style.SUCCESS(f"Backfilled prices for {total} sale items."))
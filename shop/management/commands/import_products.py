@@ -0,0 +1,40 @@
+import csv
+import json
+
+from django.core.management.base import BaseCommand, CommandError
+
+from shop.imports import IMPORT_BATCH_SIZE, import_products
+from shop.models import Shop
+
+
+class Command(BaseCommand):
+    help = "Create or update the products of a shop from a CSV or JSON file, matched on name."
+
+    def add_arguments(self, parser):
+        parser.add_argument('path')
+        parser.add_argument('--shop', type=int, required=True)
+        parser.add_argument('--format', choices=['csv', 'json'], help="Defaults to the file extension.")
+        parser.add_argument('--batch-size', type=int, default=IMPORT_BATCH_SIZE)
+
+    def handle(self, *args, **options):
+        try:
+            shop = Shop.objects.get(pk=options['shop'])
+        except Shop.DoesNotExist:
+            raise CommandError(f"Shop {options['shop']} does not exist.")
+
+        path = options['path']
+        file_format = options['format'] or ('json' if path.endswith('.json') else 'csv')
+
+        with open(path, newline='', encoding='utf-8') as handle:
+            if file_format == 'json':
+                rows = json.load(handle)
+            else:
+                # Empty cells mean "not given" rather than an empty value
+                rows = ({key: value for key, value in row.items() if value != ''} for row in csv.DictReader(handle))
+            result = import_products(shop, rows, batch_size=options['batch_size'])
+
+        for error in result['errors']:
+            self.stderr.write(f"Row {error['row']}: {json.dumps(error['errors'])}")
+        self.stdout.write(self.style.SUCCESS(
+            f"Created {result['created']} and updated {result['updated']} products, {len(result['errors'])} errors."
+        ))
@@ -0,0 +1,72 @@
+import timeit
+
+from django.core.management.base import BaseCommand, CommandError
+from django.http import HttpRequest
+from rest_framework.renderers import JSONRenderer
+from rest_framework.request import Request
+
+from shop import renderers
+from shop.fastpath import ValuesSerializer
+from shop.models import Product, SaleItem, Shop
+from shop.renderers import ORJSONRenderer
+from shop.serializers import ProductSerializer, SaleItemSerializer
+
+
+class Command(BaseCommand):
+    help = (
+        "Time the values() fast path against the serializers, and ORJSONRenderer against "
+        "JSONRenderer, on a page of a shop's products and sale items, and check that "
+        "both produce the same response body."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--shop', type=int, required=True, help="Shop whose rows are rendered.")
+        parser.add_argument('--rows', type=int, default=500, help="Rows per page.")
+        parser.add_argument('--repeat', type=int, default=20, help="Runs per measurement; the best one is shown.")
+
+    def handle(self, *args, **options):
+        if options['rows'] < 1 or options['repeat'] < 1:
+            raise CommandError("--rows and --repeat must be positive.")
+        shop = Shop.objects.select_related('owner').filter(pk=options['shop']).first()
+        if shop is None:
+            raise CommandError(f"Shop {options['shop']} does not exist.")
+        if renderers.orjson is None:
+            self.stdout.write("orjson is not installed; ORJSONRenderer falls back to JSONRenderer.")
+
+        request = Request(HttpRequest())
+        request.user = shop.owner
+        rows = options['rows']
+        cases = [
+            ('products', ProductSerializer,
+             Product.objects.filter(shop=shop).select_related('category').order_by('-id')[:rows]),
+            ('sale items', SaleItemSerializer,
+             SaleItem.objects.filter(sale__shop=shop).select_related('sale').order_by('-id')[:rows]),
+        ]
+        for name, serializer_class, queryset in cases:
+            context = {'request': request}
+            fast = ValuesSerializer.for_serializer(serializer_class(context=context))
+            instances = list(queryset)
+            values = list(fast.values(queryset))
+            if not instances:
+                self.stdout.write(f"{name:<11} no rows")
+                continue
+
+            serialized = serializer_class(instances, many=True, context=context).data
+            rendered = fast.render(values)
+            identical = JSONRenderer().render(serialized) == ORJSONRenderer().render(rendered)
+
+            timings = {
+                'serializer': self.best(lambda: serializer_class(instances, many=True, context=context).data,
+                                        options['repeat']),
+                'fast path': self.best(lambda: fast.render(values), options['repeat']),
+                'json': self.best(lambda: JSONRenderer().render(rendered), options['repeat']),
+                'orjson': self.best(lambda: ORJSONRenderer().render(rendered), options['repeat']),
+            }
+            self.stdout.write(
+                f"{name:<11} {len(instances)} rows  "
+                + "  ".join(f"{label} {seconds * 1000:.2f} ms" for label, seconds in timings.items())
+                + f"  identical {'yes' if identical else 'NO'}"
+            )
+
+    def best(self, function, repeat):
+        return min(timeit.repeat(function, number=1, repeat=repeat))
@@ -0,0 +1,76 @@
+import statistics
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+from django.core.management.base import BaseCommand, CommandError
+
+# (report, WSGI viewset path, ASGI path)
+ENDPOINTS = [
+    ('products', '/shop/api/products/', '/shop/api/async/products/'),
+    ('sales', '/shop/api/sales/', '/shop/api/async/sales/'),
+    ('products-sold', '/shop/api/products-sold/', '/shop/api/async/products-sold/'),
+]
+
+
+class Command(BaseCommand):
+    help = (
+        "Compare concurrent request throughput of the read endpoints on a WSGI server "
+        "with their async counterparts on an ASGI server, e.g. runserver or gunicorn "
+        "against uvicorn shop_management.asgi:application."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--token', required=True, help="API token of a shop owner.")
+        parser.add_argument('--wsgi', default='http://127.0.0.1:8000', help="Base URL of the WSGI server.")
+        parser.add_argument('--asgi', default='http://127.0.0.1:8001', help="Base URL of the ASGI server.")
+        parser.add_argument('--requests', type=int, default=500, help="Requests per endpoint and server.")
+        parser.add_argument('--concurrency', type=int, default=50)
+        parser.add_argument('--product', type=int, action='append', default=[],
+                            help="Product id for products-sold; the report is skipped without one.")
+
+    def handle(self, *args, **options):
+        if options['requests'] < 1 or options['concurrency'] < 1:
+            raise CommandError("--requests and --concurrency must be positive.")
+
+        headers = {'Authorization': f"Token {options['token']}"}
+        for report, wsgi_path, asgi_path in ENDPOINTS:
+            params = {}
+            if report == 'products-sold':
+                if not options['product']:
+                    continue
+                params = {'product': options['product']}
+            for server, url in (('WSGI', options['wsgi'] + wsgi_path), ('ASGI', options['asgi'] + asgi_path)):
+                result = self.run(url, params, headers, options['requests'], options['concurrency'])
+                self.stdout.write(
+                    f"{report:<14} {server}  {result['throughput']:8.1f} req/s  "
+                    f"p50 {result['p50']:7.1f} ms  p95 {result['p95']:7.1f} ms  errors {result['errors']}"
+                )
+
+    def run(self, url, params, headers, count, concurrency):
+        local = threading.local()
+
+        def fetch(_):
+            # One keep-alive connection per worker thread
+            if not hasattr(local, 'session'):
+                local.session = requests.Session()
+            started = time.perf_counter()
+            try:
+                ok = local.session.get(url, params=params, headers=headers, timeout=60).status_code == 200
+            except requests.RequestException:
+                ok = False
+            return time.perf_counter() - started, ok
+
+        started = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=concurrency) as executor:
+            results = list(executor.map(fetch, range(count)))
+        elapsed = time.perf_counter() - started
+
+        latencies = sorted(latency * 1000 for latency, _ in results)
+        return {
+            'throughput': count / elapsed,
+            'p50': statistics.median(latencies),
+            'p95': latencies[min(len(latencies) - 1, int(len(latencies) * 0.95))],
+            'errors': sum(1 for _, ok in results if not ok),
+        }
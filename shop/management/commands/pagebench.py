@@ -0,0 +1,95 @@
+import timeit
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+from rest_framework.pagination import Cursor
+from rest_framework.test import APIClient
+
+from shop.models import Sale, SaleItem, Shop
+from shop.pagination import SaleCursorPagination, SaleItemCursorPagination
+
+# (report, list URL, pagination class, tenant queryset)
+ENDPOINTS = [
+    ('sales', '/shop/api/sales/', SaleCursorPagination, lambda shop: Sale.objects.filter(shop=shop)),
+    ('sale items', '/shop/api/sale-items/', SaleItemCursorPagination,
+     lambda shop: SaleItem.objects.filter(sale__shop=shop)),
+]
+
+
+class Command(BaseCommand):
+    help = (
+        "Compare the latency of page 1 and a deep page of the sales and sale item lists of a "
+        "shop, through the cursor the API hands out and through the OFFSET query page numbers "
+        "would run. --seed adds sales to the shop first; use a scratch database for that."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--shop', type=int, required=True, help="Shop to page through, as its owner.")
+        parser.add_argument('--page', type=int, default=10000, help="Deep page to compare with page 1.")
+        parser.add_argument('--page-size', type=int, default=50)
+        parser.add_argument('--repeat', type=int, default=5, help="Runs per measurement; the best one is shown.")
+        parser.add_argument('--seed', type=int, default=0, help="Sales to add to the shop before measuring.")
+
+    def handle(self, *args, **options):
+        if options['page'] < 2 or options['page_size'] < 1 or options['repeat'] < 1:
+            raise CommandError("--page must be at least 2, --page-size and --repeat positive.")
+        shop = Shop.objects.select_related('owner').filter(pk=options['shop']).first()
+        if shop is None:
+            raise CommandError(f"Shop {options['shop']} does not exist.")
+        if options['seed']:
+            self.seed(shop, options['seed'])
+
+        client = APIClient()
+        client.force_authenticate(shop.owner)
+        page_size = options['page_size']
+        offset = (options['page'] - 1) * page_size
+
+        for report, url, pagination_class, rows in ENDPOINTS:
+            queryset = rows(shop)
+            ordering = pagination_class.ordering
+            field = ordering[0].lstrip('-')
+            position = queryset.order_by(*ordering).values_list(field, flat=True)[offset - 1:offset].first()
+            if position is None:
+                self.stdout.write(f"{report:<11} fewer than {offset} rows, skipped")
+                continue
+
+            # The cursor the previous page's `next` link would carry
+            paginator = pagination_class()
+            paginator.base_url = f'http://testserver{url}?page_size={page_size}'
+            deep_url = paginator.encode_cursor(Cursor(offset=0, reverse=False, position=str(position)))
+
+            def fetch(target):
+                response = client.get(target, {'page_size': page_size} if target == url else None)
+                if response.status_code != 200:
+                    raise CommandError(f"{target} answered {response.status_code}")
+
+            def offset_page():
+                queryset.count()
+                list(queryset.order_by(*ordering).values('id')[offset:offset + page_size])
+
+            timings = {
+                'page 1': self.best(lambda: fetch(url), options['repeat']),
+                f"page {options['page']} by cursor": self.best(lambda: fetch(deep_url), options['repeat']),
+                f"page {options['page']} by OFFSET (SQL only)": self.best(offset_page, options['repeat']),
+            }
+            self.stdout.write(
+                f"{report:<11} " + "  ".join(f"{label} {seconds * 1000:.1f} ms" for label, seconds in timings.items())
+            )
+
+    def seed(self, shop, count, batch_size=5000):
+        # sale_date is auto_now_add, so distinct dates are written after the insert
+        start = timezone.now() - timedelta(seconds=count)
+        first = Sale.objects.count()
+        for batch_start in range(0, count, batch_size):
+            batch = Sale.objects.bulk_create([
+                Sale(shop=shop, receipt_number=f'bench-{shop.pk}-{first + index}')
+                for index in range(batch_start, min(batch_start + batch_size, count))
+            ])
+            for index, sale in enumerate(batch, batch_start):
+                sale.sale_date = start + timedelta(seconds=index)
+            Sale.objects.bulk_update(batch, ['sale_date'], batch_size=1000)
+        self.stdout.write(f"Seeded {count} sales.")
+
+    def best(self, function, repeat):
+        return min(timeit.repeat(function, number=1, repeat=repeat))
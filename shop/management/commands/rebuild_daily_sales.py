@@ -0,0 +1,58 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Case, F, Sum, When
+from django.db.models.functions import Coalesce, TruncDate
+
+from shop.models import DailyProductSales, SaleItem, Shop
+from shop.signals import bump_sales_on_commit
+
+
+class Command(BaseCommand):
+    help = "Rebuild the DailyProductSales rollup from the raw sale items."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--shop', type=int, help="Only rebuild the rollup of this shop.")
+        parser.add_argument('--batch-size', type=int, default=1000)
+
+    def handle(self, *args, **options):
+        batch_size = options['batch_size']
+        rollups = DailyProductSales.objects.all()
+        items = SaleItem.objects.all()
+        if options['shop']:
+            rollups = rollups.filter(shop_id=options['shop'])
+            items = items.filter(sale__shop_id=options['shop'])
+
+        # Items recorded before the price snapshot existed fall back to the live prices
+        unit_price = Coalesce('unit_price', 'product__price')
+        unit_cost = Case(
+            When(unit_price__isnull=True, then=Coalesce('product__mrp', 'product__price')),
+            default=Coalesce('unit_mrp', 'unit_price'),
+        )
+        rows = items.values(
+            'product_id', sale_shop_id=F('sale__shop_id'), day=TruncDate('sale__sale_date'),
+        ).annotate(
+            total_quantity=Sum('quantity'),
+            total_revenue=Sum(F('quantity') * unit_price),
+            total_cost=Sum(F('quantity') * unit_cost),
+        ).values_list(
+            'sale_shop_id', 'product_id', 'day', 'total_quantity', 'total_revenue', 'total_cost'
+        ).order_by()
+
+        created = 0
+        with transaction.atomic():
+            rollups.delete()
+            batch = []
+            for shop_id, product_id, day, quantity, revenue, cost in rows.iterator(chunk_size=batch_size):
+                batch.append(DailyProductSales(
+                    shop_id=shop_id, product_id=product_id, day=day,
+                    quantity=quantity, revenue=revenue, cost=cost,
+                ))
+                if len(batch) >= batch_size:
+                    created += len(DailyProductSales.objects.bulk_create(batch))
+                    batch = []
+            created += len(DailyProductSales.objects.bulk_create(batch))
+            bump_sales_on_commit(
+                [options['shop']] if options['shop'] else list(Shop.objects.values_list('pk', flat=True))
+            )
+
+        self.stdout.write(self.style.SUCCESS(f"Rebuilt {created} daily product sales rows."))
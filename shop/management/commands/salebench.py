@@ -0,0 +1,78 @@
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+
+from shop.models import ReceiptSequence, Sale, Shop
+
+
+class Command(BaseCommand):
+    help = (
+        "Measure concurrent sale creation throughput with receipt numbers reserved one "
+        "at a time and in blocks. The sales are created in the given shop and deleted afterwards."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--shop', type=int, required=True, help="Shop to create the sales in.")
+        parser.add_argument('--sales', type=int, default=2000, help="Sales per run.")
+        parser.add_argument('--threads', type=int, default=16)
+        parser.add_argument('--block-size', type=int, action='append', default=[],
+                            help="Block sizes to compare; defaults to 1 and the configured size.")
+
+    def handle(self, *args, **options):
+        if options['sales'] < 1 or options['threads'] < 1:
+            raise CommandError("--sales and --threads must be positive.")
+        if not Shop.objects.filter(pk=options['shop']).exists():
+            raise CommandError(f"Shop {options['shop']} does not exist.")
+
+        configured = ReceiptSequence.block_size
+        try:
+            for block_size in options['block_size'] or [1, configured]:
+                ReceiptSequence.block_size = block_size
+                ReceiptSequence._blocks.clear()
+                result = self.run(options['shop'], options['sales'], options['threads'])
+                self.stdout.write(
+                    f"block size {block_size:<4} {result['throughput']:8.1f} sales/s  "
+                    f"duplicates {result['duplicates']}  errors {result['errors']}"
+                )
+        finally:
+            ReceiptSequence.block_size = configured
+            ReceiptSequence._blocks.clear()
+
+    def run(self, shop_id, count, threads):
+        created = []
+        errors = []
+        lock = threading.Lock()
+
+        def sell(_):
+            try:
+                with transaction.atomic():
+                    sale = Sale.objects.create(shop_id=shop_id)
+                with lock:
+                    created.append((sale.pk, sale.receipt_number))
+            except Exception as exc:
+                with lock:
+                    errors.append(exc)
+
+        def work(batch):
+            # One connection per worker thread, closed when it is done
+            try:
+                for index in batch:
+                    sell(index)
+            finally:
+                connection.close()
+
+        batches = [range(index, count, threads) for index in range(threads)]
+        started = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=threads) as executor:
+            list(executor.map(work, batches))
+        elapsed = time.perf_counter() - started
+
+        Sale.objects.filter(pk__in=[pk for pk, _ in created]).delete()
+        return {
+            'throughput': len(created) / elapsed,
+            'duplicates': len(created) - len({number for _, number in created}),
+            'errors': len(errors),
+        }
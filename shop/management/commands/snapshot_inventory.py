@@ -0,0 +1,53 @@
+from datetime import datetime, time, timedelta
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Sum
+from django.utils import timezone
+from django.utils.dateparse import parse_date
+
+from shop.models import InventoryMovement, InventorySnapshot, Product
+
+
+class Command(BaseCommand):
+    help = "Compact the inventory ledger into end-of-day snapshots for products that moved."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--day', help="Day to snapshot (YYYY-MM-DD), defaults to yesterday.")
+        parser.add_argument('--days', type=int, default=1, help="Number of days to snapshot, ending with --day.")
+        parser.add_argument('--batch-size', type=int, default=1000)
+
+    def handle(self, *args, **options):
+        last_day = parse_date(options['day']) if options['day'] else timezone.localdate() - timedelta(days=1)
+        total = 0
+        for offset in range(options['days'] - 1, -1, -1):
+            total += self.snapshot(last_day - timedelta(days=offset), options['batch_size'])
+        self.stdout.write(self.style.SUCCESS(f"Wrote {total} inventory snapshots."))
+
+    @transaction.atomic
+    def snapshot(self, day, batch_size):
+        start = timezone.make_aware(datetime.combine(day, time.min))
+        end = start + timedelta(days=1)
+
+        moved = InventoryMovement.objects.filter(created_at__gte=start, created_at__lt=end)
+        product_ids = set(moved.values_list('product_id', flat=True).distinct())
+        if not product_ids:
+            return 0
+
+        # Closing stock is the current level minus everything recorded since the day ended
+        later = dict(
+            InventoryMovement.objects.filter(product_id__in=product_ids, created_at__gte=end)
+            .values('product_id').annotate(total=Sum('quantity')).values_list('product_id', 'total').order_by()
+        )
+        products = Product.objects.filter(pk__in=product_ids).values_list('pk', 'shop_id', 'inventory')
+        snapshots = [
+            InventorySnapshot(
+                shop_id=shop_id, product_id=product_id, day=day, quantity=inventory - later.get(product_id, 0)
+            )
+            for product_id, shop_id, inventory in products
+        ]
+        InventorySnapshot.objects.bulk_create(
+            snapshots, batch_size=batch_size,
+            update_conflicts=True, unique_fields=['product', 'day'], update_fields=['quantity'],
+        )
+        return len(snapshots)
@@ -0,0 +1,52 @@
+# Generated by Django 5.1.4 on 2026-10-18 17:49
+
+from django.db import migrations, models
+from django.db.models import F, OuterRef, Subquery, Sum
+from django.db.models.functions import Coalesce
+
+
+def backfill_sale_totals(apps, schema_editor):
+    Sale = apps.get_model('shop', 'Sale')
+    SaleItem = apps.get_model('shop', 'SaleItem')
+
+    def item_sum(expression):
+        return Coalesce(
+            Subquery(
+                SaleItem.objects.filter(sale=OuterRef('pk')).order_by()
+                .values('sale').annotate(total=Sum(expression)).values('total')
+            ),
+            0,
+            output_field=models.DecimalField(max_digits=12, decimal_places=2),
+        )
+
+    Sale.objects.update(
+        total_amount=item_sum(F('quantity') * F('product__price')),
+        total_cost=item_sum(F('quantity') * Coalesce('product__mrp', 'product__price')),
+        item_count=item_sum('quantity'),
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('shop', '0012_shop_address'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='sale',
+            name='item_count',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='sale',
+            name='total_amount',
+            field=models.DecimalField(db_index=True, decimal_places=2, default=0, editable=False, max_digits=12),
+        ),
+        migrations.AddField(
+            model_name='sale',
+            name='total_cost',
+            field=models.DecimalField(decimal_places=2, default=0, editable=False, max_digits=12),
+        ),
+        migrations.RunPython(backfill_sale_totals, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 5.1.4 on 2026-10-18 17:50
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('shop', '0013_sale_totals'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='saleitem',
+            name='unit_mrp',
+            field=models.DecimalField(decimal_places=2, editable=False, max_digits=10, null=True),
+        ),
+        migrations.AddField(
+            model_name='saleitem',
+            name='unit_price',
+            field=models.DecimalField(decimal_places=2, editable=False, max_digits=10, null=True),
+        ),
+    ]
@@ -0,0 +1,57 @@
+# Generated by Django 5.1.4 on 2026-10-18 17:52
+
+import django.contrib.postgres.indexes
+import django.db.models.functions.text
+from django.contrib.postgres.operations import TrigramExtension
+from django.db import migrations, models
+
+
+PRODUCT_NAME_TRGM_INDEX = django.contrib.postgres.indexes.GinIndex(
+    django.contrib.postgres.indexes.OpClass(django.db.models.functions.text.Upper('name'), name='gin_trgm_ops'),
+    name='shop_product_name_trgm_idx',
+)
+
+
+def add_trigram_index(apps, schema_editor):
+    # GIN/pg_trgm only exist on PostgreSQL; other backends keep the plain scan
+    if schema_editor.connection.vendor == 'postgresql':
+        schema_editor.add_index(apps.get_model('shop', 'Product'), PRODUCT_NAME_TRGM_INDEX)
+
+
+def remove_trigram_index(apps, schema_editor):
+    if schema_editor.connection.vendor == 'postgresql':
+        schema_editor.remove_index(apps.get_model('shop', 'Product'), PRODUCT_NAME_TRGM_INDEX)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('shop', '0015_dailyproductsales'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='dailyproductsales',
+            index=models.Index(fields=['shop', 'day'], name='shop_dailysales_shop_day_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='product',
+            index=models.Index(fields=['shop', 'inventory'], name='shop_product_shop_inv_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='product',
+            index=models.Index(fields=['shop', 'added_at'], name='shop_product_shop_added_idx'),
+        ),
+        TrigramExtension(),
+        # Database only: in model state the operator class would break table
+        # rebuilds on SQLite, which cannot parse it
+        migrations.RunPython(add_trigram_index, remove_trigram_index),
+        migrations.AddIndex(
+            model_name='sale',
+            index=models.Index(fields=['shop', '-sale_date'], name='shop_sale_shop_date_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='saleitem',
+            index=models.Index(fields=['product', 'sale'], include=('quantity', 'unit_price'), name='shop_saleitem_prod_sale_idx'),
+        ),
+    ]
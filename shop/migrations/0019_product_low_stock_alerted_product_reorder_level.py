@@ -0,0 +1,23 @@
+# Generated by Django 5.1.4 on 2026-10-18 18:01
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('shop', '0018_inventorysnapshot'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='product',
+            name='low_stock_alerted',
+            field=models.BooleanField(default=False, editable=False),
+        ),
+        migrations.AddField(
+            model_name='product',
+            name='reorder_level',
+            field=models.PositiveIntegerField(blank=True, null=True),
+        ),
+    ]
@@ -0,0 +1,79 @@
+# Generated by Django 5.1.4 on 2026-10-18 18:09
+
+import django.contrib.postgres.indexes
+import django.contrib.postgres.search
+from django.db import migrations
+
+
+PRODUCT_SEARCH_INDEX = django.contrib.postgres.indexes.GinIndex(
+    fields=['search_vector'], name='shop_product_search_idx',
+)
+
+CREATE_TRIGGERS = """
+CREATE OR REPLACE FUNCTION shop_product_search_vector_update() RETURNS trigger AS $$
+BEGIN
+    NEW.search_vector :=
+        setweight(to_tsvector('simple', coalesce(NEW.name, '')), 'A') ||
+        setweight(to_tsvector('simple', coalesce(NEW.description, '')), 'B') ||
+        setweight(to_tsvector('simple', coalesce(
+            (SELECT name FROM shop_productcategory WHERE id = NEW.category_id), ''
+        )), 'C');
+    RETURN NEW;
+END
+$$ LANGUAGE plpgsql;
+
+CREATE TRIGGER shop_product_search_vector_trigger
+    BEFORE INSERT OR UPDATE OF name, description, category_id ON shop_product
+    FOR EACH ROW EXECUTE FUNCTION shop_product_search_vector_update();
+
+CREATE OR REPLACE FUNCTION shop_productcategory_search_vector_update() RETURNS trigger AS $$
+BEGIN
+    UPDATE shop_product SET category_id = category_id WHERE category_id = NEW.id;
+    RETURN NULL;
+END
+$$ LANGUAGE plpgsql;
+
+CREATE TRIGGER shop_productcategory_search_vector_trigger
+    AFTER UPDATE OF name ON shop_productcategory
+    FOR EACH ROW WHEN (OLD.name IS DISTINCT FROM NEW.name)
+    EXECUTE FUNCTION shop_productcategory_search_vector_update();
+
+UPDATE shop_product SET name = name;
+"""
+
+DROP_TRIGGERS = """
+DROP TRIGGER IF EXISTS shop_productcategory_search_vector_trigger ON shop_productcategory;
+DROP FUNCTION IF EXISTS shop_productcategory_search_vector_update();
+DROP TRIGGER IF EXISTS shop_product_search_vector_trigger ON shop_product;
+DROP FUNCTION IF EXISTS shop_product_search_vector_update();
+"""
+
+
+def add_search_triggers(apps, schema_editor):
+    # tsvector, triggers and GIN only exist on PostgreSQL; SQLite gets an FTS5
+    # table from shop.search after migrate instead
+    if schema_editor.connection.vendor == 'postgresql':
+        schema_editor.execute(CREATE_TRIGGERS)
+        schema_editor.add_index(apps.get_model('shop', 'Product'), PRODUCT_SEARCH_INDEX)
+
+
+def remove_search_triggers(apps, schema_editor):
+    if schema_editor.connection.vendor == 'postgresql':
+        schema_editor.remove_index(apps.get_model('shop', 'Product'), PRODUCT_SEARCH_INDEX)
+        schema_editor.execute(DROP_TRIGGERS)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('shop', '0019_product_low_stock_alerted_product_reorder_level'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='product',
+            name='search_vector',
+            field=django.contrib.postgres.search.SearchVectorField(editable=False, null=True),
+        ),
+        migrations.RunPython(add_search_triggers, remove_search_triggers),
+    ]
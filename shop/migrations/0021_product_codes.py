@@ -0,0 +1,31 @@
+# Generated by Django 5.1.4 on 2026-10-18 18:12
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('shop', '0020_product_search'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='product',
+            name='barcode',
+            field=models.CharField(blank=True, default=None, max_length=64, null=True),
+        ),
+        migrations.AddField(
+            model_name='product',
+            name='sku',
+            field=models.CharField(blank=True, default=None, max_length=64, null=True),
+        ),
+        migrations.AddConstraint(
+            model_name='product',
+            constraint=models.UniqueConstraint(fields=('shop', 'sku'), name='shop_product_shop_sku_uniq'),
+        ),
+        migrations.AddConstraint(
+            model_name='product',
+            constraint=models.UniqueConstraint(fields=('shop', 'barcode'), name='shop_product_shop_barcode_uniq'),
+        ),
+    ]
@@ -0,0 +1,36 @@
+# Generated by Django 5.1.4 on 2026-10-18 18:12
+
+import django.db.models.deletion
+from django.db import migrations, models
+from django.db.models import Count
+
+
+def initialise_receipt_sequences(apps, schema_editor):
+    # Existing sales keep the receipt numbers already printed for them; the
+    # sequence continues the shop's count, and the "<shop>-" prefix of new
+    # numbers keeps them clear of the old 8 character random ones.
+    Sale = apps.get_model('shop', 'Sale')
+    ReceiptSequence = apps.get_model('shop', 'ReceiptSequence')
+    counts = Sale.objects.values('shop_id').annotate(total=Count('id')).values_list('shop_id', 'total').order_by()
+    ReceiptSequence.objects.bulk_create(
+        [ReceiptSequence(shop_id=shop_id, next_value=total + 1) for shop_id, total in counts],
+        batch_size=1000,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('shop', '0021_product_codes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ReceiptSequence',
+            fields=[
+                ('shop', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='receipt_sequence', serialize=False, to='shop.shop')),
+                ('next_value', models.PositiveBigIntegerField(default=1)),
+            ],
+        ),
+        migrations.RunPython(initialise_receipt_sequences, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,141 @@
+import hashlib
+
+from django.core.cache import cache
+from rest_framework import status
+from rest_framework.decorators import action
+from rest_framework.exceptions import ValidationError
+from rest_framework.response import Response
+
+from .cache import get_versions
+from .exports import ExportContentNegotiation, streaming_export
+from .fastpath import ValuesSerializer
+from .permissions import user_shop_ids
+from .renderers import CSVRenderer, NDJSONRenderer
+
+
+class CatalogCacheMixin:
+    """
+    Cache read responses per caller and per version of their shops' catalog.
+
+    Any Product or ProductCategory write, or stock change, bumps the shop's
+    version, so entries never have to be deleted. Responses carry an ETag and
+    a matching If-None-Match is answered with 304 without touching the catalog.
+    ETags only go out with a 200 for the same caller, URL and versions, so a
+    match can't stand in for a 404 or 403; `*` is not honoured for that reason.
+    """
+    catalog_cache_timeout = 300
+
+    def get_catalog_etag(self, request):
+        versions = get_versions('catalog', user_shop_ids(request))
+        raw = f'{self.basename}:{request.user.pk}:{request.build_absolute_uri()}:{versions}'
+        return hashlib.md5(raw.encode()).hexdigest()
+
+    def cached_response(self, request, render):
+        etag = self.get_catalog_etag(request)
+        quoted_etag = f'"{etag}"'
+
+        if_none_match = request.headers.get('If-None-Match', '')
+        if quoted_etag in [tag.strip() for tag in if_none_match.split(',')]:
+            return Response(status=status.HTTP_304_NOT_MODIFIED, headers={'ETag': quoted_etag})
+
+        key = f'catalog:response:{etag}'
+        data = cache.get(key)
+        if data is None:
+            response = render()
+            if response.status_code != status.HTTP_200_OK:
+                return response
+            data = response.data
+            cache.set(key, data, self.catalog_cache_timeout)
+        return Response(data, headers={'ETag': quoted_etag})
+
+
+class ExportMixin:
+    """
+    Adds an `export` action streaming the filtered queryset as ?format=csv
+    (default) or ?format=ndjson. `export_fields` maps output columns to
+    queryset lookups; rows are read with a server-side cursor.
+    """
+    export_fields = {}
+    export_chunk_size = 2000
+
+    @action(
+        detail=False, methods=['get'], renderer_classes=[CSVRenderer, NDJSONRenderer],
+        content_negotiation_class=ExportContentNegotiation,
+    )
+    def export(self, request, *args, **kwargs):
+        queryset = self.filter_queryset(self.get_queryset())
+        rows = queryset.order_by('pk').values_list(*self.export_fields.values()).iterator(
+            chunk_size=self.export_chunk_size
+        )
+        return streaming_export(list(self.export_fields), rows, request.accepted_renderer.format, self.basename)
+
+
+class ValuesListMixin:
+    """
+    Render list pages from .values() rows through a ValuesSerializer derived
+    from the viewset's serializer, falling back to the serializer when it has
+    fields the fast path cannot read.
+    """
+
+    def values_list_response(self, queryset):
+        fast = ValuesSerializer.for_serializer(self.get_serializer())
+        if fast is None or self.paginator is None:
+            page = self.paginate_queryset(queryset)
+            if page is None:
+                return Response(self.get_serializer(queryset, many=True).data)
+            return self.get_paginated_response(self.get_serializer(page, many=True).data)
+
+        # The cursor is built from the ordering fields of the last row
+        ordering = self.paginator.get_ordering(self.request, queryset, self)
+        page = self.paginate_queryset(fast.values(queryset, *(field.lstrip('-') for field in ordering)))
+        return self.get_paginated_response(fast.render(page))
+
+
+class SparseFieldsMixin:
+    """
+    Let list clients pick their columns with ?fields=id,name or leave some out
+    with ?omit=description. The list serializer keeps only the chosen fields,
+    so with ValuesListMixin the query selects only their columns (and joins).
+    """
+    fields_param = 'fields'
+    omit_param = 'omit'
+
+    def get_query_field_names(self, param):
+        names = []
+        for value in self.request.query_params.getlist(param):
+            names += [name.strip() for name in value.split(',') if name.strip()]
+        return names
+
+    def get_sparse_fields(self, available):
+        """
+        The names of `available` the client asked for, in their usual order.
+        Unknown names are a 400 rather than being silently ignored.
+        """
+        fields = self.get_query_field_names(self.fields_param)
+        omit = self.get_query_field_names(self.omit_param)
+        errors = {}
+        for param, names in ((self.fields_param, fields), (self.omit_param, omit)):
+            unknown = [name for name in dict.fromkeys(names) if name not in available]
+            if unknown:
+                errors[param] = [f"Unknown field {name}." for name in unknown]
+        if errors:
+            raise ValidationError(errors)
+
+        selected = [name for name in available if (not fields or name in fields) and name not in omit]
+        if not selected:
+            raise ValidationError({self.omit_param: ["At least one field must be left."]})
+        return selected
+
+    def get_serializer(self, *args, **kwargs):
+        serializer = super().get_serializer(*args, **kwargs)
+        if self.action != 'list':
+            return serializer
+
+        # many=True wraps the serializer whose fields are narrowed
+        fields = getattr(serializer, 'child', serializer).fields
+        readable = [name for name, field in fields.items() if not field.write_only]
+        selected = self.get_sparse_fields(readable)
+        for name in readable:
+            if name not in selected:
+                fields.pop(name)
+        return serializer
@@ -1,7 +1,16 @@
-from django.db import models
+from django.contrib.postgres.search import SearchVectorField
+from django.db import models, router, transaction
+from django.db.models import Case, F, Value, When
 from django.conf import settings
+from django.utils import timezone
 from django.core.validators import MinValueValidator
-from uuid import uuid4
+import bisect
+import threading
+from .signals import inventory_changed, bump_sales_on_commit
+
+class InsufficientInventory(ValueError):
+    """Raised when a sale item asks for more stock than the product has left."""
+
 
 class Shop(models.Model):
     name = models.CharField(max_length=255)
@@ -47,6 +56,12 @@ class Product(models.Model):
     inventory = models.PositiveIntegerField(
         default=0, validators=[MinValueValidator(0)]
     )
+    # The explicit default keeps the codes optional in serializers despite the unique constraints
+    sku = models.CharField(max_length=64, null=True, blank=True, default=None)
+    barcode = models.CharField(max_length=64, null=True, blank=True, default=None)
+    reorder_level = models.PositiveIntegerField(null=True, blank=True)
+    # Set once a low-stock notification went out, cleared when stock is back above reorder_level
+    low_stock_alerted = models.BooleanField(default=False, editable=False)
     category = models.ForeignKey(
         ProductCategory, on_delete=models.SET_NULL, null=True, blank=True
     )
@@ -55,13 +70,153 @@ class Product(models.Model):
     )
     added_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
+    # Name, description and category name; kept up to date by a database trigger (PostgreSQL)
+    search_vector = SearchVectorField(null=True, editable=False)
 
     def __str__(self):
         return self.name
 
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        instance.remember_stock()
+        return instance
+
+    def save(self, *args, **kwargs):
+        super().save(*args, **kwargs)
+        self.remember_stock()
+
+    def refresh_from_db(self, *args, **kwargs):
+        super().refresh_from_db(*args, **kwargs)
+        self.remember_stock()
+
+    def remember_stock(self):
+        # The stored inventory and reorder_level, unless either was deferred
+        if 'inventory' in self.__dict__ and 'reorder_level' in self.__dict__:
+            self._stored_stock = (self.inventory, self.reorder_level)
+
+    def stock_changed(self):
+        """
+        Whether inventory or reorder_level differ from the values last loaded or
+        saved; instances that weren't loaded from the database count as changed.
+        """
+        return getattr(self, '_stored_stock', None) != (self.inventory, self.reorder_level)
+
+    @property
+    def unit_cost(self):
+        # Profit is reported as price minus MRP; products without an MRP make no profit
+        return self.mrp if self.mrp is not None else self.price
+
+    @classmethod
+    def take_inventory(cls, product_id, quantity):
+        """
+        Atomically remove stock, returning False instead of overselling.
+        """
+        updated = cls.objects.filter(pk=product_id, inventory__gte=quantity).update(
+            inventory=F('inventory') - quantity
+        )
+        if updated:
+            inventory_changed.send(sender=cls, product_ids=[product_id])
+        return updated == 1
+
+    @classmethod
+    def restock(cls, product_id, quantity):
+        cls.objects.filter(pk=product_id).update(inventory=F('inventory') + quantity)
+        inventory_changed.send(sender=cls, product_ids=[product_id])
+
     class Meta:
         ordering = ['name']
         unique_together = ('name', 'shop')
+        indexes = [
+            models.Index(fields=['shop', 'inventory'], name='shop_product_shop_inv_idx'),
+            models.Index(fields=['shop', 'added_at'], name='shop_product_shop_added_idx'),
+        ]
+        # Also the indexes behind products/by-code/; NULL codes never collide
+        constraints = [
+            models.UniqueConstraint(fields=['shop', 'sku'], name='shop_product_shop_sku_uniq'),
+            models.UniqueConstraint(fields=['shop', 'barcode'], name='shop_product_shop_barcode_uniq'),
+        ]
+
+
+class ReceiptSequence(models.Model):
+    """
+    Per-shop receipt counter, handed out to each process in blocks.
+
+    A process reserves `block_size` numbers with one UPDATE inside the sale's
+    transaction and uses the first one; the rest of the block only becomes
+    available once that transaction commits, so a rolled back reservation is
+    never reused. Numbers are unique and, within a single-threaded worker,
+    increasing; blocks held by different workers interleave, and unused
+    numbers leave gaps.
+
+    Cached numbers are checked against the counter row before use; when the
+    counter was rewound below their block (a flushed or restored table), the
+    cached blocks are dropped and a fresh one is reserved. The check is kept on
+    purpose: what the blocks save is the UPDATE, whose row lock every sale of
+    the shop would otherwise hold until its transaction commits. The check is
+    a primary key read that takes no lock and never waits on one, and without
+    it a worker outliving a flush or restore hands out numbers other workers
+    reserve again, failing their checkouts on the unique receipt_number.
+    """
+    shop = models.OneToOneField(Shop, on_delete=models.CASCADE, primary_key=True, related_name='receipt_sequence')
+    next_value = models.PositiveBigIntegerField(default=1)
+
+    block_size = 20
+    # {(database alias, shop id): [(next value, end), ...]}
+    _blocks = {}
+    _lock = threading.Lock()
+
+    @classmethod
+    def reserve(cls, shop_id, count, using=None):
+        """
+        Reserve `count` consecutive numbers for a shop and return the first one.
+        """
+        sequences = cls.objects.using(using or router.db_for_write(cls))
+        with transaction.atomic(using=sequences.db):
+            if not sequences.filter(pk=shop_id).update(next_value=F('next_value') + count):
+                sequences.bulk_create([cls(shop_id=shop_id)], ignore_conflicts=True)
+                sequences.filter(pk=shop_id).update(next_value=F('next_value') + count)
+            return sequences.filter(pk=shop_id).values_list('next_value', flat=True).get() - count
+
+    @classmethod
+    def next_value_for(cls, shop_id):
+        using = router.db_for_write(cls)
+        key = (using, shop_id)
+        cached = None
+        with cls._lock:
+            blocks = cls._blocks.get(key)
+            if blocks:
+                value, end = cached = blocks[0]
+                if value + 1 < end:
+                    blocks[0] = (value + 1, end)
+                else:
+                    blocks.pop(0)
+
+        if cached is not None:
+            # Once reserved, a block stays below the counter unless the table was flushed or restored
+            if cls.objects.using(using).filter(pk=shop_id, next_value__gte=cached[1]).exists():
+                return cached[0]
+            with cls._lock:
+                cls._blocks.pop(key, None)
+
+        start = cls.reserve(shop_id, cls.block_size, using)
+        transaction.on_commit(lambda: cls._release_block(key, start + 1, start + cls.block_size), using=using)
+        return start
+
+    @classmethod
+    def _release_block(cls, key, start, end):
+        if start < end:
+            with cls._lock:
+                # Transactions may commit out of order; keep handing out the lowest block first
+                bisect.insort(cls._blocks.setdefault(key, []), (start, end))
+
+    @classmethod
+    def next_receipt_number(cls, shop_id):
+        # Zero padded so receipt numbers of a shop sort in allocation order
+        return f"{shop_id}-{cls.next_value_for(shop_id):08d}"
+
+    def __str__(self):
+        return f"Receipt sequence of {self.shop}"
 
 
 class Sale(models.Model):
@@ -70,54 +225,255 @@ class Sale(models.Model):
         Shop, on_delete=models.CASCADE, related_name='sales'
     )
     sale_date = models.DateTimeField(auto_now_add=True)
+    total_amount = models.DecimalField(max_digits=12, decimal_places=2, default=0, db_index=True, editable=False)
+    total_cost = models.DecimalField(max_digits=12, decimal_places=2, default=0, editable=False)
+    item_count = models.PositiveIntegerField(default=0, editable=False)
 
     def save(self, *args, **kwargs):
         if not self.receipt_number:
-            self.receipt_number = str(uuid4())[:8]
+            self.receipt_number = ReceiptSequence.next_receipt_number(self.shop_id)
         super().save(*args, **kwargs)
 
+    @property
+    def total_profit(self):
+        return self.total_amount - self.total_cost
+
+    @classmethod
+    def adjust_totals(cls, sale_id, amount, cost, count):
+        """
+        Apply an item delta to the stored totals of a sale in a single UPDATE.
+        """
+        cls.objects.filter(pk=sale_id).update(
+            total_amount=F('total_amount') + amount,
+            total_cost=F('total_cost') + cost,
+            item_count=F('item_count') + count,
+        )
+
     def __str__(self):
         return f"Sale #{self.receipt_number}"
 
     class Meta:
         ordering = ['-sale_date']
+        indexes = [
+            models.Index(fields=['shop', '-sale_date'], name='shop_sale_shop_date_idx'),
+        ]
 
 
 class SaleItem(models.Model):
     sale = models.ForeignKey(Sale, on_delete=models.CASCADE, related_name='items')
     product = models.ForeignKey(Product, on_delete=models.PROTECT)
     quantity = models.PositiveIntegerField(validators=[MinValueValidator(1)])
+    # Prices at the time of sale, so reports don't drift when the product changes
+    unit_price = models.DecimalField(max_digits=10, decimal_places=2, null=True, editable=False)
+    unit_mrp = models.DecimalField(max_digits=10, decimal_places=2, null=True, editable=False)
 
     def save(self, *args, **kwargs):
-        is_new = self._state.adding
+        with transaction.atomic():
+            original = None
+            if not self._state.adding:
+                original = SaleItem.objects.select_for_update().select_related('product').get(pk=self.pk)
 
+            if original is None or original.product_id != self.product_id or self.unit_price is None:
+                self.capture_prices()
 
-        if not is_new:
-            original = SaleItem.objects.get(pk=self.pk)
-            inventory_adjustment = self.quantity - original.quantity
-        else:
-            inventory_adjustment = self.quantity
+            if original is not None and original.product_id == self.product_id:
+                inventory_adjustment = self.quantity - original.quantity
+            else:
+                if original is not None:
+                    Product.restock(original.product_id, original.quantity)
+                    original.record_movement(original.quantity, InventoryMovement.RETURN)
+                inventory_adjustment = self.quantity
 
-        if self.product.inventory < inventory_adjustment:
-            raise ValueError(f"Not enough inventory for product {self.product.name}.")
+            # Stock is only checked and changed by the conditional UPDATE itself
+            if inventory_adjustment > 0:
+                if not Product.take_inventory(self.product_id, inventory_adjustment):
+                    raise InsufficientInventory(f"Not enough inventory for product {self.product.name}.")
+                self.record_movement(-inventory_adjustment, InventoryMovement.SALE)
+            if inventory_adjustment < 0:
+                Product.restock(self.product_id, -inventory_adjustment)
+                self.record_movement(-inventory_adjustment, InventoryMovement.RETURN)
 
-        # Adjust the product's inventory
-        self.product.inventory -= inventory_adjustment
-        self.product.save()
+            amount, cost, count = self.totals()
+            if original is None:
+                Sale.adjust_totals(self.sale_id, amount, cost, count)
+                self.record_daily_sales(amount, cost, count)
+            else:
+                if original.unit_price is None:
+                    original.capture_prices()
+                original_amount, original_cost, original_count = original.totals()
 
-        super().save(*args, **kwargs)
+                if original.sale_id == self.sale_id:
+                    Sale.adjust_totals(
+                        self.sale_id, amount - original_amount, cost - original_cost, count - original_count
+                    )
+                else:
+                    Sale.adjust_totals(original.sale_id, -original_amount, -original_cost, -original_count)
+                    Sale.adjust_totals(self.sale_id, amount, cost, count)
+
+                if original.sale_id == self.sale_id and original.product_id == self.product_id:
+                    self.record_daily_sales(amount - original_amount, cost - original_cost, count - original_count)
+                else:
+                    original.record_daily_sales(-original_amount, -original_cost, -original_count)
+                    self.record_daily_sales(amount, cost, count)
+
+            super().save(*args, **kwargs)
 
     def delete(self, *args, **kwargs):
-        self.product.inventory += self.quantity
-        self.product.save()
-        super().delete(*args, **kwargs)
+        with transaction.atomic():
+            # Undo what the stored row did, not this instance, and only once if
+            # the same item is deleted concurrently
+            original = SaleItem.objects.select_for_update().select_related('product', 'sale').filter(
+                pk=self.pk
+            ).first()
+            if original is None:
+                return 0, {}
+
+            Product.restock(original.product_id, original.quantity)
+            original.record_movement(original.quantity, InventoryMovement.RETURN)
+            if original.unit_price is None:
+                original.capture_prices()
+            amount, cost, count = original.totals()
+            Sale.adjust_totals(original.sale_id, -amount, -cost, -count)
+            original.record_daily_sales(-amount, -cost, -count)
+            return super().delete(*args, **kwargs)
+
+    def capture_prices(self):
+        self.unit_price = self.product.price
+        self.unit_mrp = self.product.mrp
 
     @property
-    def unit_price(self):
-        return self.product.price
+    def unit_cost(self):
+        return self.unit_mrp if self.unit_mrp is not None else self.unit_price
+
+    def totals(self):
+        """
+        Return this line's contribution to the sale as (amount, cost, item count).
+        """
+        return self.quantity * self.unit_price, self.quantity * self.unit_cost, self.quantity
+
+    def record_movement(self, quantity, kind):
+        InventoryMovement.objects.create(
+            shop_id=self.product.shop_id, product_id=self.product_id, kind=kind, quantity=quantity
+        )
+
+    def record_daily_sales(self, amount, cost, count):
+        sale = self.sale
+        DailyProductSales.record(
+            sale.shop_id, timezone.localdate(sale.sale_date), {self.product_id: (count, amount, cost)}
+        )
 
     def __str__(self):
         return f"{self.product.name} - {self.quantity} x {self.unit_price}"
 
     class Meta:
         unique_together = ('sale', 'product')
+        indexes = [
+            # Covers per-product reports without touching the table on PostgreSQL
+            models.Index(
+                fields=['product', 'sale'], include=['quantity', 'unit_price'], name='shop_saleitem_prod_sale_idx'
+            ),
+        ]
+
+
+class DailyProductSales(models.Model):
+    """
+    Per-day sales rollup of a product, kept in step with every SaleItem write.
+    """
+    shop = models.ForeignKey(Shop, on_delete=models.CASCADE, related_name='daily_sales')
+    product = models.ForeignKey(Product, on_delete=models.CASCADE, related_name='daily_sales')
+    day = models.DateField()
+    quantity = models.PositiveIntegerField(default=0)
+    revenue = models.DecimalField(max_digits=12, decimal_places=2, default=0)
+    cost = models.DecimalField(max_digits=12, decimal_places=2, default=0)
+
+    @classmethod
+    def record(cls, shop_id, day, lines):
+        """
+        Add {product_id: (quantity, revenue, cost)} deltas to one shop's day.
+
+        Missing rows are inserted first so that the increments are a single
+        UPDATE, no matter how many products the lines cover.
+        """
+        if not lines:
+            return
+        cls.objects.bulk_create(
+            [cls(shop_id=shop_id, product_id=product_id, day=day) for product_id in lines],
+            ignore_conflicts=True,
+        )
+
+        def delta(position, output_field):
+            return Case(
+                *[When(product_id=product_id, then=Value(line[position])) for product_id, line in lines.items()],
+                default=Value(0),
+                output_field=output_field,
+            )
+
+        cls.objects.filter(shop_id=shop_id, day=day, product_id__in=lines).update(
+            quantity=F('quantity') + delta(0, models.IntegerField()),
+            revenue=F('revenue') + delta(1, models.DecimalField(max_digits=12, decimal_places=2)),
+            cost=F('cost') + delta(2, models.DecimalField(max_digits=12, decimal_places=2)),
+        )
+        bump_sales_on_commit([shop_id])
+
+    def __str__(self):
+        return f"{self.product} on {self.day}"
+
+    class Meta:
+        ordering = ['-day']
+        unique_together = ('shop', 'product', 'day')
+        indexes = [
+            models.Index(fields=['shop', 'day'], name='shop_dailysales_shop_day_idx'),
+        ]
+
+
+class InventoryMovement(models.Model):
+    """
+    Append-only ledger of stock changes; quantity is signed.
+    """
+    SALE = 'sale'
+    RETURN = 'return'
+    ADJUSTMENT = 'adjustment'
+    IMPORT = 'import'
+    KIND_CHOICES = [
+        (SALE, 'Sale'),
+        (RETURN, 'Return'),
+        (ADJUSTMENT, 'Adjustment'),
+        (IMPORT, 'Import'),
+    ]
+
+    shop = models.ForeignKey(Shop, on_delete=models.CASCADE, related_name='inventory_movements')
+    product = models.ForeignKey(Product, on_delete=models.CASCADE, related_name='inventory_movements')
+    kind = models.CharField(max_length=20, choices=KIND_CHOICES)
+    quantity = models.IntegerField()
+    reason = models.CharField(max_length=255, blank=True)
+    user = models.ForeignKey(
+        settings.AUTH_USER_MODEL, on_delete=models.SET_NULL, null=True, blank=True, related_name='inventory_movements'
+    )
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return f"{self.product} {self.quantity:+d} ({self.kind})"
+
+    class Meta:
+        ordering = ['-created_at']
+        indexes = [
+            models.Index(fields=['product', 'created_at'], name='shop_invmove_prod_created_idx'),
+        ]
+
+
+class InventorySnapshot(models.Model):
+    """
+    Stock of a product at the end of a day on which it moved, compacted from
+    the ledger so point-in-time queries only scan movements after it.
+    """
+    shop = models.ForeignKey(Shop, on_delete=models.CASCADE, related_name='inventory_snapshots')
+    product = models.ForeignKey(Product, on_delete=models.CASCADE, related_name='inventory_snapshots')
+    day = models.DateField()
+    quantity = models.IntegerField()
+
+    def __str__(self):
+        return f"{self.product} on {self.day}: {self.quantity}"
+
+    class Meta:
+        ordering = ['-day']
+        unique_together = ('product', 'day')
@@ -0,0 +1,43 @@
+from rest_framework.pagination import CursorPagination
+
+
+class KeysetPagination(CursorPagination):
+    """
+    Cursor pagination over a (key, id) ordering, with no COUNT(*).
+
+    DRF's CursorPagination only keys on the first ordering field: the cursor
+    holds its value and a page starts at WHERE key > value, so deep pages cost
+    about what the first does and rows inserted before the cursor don't shift
+    the pages a client hasn't read yet. Rows sharing that value are stepped
+    over with an OFFSET counted inside the tie, so (sale_date, id) and
+    (name, id) are not true keysets: a long run of equal keys is scanned, and
+    an insert into the tie a client is paging through can repeat or skip one
+    of its rows. Sale dates carry microseconds and product names are unique
+    per shop, which keeps such ties rare and short; sale items page on id alone.
+    """
+    page_size = 50
+    page_size_query_param = 'page_size'
+    max_page_size = 500
+
+
+class SaleCursorPagination(KeysetPagination):
+    ordering = ('-sale_date', '-id')
+
+
+class SaleItemCursorPagination(KeysetPagination):
+    ordering = ('-id',)
+
+
+class ProductCursorPagination(KeysetPagination):
+    """
+    Products page by name by default, or by last update with ?ordering=updated
+    for clients syncing changes.
+    """
+    ordering = ('name', 'id')
+    orderings = {
+        'name': ('name', 'id'),
+        'updated': ('-updated_at', '-id'),
+    }
+
+    def get_ordering(self, request, queryset, view):
+        return self.orderings.get(request.query_params.get('ordering'), self.ordering)
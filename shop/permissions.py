@@ -1,4 +1,24 @@
 from rest_framework.permissions import BasePermission
+from .models import Shop
+
+
+def user_shop_ids(request):
+    """
+    Ids of the shops owned by the authenticated user.
+
+    Resolved with one query per request and cached on the underlying
+    HttpRequest, so serializers, viewsets and permissions all share it.
+    """
+    user = request.user
+    if not user.is_authenticated:
+        return frozenset()
+    http_request = getattr(request, '_request', request)
+    cached = getattr(http_request, '_user_shop_ids', None)
+    if cached is None or cached[0] != user.pk:
+        cached = (user.pk, frozenset(Shop.objects.filter(owner=user).order_by().values_list('pk', flat=True)))
+        http_request._user_shop_ids = cached
+    return cached[1]
+
 
 class IsShopOwner(BasePermission):
     """
@@ -7,8 +27,11 @@ class IsShopOwner(BasePermission):
 
     def has_object_permission(self, request, view, obj):
 
-        if hasattr(obj, 'shop'):
-            return obj.shop.owner == request.user
-        elif hasattr(obj, 'owner'):
-            return obj.owner == request.user
+        # Membership in the request's shop set, so no related rows are loaded
+        if hasattr(obj, 'shop_id'):
+            return obj.shop_id in user_shop_ids(request)
+        elif hasattr(obj, 'owner_id'):
+            return obj.owner_id == request.user.pk
+        elif hasattr(obj, 'sale_id'):
+            return obj.sale.shop_id in user_shop_ids(request)
         return False
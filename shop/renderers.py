@@ -0,0 +1,95 @@
+from rest_framework.renderers import BaseRenderer, JSONRenderer
+from rest_framework.utils.encoders import JSONEncoder
+
+try:
+    import orjson
+except ImportError:  # optional speedup
+    orjson = None
+
+
+# Types that can be neither floats nor containers
+_SCALARS = frozenset({str, int, bool, type(None)})
+
+
+class CSVRenderer(BaseRenderer):
+    """
+    Content negotiation target for ?format=csv; export views stream their own body.
+    """
+    media_type = 'text/csv'
+    format = 'csv'
+    charset = 'utf-8'
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        return data
+
+
+class NDJSONRenderer(BaseRenderer):
+    """
+    Content negotiation target for ?format=ndjson; export views stream their own body.
+    """
+    media_type = 'application/x-ndjson'
+    format = 'ndjson'
+    charset = 'utf-8'
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        return data
+
+
+def contains_float(data):
+    """
+    Whether a float occurs anywhere in lists, tuples and dicts (keys included).
+
+    Item types are collected per container with map(), so rows of plain
+    values are checked without a Python-level step per value.
+    """
+    stack = [data]
+    while stack:
+        value = stack.pop()
+        items = [*value, *value.values()] if isinstance(value, dict) else value
+        types = set(map(type, items))
+        if float in types:
+            return True
+        for kind in types - _SCALARS:
+            if issubclass(kind, float):
+                return True
+            if issubclass(kind, (dict, list, tuple)):
+                stack.extend(item for item in items if type(item) is kind)
+    return False
+
+
+class ORJSONRenderer(JSONRenderer):
+    """
+    JSONRenderer output produced with orjson when it is installed.
+
+    Anything orjson has no native form for, datetimes and raw Decimals
+    included, goes through DRF's own encoder, so responses are byte for byte
+    what JSONRenderer would send. Floats are formatted differently by orjson
+    (1.5e+300 vs 1.5e300, NaN as null), so data containing any is left to
+    JSONRenderer, as are indented and ASCII-only output and values orjson
+    rejects.
+    """
+    encoder = JSONEncoder()
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if orjson is None or data is None or self.ensure_ascii or not self.compact:
+            return super().render(data, accepted_media_type, renderer_context)
+        if self.get_indent(accepted_media_type, renderer_context or {}) is not None:
+            return super().render(data, accepted_media_type, renderer_context)
+        if isinstance(data, (dict, list, tuple)) and contains_float(data):
+            return super().render(data, accepted_media_type, renderer_context)
+        try:
+            ret = orjson.dumps(
+                data, default=self.default,
+                option=orjson.OPT_PASSTHROUGH_DATETIME | orjson.OPT_NON_STR_KEYS,
+            )
+        except orjson.JSONEncodeError:
+            return super().render(data, accepted_media_type, renderer_context)
+        # Same strict javascript subset as JSONRenderer
+        return ret.replace('\u2028'.encode(), b'\\u2028').replace('\u2029'.encode(), b'\\u2029')
+
+    def default(self, obj):
+        value = self.encoder.default(obj)
+        # e.g. a raw Decimal or a queryset of floats; raising hands the whole response to JSONRenderer
+        if contains_float([value]):
+            raise TypeError(f"{type(obj).__name__} contains floats")
+        return value
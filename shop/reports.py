@@ -0,0 +1,313 @@
+from datetime import datetime, time, timedelta
+
+from django.db.models import Count, F, Q, Sum
+from django.db.models.functions import Coalesce, Trunc, TruncDate
+from django.utils import timezone
+from django.utils.dateparse import parse_date, parse_datetime
+
+from .models import Product, ProductCategory, Sale, SaleItem, DailyProductSales, InventoryMovement, InventorySnapshot
+
+INTERVALS = ('hour', 'day', 'week', 'month')
+BREAKDOWNS = ('shop', 'category')
+RANKINGS = ('quantity', 'revenue', 'profit')
+
+
+def parse_bound(value):
+    """
+    Parse a start_date/end_date query parameter into an aware datetime.
+    Plain dates mean midnight, as they do for the queryset filters.
+    """
+    if not value:
+        return None
+    parsed = parse_datetime(value)
+    if parsed is None:
+        day = parse_date(value)
+        if day is None:
+            raise ValueError(f"Invalid date: {value}")
+        parsed = datetime.combine(day, time.min)
+    if timezone.is_naive(parsed):
+        parsed = timezone.make_aware(parsed)
+    return parsed
+
+
+def parse_ids(values):
+    """
+    Parse ids given as repeated parameters and/or comma separated lists.
+    """
+    ids = set()
+    for value in values:
+        for part in value.split(','):
+            if part.strip():
+                ids.add(int(part))
+    return ids
+
+
+def _midnight(day):
+    return timezone.make_aware(datetime.combine(day, time.min))
+
+
+def whole_days(start=None, end=None):
+    """
+    Split [start, end] into the whole days a daily rollup can answer and the
+    partial edges that still have to be read from raw rows.
+
+    Returns (first_day, last_day, edges): the day bounds are None on an open
+    side, and edges is a list of (from, to_exclusive, to_inclusive) ranges.
+    When the range contains no whole day, first_day is greater than last_day
+    and the single edge is the whole range.
+    """
+    first_day = last_day = None
+    edges = []
+
+    if start is not None:
+        local_start = timezone.localtime(start)
+        first_day = local_start.date()
+        if local_start.time() != time.min:
+            first_day += timedelta(days=1)
+    if end is not None:
+        last_day = timezone.localtime(end).date() - timedelta(days=1)
+
+    if first_day is not None and last_day is not None and first_day > last_day:
+        return first_day, last_day, [(start, None, end)]
+
+    if start is not None and _midnight(first_day) != start:
+        edges.append((start, _midnight(first_day), None))
+    if end is not None:
+        edges.append((_midnight(last_day + timedelta(days=1)), None, end))
+    return first_day, last_day, edges
+
+
+def _edge_filter(edges):
+    condition = Q()
+    for start, end_exclusive, end_inclusive in edges:
+        edge = Q()
+        if start is not None:
+            edge &= Q(sale__sale_date__gte=start)
+        if end_exclusive is not None:
+            edge &= Q(sale__sale_date__lt=end_exclusive)
+        if end_inclusive is not None:
+            edge &= Q(sale__sale_date__lte=end_inclusive)
+        condition |= edge
+    return condition
+
+
+def product_sales_querysets(items, rollups, start=None, end=None):
+    """
+    The querysets whose rows add up to the per-product sales between start and end.
+
+    `items` and `rollups` are the SaleItem and DailyProductSales querysets
+    already narrowed to the products of interest. Whole days are read from the
+    rollup; raw SaleItem rows are only scanned for partial days at the edges.
+    """
+    first_day, last_day, edges = whole_days(start, end)
+    querysets = []
+
+    if first_day is None or last_day is None or first_day <= last_day:
+        if first_day is not None:
+            rollups = rollups.filter(day__gte=first_day)
+        if last_day is not None:
+            rollups = rollups.filter(day__lte=last_day)
+        querysets.append(rollups.values('product_id').annotate(
+            total_quantity_sold=Sum('quantity'),
+            total_sales_value=Sum('revenue'),
+        ).order_by())
+
+    if edges:
+        querysets.append(items.filter(_edge_filter(edges)).values('product_id').annotate(
+            total_quantity_sold=Sum('quantity'),
+            total_sales_value=Sum(F('quantity') * F('unit_price')),
+        ).order_by())
+
+    return querysets
+
+
+def merge_sales_totals(rows):
+    """
+    Add up rows of product_sales_querysets into one entry per product, sorted by product.
+    """
+    totals = {}
+    for row in rows:
+        entry = totals.setdefault(
+            row['product_id'],
+            {'product_id': row['product_id'], 'total_quantity_sold': 0, 'total_sales_value': 0},
+        )
+        entry['total_quantity_sold'] += row['total_quantity_sold'] or 0
+        entry['total_sales_value'] += row['total_sales_value'] or 0
+    return [totals[product_id] for product_id in sorted(totals)]
+
+
+def product_sales_totals(items, rollups, start=None, end=None):
+    """
+    Total quantity sold and sales value per product between start and end.
+    """
+    return merge_sales_totals(
+        row for queryset in product_sales_querysets(items, rollups, start, end) for row in queryset
+    )
+
+
+def stock_at(product, moment):
+    """
+    Stock of a product just before `moment`.
+
+    Starts from the latest InventorySnapshot ending before that day and adds
+    the movements since; without a snapshot, the movements after `moment` are
+    taken back off the current stock. Either way only a bounded slice of the
+    (product, created_at) index is read.
+    """
+    movements = InventoryMovement.objects.filter(product=product)
+    snapshot = InventorySnapshot.objects.filter(
+        product=product, day__lt=timezone.localdate(moment)
+    ).order_by('-day').first()
+
+    if snapshot is not None:
+        delta = movements.filter(
+            created_at__gte=_midnight(snapshot.day + timedelta(days=1)), created_at__lt=moment
+        ).aggregate(total=Sum('quantity'))['total'] or 0
+        return snapshot.quantity + delta
+
+    later = movements.filter(created_at__gte=moment).aggregate(total=Sum('quantity'))['total'] or 0
+    return product.inventory - later
+
+
+def daily_stock(product, first_day, last_day):
+    """
+    Closing stock of a product for each day from first_day to last_day, walked
+    back from the last day's close with one grouped query over the movements.
+    """
+    closing = stock_at(product, _midnight(last_day + timedelta(days=1)))
+    deltas = dict(
+        InventoryMovement.objects.filter(
+            product=product,
+            created_at__gte=_midnight(first_day + timedelta(days=1)),
+            created_at__lt=_midnight(last_day + timedelta(days=1)),
+        ).annotate(day=TruncDate('created_at')).values('day').annotate(
+            total=Sum('quantity')
+        ).values_list('day', 'total').order_by()
+    )
+
+    history = []
+    day = last_day
+    while day >= first_day:
+        history.append((day, closing))
+        closing -= deltas.get(day, 0)
+        day -= timedelta(days=1)
+    history.reverse()
+    return history
+
+
+def sales_series(shop_ids, interval='day', group_by=None, start=None, end=None):
+    """
+    Revenue, profit, items and receipts per time bucket, grouped in the database.
+
+    Without a category breakdown only the totals kept on Sale are read, so a
+    year of daily buckets is one grouped query over the (shop, sale_date)
+    index. The category breakdown has to go through SaleItem; profit there is
+    quantity * (unit price - MRP), the same as the Sale totals.
+    """
+    if group_by == 'category':
+        queryset = SaleItem.objects.filter(sale__shop_id__in=shop_ids)
+        date_field = 'sale__sale_date'
+        fields = ()
+        keys = {'category_id': F('product__category_id'), 'category_name': F('product__category__name')}
+        metrics = {
+            'revenue': Sum(F('quantity') * F('unit_price')),
+            'profit': Sum(F('quantity') * (F('unit_price') - Coalesce('unit_mrp', 'unit_price'))),
+            'items': Sum('quantity'),
+            'receipts': Count('sale_id', distinct=True),
+        }
+    else:
+        queryset = Sale.objects.filter(shop_id__in=shop_ids)
+        date_field = 'sale_date'
+        fields = ('shop_id',) if group_by == 'shop' else ()
+        keys = {}
+        metrics = {
+            'revenue': Sum('total_amount'),
+            'profit': Sum(F('total_amount') - F('total_cost')),
+            'items': Sum('item_count'),
+            'receipts': Count('id'),
+        }
+
+    if start is not None:
+        queryset = queryset.filter(**{f'{date_field}__gte': start})
+    if end is not None:
+        queryset = queryset.filter(**{f'{date_field}__lte': end})
+
+    return list(
+        queryset.values(*fields, period=Trunc(date_field, interval), **keys)
+        .annotate(**metrics)
+        .order_by('period', *fields, *keys)
+    )
+
+
+def _ranked(queryset, by, metrics):
+    if by == 'category':
+        queryset = queryset.values(category_id=F('product__category_id'))
+    else:
+        queryset = queryset.values('product_id')
+    return queryset.annotate(**metrics)
+
+
+def top_sellers(shop_ids, metric='quantity', limit=10, start=None, end=None, category=None, by='product'):
+    """
+    The `limit` best selling products (or categories, with by='category') by
+    total quantity, revenue or profit between start and end.
+
+    Whole days are ranked from the DailyProductSales rollup with ORDER BY ...
+    LIMIT, so the database never returns more than a page of rows. Partial days
+    at the edges are grouped from SaleItem and merged in: the rollup page is
+    widened by one row per product touched at the edges and those products are
+    re-read in full, which keeps the ranking exact.
+    """
+    key = 'category_id' if by == 'category' else 'product_id'
+    total = f'total_{metric}'
+    first_day, last_day, edges = whole_days(start, end)
+
+    rollups = DailyProductSales.objects.filter(shop_id__in=shop_ids)
+    items = SaleItem.objects.filter(sale__shop_id__in=shop_ids)
+    if category is not None:
+        rollups = rollups.filter(product__category_id=category)
+        items = items.filter(product__category_id=category)
+
+    rollup_metrics = {
+        'total_quantity': Sum('quantity'),
+        'total_revenue': Sum('revenue'),
+        'total_profit': Sum(F('revenue') - F('cost')),
+    }
+    item_metrics = {
+        'total_quantity': Sum('quantity'),
+        'total_revenue': Sum(F('quantity') * F('unit_price')),
+        'total_profit': Sum(F('quantity') * (F('unit_price') - Coalesce('unit_mrp', 'unit_price'))),
+    }
+
+    edge_rows = {}
+    if edges:
+        edge_rows = {row[key]: row for row in _ranked(items.filter(_edge_filter(edges)), by, item_metrics).order_by()}
+
+    rows = {}
+    if first_day is None or last_day is None or first_day <= last_day:
+        if first_day is not None:
+            rollups = rollups.filter(day__gte=first_day)
+        if last_day is not None:
+            rollups = rollups.filter(day__lte=last_day)
+        page = _ranked(rollups, by, rollup_metrics).order_by(f'-{total}', key)[:limit + len(edge_rows)]
+        rows = {row[key]: row for row in page}
+
+        missing = [value for value in edge_rows if value not in rows]
+        if missing:
+            lookup = Q(**{'product__category_id__in' if by == 'category' else 'product_id__in': missing})
+            if None in missing:
+                lookup |= Q(product__category__isnull=True)
+            rows.update((row[key], row) for row in _ranked(rollups.filter(lookup), by, rollup_metrics).order_by())
+
+    for value, edge in edge_rows.items():
+        row = rows.setdefault(value, {key: value, 'total_quantity': 0, 'total_revenue': 0, 'total_profit': 0})
+        for name in item_metrics:
+            row[name] = (row[name] or 0) + (edge[name] or 0)
+
+    ranked = sorted(rows.values(), key=lambda row: (-(row[total] or 0), row[key] is None, row[key] or 0))[:limit]
+
+    model = ProductCategory if by == 'category' else Product
+    names = dict(model.objects.filter(pk__in=[row[key] for row in ranked]).values_list('pk', 'name'))
+    for row in ranked:
+        row['name'] = names.get(row[key])
+    return ranked
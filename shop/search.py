@@ -0,0 +1,135 @@
+"""
+Ranked product search over name, description and category name.
+
+On PostgreSQL the trigger-maintained Product.search_vector is matched with
+prefix terms (POS type-ahead) and names within trigram distance catch typos;
+both are GIN indexed. SQLite, used for local runs, keeps an FTS5 table in step
+with shop_product through triggers installed after migrate. Any other backend
+falls back to an unranked name match.
+"""
+import re
+
+from django.contrib.postgres.search import SearchQuery, SearchRank, TrigramSimilarity
+from django.db import DatabaseError, connections
+from django.db.models import F, Q
+from django.db.models.functions import Upper
+
+from .models import Product
+
+MAX_TERMS = 8
+
+SQLITE_FTS_TABLE = 'shop_product_fts'
+
+SQLITE_FTS_SCHEMA = [
+    f"""CREATE VIRTUAL TABLE IF NOT EXISTS {SQLITE_FTS_TABLE}
+        USING fts5(name, description, category, prefix='2 3')""",
+    f"""CREATE TRIGGER IF NOT EXISTS shop_product_fts_insert AFTER INSERT ON shop_product BEGIN
+        INSERT INTO {SQLITE_FTS_TABLE}(rowid, name, description, category)
+        VALUES (new.id, new.name, coalesce(new.description, ''),
+                coalesce((SELECT name FROM shop_productcategory WHERE id = new.category_id), ''));
+    END""",
+    f"""CREATE TRIGGER IF NOT EXISTS shop_product_fts_update
+        AFTER UPDATE OF name, description, category_id ON shop_product BEGIN
+        DELETE FROM {SQLITE_FTS_TABLE} WHERE rowid = old.id;
+        INSERT INTO {SQLITE_FTS_TABLE}(rowid, name, description, category)
+        VALUES (new.id, new.name, coalesce(new.description, ''),
+                coalesce((SELECT name FROM shop_productcategory WHERE id = new.category_id), ''));
+    END""",
+    f"""CREATE TRIGGER IF NOT EXISTS shop_product_fts_delete AFTER DELETE ON shop_product BEGIN
+        DELETE FROM {SQLITE_FTS_TABLE} WHERE rowid = old.id;
+    END""",
+    f"""CREATE TRIGGER IF NOT EXISTS shop_productcategory_fts_update
+        AFTER UPDATE OF name ON shop_productcategory BEGIN
+        UPDATE {SQLITE_FTS_TABLE} SET category = new.name
+        WHERE rowid IN (SELECT id FROM shop_product WHERE category_id = new.id);
+    END""",
+]
+
+SQLITE_FTS_TRIGGERS = (
+    'shop_product_fts_insert', 'shop_product_fts_update', 'shop_product_fts_delete',
+    'shop_productcategory_fts_update',
+)
+
+
+def search_terms(text):
+    return re.findall(r'\w+', text.lower())[:MAX_TERMS]
+
+
+def search_products(shop_ids, text, limit=20):
+    """
+    Up to `limit` products of the given shops matching `text`, best match first.
+    """
+    terms = search_terms(text)
+    if not terms:
+        return []
+
+    products = Product.objects.filter(shop_id__in=shop_ids).select_related('category').defer('search_vector')
+    vendor = connections[products.db].vendor
+    if vendor == 'postgresql':
+        return _search_postgresql(products, terms, limit)
+    if vendor == 'sqlite':
+        try:
+            return _search_sqlite(products, list(shop_ids), terms, limit)
+        except DatabaseError:
+            # FTS5 missing from this SQLite build, or the table is not installed yet
+            pass
+    return list(products.filter(name__icontains=' '.join(terms)).order_by('name', 'id')[:limit])
+
+
+def _search_postgresql(products, terms, limit):
+    query = SearchQuery(' & '.join(f'{term}:*' for term in terms), search_type='raw', config='simple')
+    # Compared in upper case so that shop_product_name_trgm_idx on UPPER(name) is used
+    name = ' '.join(terms).upper()
+    return list(
+        products.alias(name_upper=Upper('name'))
+        .filter(Q(search_vector=query) | Q(name_upper__trigram_similar=name))
+        .annotate(rank=SearchRank(F('search_vector'), query) + TrigramSimilarity(Upper('name'), name))
+        .order_by('-rank', 'name', 'id')[:limit]
+    )
+
+
+def _search_sqlite(products, shop_ids, terms, limit):
+    match = ' '.join(f'"{term}"*' for term in terms)
+    with connections[products.db].cursor() as cursor:
+        cursor.execute(
+            f"""SELECT shop_product.id FROM {SQLITE_FTS_TABLE}
+                JOIN shop_product ON shop_product.id = {SQLITE_FTS_TABLE}.rowid
+                WHERE {SQLITE_FTS_TABLE} MATCH %s AND shop_product.shop_id IN ({', '.join(['%s'] * len(shop_ids))})
+                ORDER BY bm25({SQLITE_FTS_TABLE}, 10.0, 4.0, 1.0) LIMIT %s""",
+            [match, *shop_ids, limit],
+        )
+        ids = [row[0] for row in cursor.fetchall()]
+    found = products.in_bulk(ids)
+    return [found[pk] for pk in ids if pk in found]
+
+
+def install_sqlite_search(sender, using, **kwargs):
+    """
+    post_migrate hook: create the FTS5 table and its triggers on SQLite.
+
+    Table rebuilds during SQLite migrations drop the triggers on shop_product,
+    so this runs after every migrate and refills the index whenever one of
+    them had to be recreated.
+    """
+    connection = connections[using]
+    if connection.vendor != 'sqlite' or 'shop_product' not in connection.introspection.table_names():
+        return
+
+    with connection.cursor() as cursor:
+        cursor.execute(
+            "SELECT name FROM sqlite_master WHERE type = 'trigger' AND name IN (%s, %s, %s, %s)",
+            SQLITE_FTS_TRIGGERS,
+        )
+        if len(cursor.fetchall()) == len(SQLITE_FTS_TRIGGERS):
+            return
+        try:
+            for statement in SQLITE_FTS_SCHEMA:
+                cursor.execute(statement)
+        except DatabaseError:
+            return
+        cursor.execute(f"DELETE FROM {SQLITE_FTS_TABLE}")
+        cursor.execute(
+            f"""INSERT INTO {SQLITE_FTS_TABLE}(rowid, name, description, category)
+                SELECT p.id, p.name, coalesce(p.description, ''), coalesce(c.name, '')
+                FROM shop_product p LEFT JOIN shop_productcategory c ON c.id = p.category_id"""
+        )
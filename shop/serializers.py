@@ -1,6 +1,13 @@
 from rest_framework import serializers
-from .models import Shop, Product, ProductCategory, Sale, SaleItem
+from .models import Shop, Product, ProductCategory, Sale, SaleItem, DailyProductSales, InventoryMovement, \
+    InsufficientInventory
 from django.conf import settings
+from decimal import Decimal
+from django.db import transaction
+from django.db.models import Case, When, F, Value, IntegerField
+from django.utils import timezone
+from .permissions import user_shop_ids
+from .signals import inventory_changed
 
 
 class ShopSerializer(serializers.ModelSerializer):
@@ -26,9 +33,9 @@ class ProductCategorySerializer(serializers.ModelSerializer):
 
     def __init__(self, *args, **kwargs):
         super().__init__(*args, **kwargs)
-        user = self.context['request'].user
-        if user.is_authenticated:
-            self.fields['shop'].queryset = Shop.objects.filter(owner=user)
+        request = self.context['request']
+        if request.user.is_authenticated:
+            self.fields['shop'].queryset = Shop.objects.filter(pk__in=user_shop_ids(request))
 
     class Meta:
         model = ProductCategory
@@ -41,13 +48,22 @@ class ProductSerializer(serializers.ModelSerializer):
 
     def __init__(self, *args, **kwargs):
         super().__init__(*args, **kwargs)
-        user = self.context['request'].user
-        if user.is_authenticated:
-            self.fields['shop'].queryset = Shop.objects.filter(owner=user)
+        request = self.context['request']
+        if request.user.is_authenticated:
+            shop_ids = user_shop_ids(request)
+            self.fields['shop'].queryset = Shop.objects.filter(pk__in=shop_ids)
+            self.fields['category'].queryset = ProductCategory.objects.filter(shop_id__in=shop_ids)
+
+    def validate_sku(self, value):
+        # Blank codes are stored as NULL so they never collide
+        return value or None
+
+    def validate_barcode(self, value):
+        return value or None
 
     class Meta:
         model = Product
-        fields = '__all__'
+        exclude = ['search_vector']
 
 
 class SaleSerializer(serializers.ModelSerializer):
@@ -63,11 +79,26 @@ class SaleSerializer(serializers.ModelSerializer):
         super().__init__(*args, **kwargs)
 
         if request and request.user.is_authenticated:
-            self.fields['shop'].queryset = Shop.objects.filter(owner=request.user)
+            self.fields['shop'].queryset = Shop.objects.filter(pk__in=user_shop_ids(request))
+        # Totals and the daily rollup are kept per shop, so a sale stays where it was made
+        if self.instance is not None:
+            self.fields['shop'].read_only = True
 
     class Meta:
         model = Sale
-        fields = ['id', 'receipt_number', 'shop', 'sale_date']
+        fields = ['id', 'receipt_number', 'shop', 'sale_date', 'total_amount', 'total_cost', 'item_count']
+        read_only_fields = ['total_amount', 'total_cost', 'item_count']
+
+class SaleListSerializer(serializers.Serializer):
+    """Rows of the sale list, which reports totals rather than the stored columns."""
+
+    id = serializers.IntegerField(read_only=True)
+    receipt_number = serializers.CharField(read_only=True)
+    sale_date = serializers.DateTimeField(read_only=True)
+    # Annotated as sales_total/profit_total, since Sale.total_profit is a property
+    total_sales = serializers.DecimalField(max_digits=12, decimal_places=2, read_only=True, source='sales_total')
+    total_profit = serializers.DecimalField(max_digits=12, decimal_places=2, read_only=True, source='profit_total')
+
 
 class SaleItemSerializer(serializers.ModelSerializer):
     """SaleItem serializer to dynamically fetch product price and display receipt_number."""
@@ -75,7 +106,7 @@ class SaleItemSerializer(serializers.ModelSerializer):
     # Fetch the receipt number from the sale table
     receipt_number = serializers.ReadOnlyField(source='sale.receipt_number')
     product_price = serializers.DecimalField(
-        source='product.price', max_digits=10, decimal_places=2, read_only=True
+        source='unit_price', max_digits=10, decimal_places=2, read_only=True
     )
 
     sale = serializers.PrimaryKeyRelatedField(
@@ -90,16 +121,231 @@ class SaleItemSerializer(serializers.ModelSerializer):
         super().__init__(*args, **kwargs)
         request = self.context.get('request')
         if request and request.user.is_authenticated:
-            user_shop = Shop.objects.filter(owner=request.user)
-            self.fields['sale'].queryset = Sale.objects.filter(shop__in=user_shop)
-            self.fields['product'].queryset = Product.objects.filter(shop__in=user_shop)
+            shop_ids = user_shop_ids(request)
+            self.fields['sale'].queryset = Sale.objects.filter(shop_id__in=shop_ids)
+            self.fields['product'].queryset = Product.objects.filter(shop_id__in=shop_ids)
+
+    def save(self, **kwargs):
+        try:
+            return super().save(**kwargs)
+        except InsufficientInventory as exc:
+            raise serializers.ValidationError({'quantity': [str(exc)]})
 
     class Meta:
         model = SaleItem
         fields = ['id', 'sale', 'receipt_number', 'product', 'quantity', 'product_price']
 
 
+class ProductImportRowSerializer(serializers.Serializer):
+    """One product of a bulk import; the category is given by name."""
+
+    name = serializers.CharField(max_length=255)
+    description = serializers.CharField(required=False, allow_blank=True, allow_null=True)
+    price = serializers.DecimalField(max_digits=10, decimal_places=2, min_value=Decimal('0.01'))
+    mrp = serializers.DecimalField(
+        max_digits=10, decimal_places=2, min_value=Decimal('0.01'), required=False, allow_null=True
+    )
+    inventory = serializers.IntegerField(min_value=0, required=False)
+    category = serializers.CharField(max_length=255, required=False, allow_blank=True, allow_null=True)
+
+
 class ProductSoldSerializer(serializers.Serializer):
     product_id = serializers.IntegerField()
     total_quantity_sold = serializers.IntegerField()
-    total_sales_value = serializers.DecimalField(max_digits=10, decimal_places=2)
\ No newline at end of file
+    total_sales_value = serializers.DecimalField(max_digits=14, decimal_places=2)
+
+
+class SalesSeriesSerializer(serializers.Serializer):
+    """One bucket of reports.sales_series; the breakdown keys are only there when grouped."""
+
+    period = serializers.DateTimeField(read_only=True)
+    shop_id = serializers.IntegerField(read_only=True)
+    category_id = serializers.IntegerField(read_only=True)
+    category_name = serializers.CharField(read_only=True)
+    revenue = serializers.DecimalField(max_digits=14, decimal_places=2, read_only=True)
+    profit = serializers.DecimalField(max_digits=14, decimal_places=2, read_only=True)
+    items = serializers.IntegerField(read_only=True)
+    receipts = serializers.IntegerField(read_only=True)
+
+
+class TopSellerSerializer(serializers.Serializer):
+    """One row of reports.top_sellers, keyed by product_id or, for categories, category_id."""
+
+    product_id = serializers.IntegerField(read_only=True)
+    category_id = serializers.IntegerField(read_only=True)
+    name = serializers.CharField(read_only=True)
+    total_quantity = serializers.IntegerField(read_only=True)
+    total_revenue = serializers.DecimalField(max_digits=14, decimal_places=2, read_only=True)
+    total_profit = serializers.DecimalField(max_digits=14, decimal_places=2, read_only=True)
+
+
+def lock_shop_products(shop, product_ids, field):
+    """
+    Validate that every id is a product of the shop and lock those rows, with one query.
+    """
+    products = Product.objects.select_for_update().filter(
+        shop=shop, id__in=product_ids
+    ).order_by('pk').in_bulk()
+
+    missing = sorted(set(product_ids) - set(products))
+    if missing:
+        raise serializers.ValidationError(
+            {field: [f"Invalid product {product_id} for this shop." for product_id in missing]}
+        )
+    return products
+
+
+class CheckoutItemSerializer(serializers.Serializer):
+    product = serializers.IntegerField()
+    quantity = serializers.IntegerField(min_value=1)
+
+
+class CheckoutSerializer(serializers.Serializer):
+    """Validates a whole basket and writes the Sale together with all of its items."""
+
+    shop = serializers.PrimaryKeyRelatedField(queryset=Shop.objects.none())
+    items = CheckoutItemSerializer(many=True, allow_empty=False)
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        request = self.context.get('request')
+        if request and request.user.is_authenticated:
+            self.fields['shop'].queryset = Shop.objects.filter(pk__in=user_shop_ids(request))
+
+    @transaction.atomic
+    def create(self, validated_data):
+        shop = validated_data['shop']
+
+        # Repeated lines for the same product are merged into one SaleItem
+        quantities = {}
+        for item in validated_data['items']:
+            quantities[item['product']] = quantities.get(item['product'], 0) + item['quantity']
+
+        products = lock_shop_products(shop, quantities, 'items')
+
+        short = [
+            product.name for product_id, product in products.items()
+            if product.inventory < quantities[product_id]
+        ]
+        if short:
+            raise serializers.ValidationError(
+                {'items': [f"Not enough inventory for product {name}." for name in short]}
+            )
+
+        Product.objects.filter(id__in=quantities).update(
+            inventory=Case(
+                *[When(id=product_id, then=F('inventory') - quantity) for product_id, quantity in quantities.items()],
+                default=F('inventory'),
+                output_field=IntegerField(),
+            )
+        )
+        inventory_changed.send(sender=Product, product_ids=list(quantities), shop_ids=[shop.id])
+
+        InventoryMovement.objects.bulk_create([
+            InventoryMovement(shop=shop, product_id=product_id, kind=InventoryMovement.SALE, quantity=-quantity)
+            for product_id, quantity in quantities.items()
+        ])
+
+        sale = Sale.objects.create(
+            shop=shop,
+            total_amount=sum(products[product_id].price * quantity for product_id, quantity in quantities.items()),
+            total_cost=sum(products[product_id].unit_cost * quantity for product_id, quantity in quantities.items()),
+            item_count=sum(quantities.values()),
+        )
+        DailyProductSales.record(shop.id, timezone.localdate(sale.sale_date), {
+            product_id: (quantity, products[product_id].price * quantity, products[product_id].unit_cost * quantity)
+            for product_id, quantity in quantities.items()
+        })
+        self.sale_items = SaleItem.objects.bulk_create([
+            SaleItem(
+                sale=sale, product=products[product_id], quantity=quantity,
+                unit_price=products[product_id].price, unit_mrp=products[product_id].mrp,
+            )
+            for product_id, quantity in quantities.items()
+        ])
+        return sale
+
+    def to_representation(self, instance):
+        data = SaleSerializer(instance, context=self.context).data
+        data['items'] = SaleItemSerializer(self.sale_items, many=True, context=self.context).data
+        return data
+
+
+class InventoryAdjustmentItemSerializer(serializers.Serializer):
+    product = serializers.IntegerField()
+    delta = serializers.IntegerField(required=False)
+    absolute = serializers.IntegerField(min_value=0, required=False)
+
+    def validate(self, attrs):
+        if ('delta' in attrs) == ('absolute' in attrs):
+            raise serializers.ValidationError("Give exactly one of delta or absolute.")
+        return attrs
+
+
+class InventoryAdjustmentSerializer(serializers.Serializer):
+    """Applies a batch of stock changes for one shop and records them in the ledger."""
+
+    shop = serializers.PrimaryKeyRelatedField(queryset=Shop.objects.none())
+    reason = serializers.CharField(max_length=255, required=False, allow_blank=True, default='')
+    adjustments = InventoryAdjustmentItemSerializer(many=True, allow_empty=False)
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        request = self.context.get('request')
+        if request and request.user.is_authenticated:
+            self.fields['shop'].queryset = Shop.objects.filter(pk__in=user_shop_ids(request))
+
+    @transaction.atomic
+    def create(self, validated_data):
+        shop = validated_data['shop']
+        adjustments = validated_data['adjustments']
+        products = lock_shop_products(shop, {adjustment['product'] for adjustment in adjustments}, 'adjustments')
+
+        # Adjustments are applied in order, so a product may appear more than once
+        levels = {product_id: product.inventory for product_id, product in products.items()}
+        for adjustment in adjustments:
+            product_id = adjustment['product']
+            if 'absolute' in adjustment:
+                levels[product_id] = adjustment['absolute']
+            else:
+                levels[product_id] += adjustment['delta']
+
+        negative = [products[product_id].name for product_id, level in levels.items() if level < 0]
+        if negative:
+            raise serializers.ValidationError(
+                {'adjustments': [f"Not enough inventory for product {name}." for name in negative]}
+            )
+
+        changes = {
+            product_id: level - products[product_id].inventory
+            for product_id, level in levels.items() if level != products[product_id].inventory
+        }
+        if changes:
+            Product.objects.filter(id__in=changes).update(
+                inventory=Case(
+                    *[When(id=product_id, then=Value(levels[product_id])) for product_id in changes],
+                    default=F('inventory'),
+                    output_field=IntegerField(),
+                )
+            )
+            request = self.context.get('request')
+            InventoryMovement.objects.bulk_create([
+                InventoryMovement(
+                    shop=shop, product_id=product_id, kind=InventoryMovement.ADJUSTMENT, quantity=quantity,
+                    reason=validated_data['reason'], user=request.user if request else None,
+                )
+                for product_id, quantity in changes.items()
+            ])
+            inventory_changed.send(sender=Product, product_ids=list(changes), shop_ids=[shop.id])
+
+        self.levels = levels
+        self.changed = sorted(changes)
+        return shop
+
+    def to_representation(self, instance):
+        return {
+            'shop': instance.id,
+            'products': [
+                {'product': product_id, 'inventory': level} for product_id, level in sorted(self.levels.items())
+            ],
+        }
@@ -0,0 +1,81 @@
+from django.db import transaction
+from django.db.models import Case, F, IntegerField, When
+from django.db.models.signals import post_delete, post_save, pre_delete
+from django.dispatch import Signal, receiver
+from django.utils import timezone
+
+from .cache import bump_version
+
+# Sent with product_ids (and shop_ids when known) whenever stock levels change
+# through an UPDATE that bypasses Product.save().
+inventory_changed = Signal()
+
+
+def bump_catalog_on_commit(shop_ids):
+    transaction.on_commit(lambda: bump_version('catalog', shop_ids))
+
+
+def bump_sales_on_commit(shop_ids):
+    transaction.on_commit(lambda: bump_version('sales', shop_ids))
+
+
+@receiver(post_save, sender='shop.Product')
+@receiver(post_delete, sender='shop.Product')
+@receiver(post_save, sender='shop.ProductCategory')
+@receiver(post_delete, sender='shop.ProductCategory')
+def invalidate_catalog(sender, instance, **kwargs):
+    bump_catalog_on_commit([instance.shop_id])
+
+
+@receiver(inventory_changed)
+def invalidate_catalog_stock(sender, product_ids, shop_ids=None, **kwargs):
+    if shop_ids is None:
+        shop_ids = set(sender.objects.filter(pk__in=product_ids).values_list('shop_id', flat=True))
+    bump_catalog_on_commit(shop_ids)
+
+
+# Item changes reach the sales reports through DailyProductSales.record, which
+# bumps the version itself; sale deletes cascade past it.
+@receiver(post_save, sender='shop.Sale')
+@receiver(post_delete, sender='shop.Sale')
+def invalidate_sales(sender, instance, **kwargs):
+    bump_sales_on_commit([instance.shop_id])
+
+
+@receiver(pre_delete, sender='shop.Sale')
+def return_sale_items(sender, instance, **kwargs):
+    """
+    Undo the items of a deleted sale, which their cascade delete would skip:
+    stock goes back with a return in the inventory ledger, and the items are
+    taken out of the daily rollup.
+    """
+    # Imported here because the models import this module
+    from .models import Product, DailyProductSales, InventoryMovement
+
+    items = list(instance.items.select_related('product'))
+    if not items:
+        return
+
+    lines = {}
+    for item in items:
+        if item.unit_price is None:
+            item.capture_prices()
+        amount, cost, count = item.totals()
+        lines[item.product_id] = (-count, -amount, -cost)
+
+    Product.objects.filter(pk__in=lines).update(
+        inventory=Case(
+            *[When(pk=item.product_id, then=F('inventory') + item.quantity) for item in items],
+            default=F('inventory'),
+            output_field=IntegerField(),
+        )
+    )
+    InventoryMovement.objects.bulk_create([
+        InventoryMovement(
+            shop_id=item.product.shop_id, product_id=item.product_id, kind=InventoryMovement.RETURN,
+            quantity=item.quantity,
+        )
+        for item in items
+    ])
+    inventory_changed.send(sender=Product, product_ids=list(lines), shop_ids=[instance.shop_id])
+    DailyProductSales.record(instance.shop_id, timezone.localdate(instance.sale_date), lines)
@@ -1,3 +1,1449 @@
-from django.test import TestCase
+import json
+import threading
+import tracemalloc
+from datetime import datetime, timedelta
+from decimal import Decimal
+from unittest import mock, skipUnless
 
-# Create your tests here.
+from django.contrib.admin.sites import site
+from django.core.cache import cache
+from django.core.management import call_command
+from django.db import connection, transaction
+from django.test import RequestFactory, TestCase, TransactionTestCase
+from django.test.utils import CaptureQueriesContext, override_settings
+from django.utils import timezone
+from rest_framework.authtoken.models import Token
+from rest_framework.renderers import JSONRenderer
+from rest_framework.request import Request
+from rest_framework.test import APIClient
+
+from core.models import User
+from .models import Shop, ProductCategory, Product, Sale, SaleItem, DailyProductSales, InventoryMovement, \
+    ReceiptSequence
+from .codes import code_cache
+from .fastpath import ValuesSerializer
+from .imports import import_products
+from .permissions import user_shop_ids
+from .renderers import ORJSONRenderer
+from .reports import product_sales_querysets
+from .serializers import ProductSerializer, SaleItemSerializer
+from .views import ProductSoldViewSet
+
+
+def run_concurrently(count, target):
+    """
+    Call target(index) from `count` threads released at the same moment and
+    return the results in index order; the first exception a thread raised is
+    raised again once all of them are done.
+    """
+    barrier = threading.Barrier(count)
+    results = [None] * count
+    errors = []
+
+    def worker(index):
+        try:
+            barrier.wait()
+            results[index] = target(index)
+        except BaseException as exc:
+            errors.append(exc)
+        finally:
+            connection.close()
+
+    threads = [threading.Thread(target=worker, args=(index,)) for index in range(count)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    if errors:
+        raise errors[0]
+    return results
+
+
+def supports_concurrent_writes():
+    """
+    Whether writers on separate connections wait for each other's locks on the
+    test database. On PostgreSQL they do; SQLite only queues them on its busy
+    timeout for a file database opened with transaction_mode IMMEDIATE. An
+    in-memory SQLite database shares one cache between connections, which
+    fails with "database table is locked" instead of waiting.
+    """
+    if connection.vendor == 'postgresql':
+        return True
+    if connection.vendor != 'sqlite':
+        return False
+    test_name = connection.settings_dict['TEST'].get('NAME')
+    return (
+        bool(test_name) and not connection.creation.is_in_memory_db(test_name)
+        and connection.settings_dict['OPTIONS'].get('transaction_mode') == 'IMMEDIATE'
+    )
+
+
+concurrent_writes = skipUnless(
+    supports_concurrent_writes(),
+    "needs writers that wait on locks: PostgreSQL, or SQLite on a file with transaction_mode IMMEDIATE",
+)
+
+
+class ShopAPITestCase(TestCase):
+    """
+    One owner with a shop of `product_count` products, logged in on self.client.
+    """
+    product_count = 20
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('alice', 'alice@example.com', 'password')
+        cls.shop = Shop.objects.create(name='Corner Shop', owner=cls.user)
+        cls.category = ProductCategory.objects.create(name='Snacks', shop=cls.shop)
+        cls.products = Product.objects.bulk_create([
+            Product(
+                name=f'Product {i:02d}', price=Decimal('10.00'), mrp=Decimal('7.00'), inventory=1000,
+                shop=cls.shop, category=cls.category,
+            )
+            for i in range(cls.product_count)
+        ])
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def checkout(self, products, quantity=1, shop=None):
+        response = self.client.post('/shop/api/sales/checkout/', {
+            'shop': (shop or self.shop).pk,
+            'items': [{'product': product.pk, 'quantity': quantity} for product in products],
+        }, format='json')
+        self.assertEqual(response.status_code, 201, response.content)
+        return Sale.objects.get(pk=response.data['id'])
+
+
+class CheckoutQueryTests(ShopAPITestCase):
+
+    def test_query_count_does_not_grow_with_basket_size(self):
+        # The first sale of a shop also creates its receipt sequence
+        self.checkout(self.products[:1])
+        with CaptureQueriesContext(connection) as single_line:
+            self.checkout(self.products[:1])
+
+        for size in (5, 20):
+            with self.subTest(size=size), self.assertNumQueries(len(single_line)):
+                sale = self.checkout(self.products[:size])
+            self.assertEqual(sale.items.count(), size)
+            self.assertEqual(sale.item_count, size)
+
+
+@concurrent_writes
+@override_settings(ACTIVITY_SYNC=True)
+class SaleItemConcurrencyTests(TransactionTestCase):
+    """
+    Stock and totals stay exact when many requests hit the same rows at once.
+    """
+    threads = 8
+
+    def setUp(self):
+        self.user = User.objects.create_user('alice', 'alice@example.com', 'password')
+        self.shop = Shop.objects.create(name='Corner Shop', owner=self.user)
+        self.product = Product.objects.create(
+            name='Tea', price=Decimal('10.00'), mrp=Decimal('7.00'), inventory=5, shop=self.shop
+        )
+
+    def client_for(self, user):
+        client = APIClient()
+        client.force_authenticate(user)
+        return client
+
+    def test_concurrent_sales_never_oversell(self):
+        sales = [Sale.objects.create(shop=self.shop) for _ in range(self.threads)]
+
+        def sell(index):
+            return self.client_for(self.user).post('/shop/api/sale-items/', {
+                'sale': sales[index].pk, 'product': self.product.pk, 'quantity': 1,
+            }, format='json').status_code
+
+        statuses = run_concurrently(self.threads, sell)
+
+        self.assertEqual(sorted(statuses), [201] * 5 + [400] * (self.threads - 5))
+        self.product.refresh_from_db()
+        self.assertEqual(self.product.inventory, 0)
+        self.assertEqual(SaleItem.objects.count(), 5)
+        self.assertEqual(sum(Sale.objects.values_list('item_count', flat=True)), 5)
+
+    def test_concurrent_deletes_restock_once(self):
+        sale = Sale.objects.create(shop=self.shop)
+        item = SaleItem.objects.create(sale=sale, product=self.product, quantity=3)
+
+        def delete(index):
+            return self.client_for(self.user).delete(f'/shop/api/sale-items/{item.pk}/').status_code
+
+        statuses = run_concurrently(self.threads, delete)
+
+        self.assertIn(204, statuses)
+        self.assertTrue(set(statuses) <= {204, 404})
+        self.product.refresh_from_db()
+        sale.refresh_from_db()
+        self.assertEqual(self.product.inventory, 5)
+        self.assertEqual((sale.total_amount, sale.item_count), (0, 0))
+        self.assertEqual(DailyProductSales.objects.get(product=self.product).quantity, 0)
+        self.assertEqual(
+            sum(InventoryMovement.objects.filter(product=self.product).values_list('quantity', flat=True)), 0
+        )
+
+
+class ReceiptSequenceTests(TransactionTestCase):
+    """
+    Blocks of receipt numbers are only cached once committed, and only used
+    while the counter row still agrees with them.
+    """
+
+    def setUp(self):
+        self.user = User.objects.create_user('alice', 'alice@example.com', 'password')
+        self.shop = Shop.objects.create(name='Corner Shop', owner=self.user)
+
+    def numbers(self, count):
+        return [Sale.objects.create(shop=self.shop).receipt_number for _ in range(count)]
+
+    def expected(self, first, last):
+        return [f'{self.shop.pk}-{value:08d}' for value in range(first, last + 1)]
+
+    def test_blocks_are_reused_until_exhausted(self):
+        count = ReceiptSequence.block_size * 2 + 5
+        with CaptureQueriesContext(connection) as queries:
+            self.assertEqual(self.numbers(count), self.expected(1, count))
+
+        reservations = [query for query in queries if query['sql'].startswith('UPDATE "shop_receiptsequence"')]
+        # The first sale also creates the counter row: one UPDATE that misses, then the real one
+        self.assertEqual(len(reservations), 3 + 1)
+
+    def test_a_rolled_back_reservation_is_not_cached(self):
+        with self.assertRaises(RuntimeError), transaction.atomic():
+            self.numbers(1)
+            raise RuntimeError
+
+        # Had its block been cached, the next reservation would hand out the same numbers again
+        self.assertEqual(self.numbers(25), self.expected(1, 25))
+        self.assertEqual(Sale.objects.values('receipt_number').distinct().count(), 25)
+
+    def test_a_flushed_table_does_not_reissue_cached_numbers(self):
+        self.assertEqual(self.numbers(1), self.expected(1, 1))
+        call_command('flush', interactive=False, verbosity=0)
+
+        self.user = User.objects.create_user('alice', 'alice@example.com', 'password')
+        self.shop = Shop.objects.create(pk=self.shop.pk, name='Corner Shop', owner=self.user)
+        self.assertEqual(self.numbers(3), self.expected(1, 3))
+
+    def test_a_restored_counter_drops_the_cached_blocks(self):
+        self.assertEqual(self.numbers(2), self.expected(1, 2))
+        # Back to a backup taken before these sales
+        Sale.objects.all().delete()
+        ReceiptSequence.objects.filter(pk=self.shop.pk).update(next_value=1)
+
+        self.assertEqual(self.numbers(3), self.expected(1, 3))
+        # Another worker reserving now gets numbers past the fresh block
+        self.assertEqual(ReceiptSequence.reserve(self.shop.pk, 1), ReceiptSequence.block_size + 1)
+
+    @concurrent_writes
+    def test_concurrent_sales_get_distinct_numbers(self):
+        threads, per_thread = 8, ReceiptSequence.block_size + 5
+
+        batches = run_concurrently(threads, lambda index: self.numbers(per_thread))
+
+        self.assertEqual(len({number for batch in batches for number in batch}), threads * per_thread)
+
+
+class SaleDeleteTests(ShopAPITestCase):
+
+    def test_deleting_a_sale_takes_it_out_of_the_rollup(self):
+        sale = self.checkout(self.products[:2], quantity=3)
+        self.assertEqual(self.client.delete(f'/shop/api/sales/{sale.pk}/').status_code, 204)
+
+        self.assertFalse(SaleItem.objects.exists())
+        self.assertEqual(
+            list(DailyProductSales.objects.values_list('quantity', 'revenue', 'cost').distinct()), [(0, 0, 0)]
+        )
+        response = self.client.get('/shop/api/products-sold/', {'product': [self.products[0].pk]})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(sum(row['total_quantity_sold'] for row in response.data), 0)
+
+    def test_the_shop_of_a_sale_cannot_be_changed(self):
+        other = Shop.objects.create(name='Second Shop', owner=self.user)
+        sale = self.checkout(self.products[:1])
+
+        response = self.client.patch(f'/shop/api/sales/{sale.pk}/', {'shop': other.pk}, format='json')
+
+        self.assertEqual(response.status_code, 200)
+        sale.refresh_from_db()
+        self.assertEqual(sale.shop, self.shop)
+        self.assertFalse(DailyProductSales.objects.filter(shop=other).exists())
+
+
+class SalesHistoryTestCase(ShopAPITestCase):
+    """
+    Two owners selling at the same moments over five days, so each report
+    mixes whole days from the rollup with partial edge days from SaleItem.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        cls.other_user = User.objects.create_user('bob', 'bob@example.com', 'password')
+        cls.other_shop = Shop.objects.create(name='Other Shop', owner=cls.other_user)
+        cls.other_product = Product.objects.create(
+            name='Other Product', price=Decimal('3.00'), mrp=Decimal('2.00'), inventory=1000, shop=cls.other_shop,
+        )
+        cls.first_day = timezone.localtime().replace(hour=0, minute=0, second=0, microsecond=0) - timedelta(days=10)
+        for day in range(5):
+            for hour in (3, 12, 20):
+                moment = cls.first_day + timedelta(days=day, hours=hour)
+                cls.sell(cls.shop, moment, {cls.products[0]: day + 1, cls.products[1]: hour})
+                cls.sell(cls.other_shop, moment, {cls.other_product: 7})
+
+    @staticmethod
+    def sell(shop, moment, lines):
+        sale = Sale.objects.create(shop=shop)
+        Sale.objects.filter(pk=sale.pk).update(sale_date=moment)
+        sale.refresh_from_db()
+        for product, quantity in lines.items():
+            SaleItem.objects.create(sale=sale, product=product, quantity=quantity)
+
+
+class ProductSoldTests(SalesHistoryTestCase):
+
+    def expected(self, products, start, end):
+        rows = []
+        for product in products:
+            items = SaleItem.objects.filter(product=product, sale__sale_date__gte=start, sale__sale_date__lte=end)
+            rows.append({
+                'product_id': product.pk,
+                'total_quantity_sold': sum(item.quantity for item in items),
+                'total_sales_value': sum(item.quantity * item.unit_price for item in items),
+            })
+        return rows
+
+    def products_sold(self, products, start, end):
+        response = self.client.get('/shop/api/products-sold/', {
+            'product': [product.pk for product in products],
+            'start_date': start.isoformat(), 'end_date': end.isoformat(),
+        })
+        self.assertEqual(response.status_code, 200, response.content)
+        return [
+            {
+                'product_id': row['product_id'],
+                'total_quantity_sold': row['total_quantity_sold'],
+                'total_sales_value': Decimal(row['total_sales_value']),
+            }
+            for row in response.data
+        ]
+
+    def test_rollup_and_edge_days_add_up_to_the_raw_sales(self):
+        products = self.products[:2]
+        # Starts and ends mid-day, with whole days in between
+        start = self.first_day + timedelta(hours=6)
+        end = self.first_day + timedelta(days=3, hours=12)
+        self.assertEqual(self.products_sold(products, start, end), self.expected(products, start, end))
+
+        # Within a single day only the edge is read
+        start = self.first_day + timedelta(days=2, hours=1)
+        end = self.first_day + timedelta(days=2, hours=13)
+        self.assertEqual(self.products_sold(products, start, end), self.expected(products, start, end))
+
+        # Exactly on midnights everything comes from the rollup
+        start = self.first_day + timedelta(days=1)
+        end = self.first_day + timedelta(days=4)
+        self.assertEqual(self.products_sold(products, start, end), self.expected(products, start, end))
+
+    def test_another_owners_product_is_not_reported(self):
+        start = self.first_day
+        end = self.first_day + timedelta(days=4, hours=12)
+        self.assertEqual(self.products_sold([self.other_product], start, end), [])
+
+        rows = self.products_sold([self.products[0], self.other_product], start, end)
+        self.assertEqual([row['product_id'] for row in rows], [self.products[0].pk])
+
+    def test_totals_beyond_a_product_price_fit(self):
+        product = Product.objects.create(
+            name='Kiosk', price=Decimal('99999999.00'), mrp=Decimal('1.00'), inventory=10, shop=self.shop
+        )
+        self.checkout([product], quantity=3)
+
+        response = self.client.get('/shop/api/products-sold/', {'product': [product.pk]})
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data[0]['total_sales_value'], '299999997.00')
+
+    def test_query_count_is_fixed(self):
+        start = self.first_day + timedelta(hours=6)
+        end = self.first_day + timedelta(days=3, hours=12)
+        with CaptureQueriesContext(connection) as baseline:
+            self.products_sold(self.products[:1], start, end)
+
+        for products in (self.products[:2], self.products, [*self.products, self.other_product]):
+            with self.subTest(count=len(products)), self.assertNumQueries(len(baseline)):
+                self.products_sold(products, start, end - timedelta(days=1))
+
+
+class SalesSeriesTests(SalesHistoryTestCase):
+    """
+    GET /analytics/sales/ buckets match totals computed from the raw sale items.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        # A second shop of the same owner with its own category, and a product without one
+        cls.second_shop = Shop.objects.create(name='Second Shop', owner=cls.user)
+        drinks = ProductCategory.objects.create(name='Drinks', shop=cls.second_shop)
+        cls.drink = Product.objects.create(
+            name='Cola', price=Decimal('2.50'), mrp=Decimal('1.00'), inventory=1000, shop=cls.second_shop,
+            category=drinks,
+        )
+        cls.loose = Product.objects.create(name='Loose', price=Decimal('4.00'), inventory=1000, shop=cls.shop)
+        for day in (0, 1, 3):
+            moment = cls.first_day + timedelta(days=day, hours=12, minutes=30)
+            cls.sell(cls.second_shop, moment, {cls.drink: day + 2})
+            cls.sell(cls.shop, moment, {cls.loose: 1, cls.products[2]: 3})
+
+    @staticmethod
+    def bucket(moment, interval):
+        moment = timezone.localtime(moment).replace(minute=0, second=0, microsecond=0)
+        if interval != 'hour':
+            moment = moment.replace(hour=0)
+        if interval == 'week':
+            moment -= timedelta(days=moment.weekday())
+        if interval == 'month':
+            moment = moment.replace(day=1)
+        return moment
+
+    def expected(self, interval, group_by=None, start=None, end=None):
+        items = SaleItem.objects.filter(sale__shop__owner=self.user).select_related('sale', 'product')
+        if start is not None:
+            items = items.filter(sale__sale_date__gte=start)
+        if end is not None:
+            items = items.filter(sale__sale_date__lte=end)
+
+        buckets = {}
+        for item in items:
+            key = self.bucket(item.sale.sale_date, interval)
+            if group_by is not None:
+                key = (key, item.sale.shop_id if group_by == 'shop' else item.product.category_id)
+            row = buckets.setdefault(key, {'revenue': 0, 'profit': 0, 'items': 0, 'receipts': set()})
+            cost = item.unit_mrp if item.unit_mrp is not None else item.unit_price
+            row['revenue'] += item.quantity * item.unit_price
+            row['profit'] += item.quantity * (item.unit_price - cost)
+            row['items'] += item.quantity
+            row['receipts'].add(item.sale_id)
+        return {
+            key: (row['revenue'], row['profit'], row['items'], len(row['receipts']))
+            for key, row in buckets.items()
+        }
+
+    def series(self, interval, group_by=None, **params):
+        response = self.client.get('/shop/api/analytics/sales/', {
+            'interval': interval, **({'group_by': group_by} if group_by else {}), **params,
+        })
+        self.assertEqual(response.status_code, 200, response.content)
+        self.assertEqual((response.data['interval'], response.data['group_by']), (interval, group_by))
+        series = {}
+        for row in response.data['results']:
+            key = datetime.fromisoformat(row['period'])
+            if group_by is not None:
+                key = (key, row[f'{group_by}_id'])
+            series[key] = (Decimal(row['revenue']), Decimal(row['profit']), row['items'], row['receipts'])
+        return series
+
+    def test_buckets_per_interval(self):
+        for interval in ('hour', 'day', 'week', 'month'):
+            with self.subTest(interval=interval):
+                series = self.series(interval)
+                self.assertEqual(series, self.expected(interval))
+        self.assertEqual(len(self.series('day')), 5)
+
+    def test_buckets_per_shop_and_category(self):
+        for interval in ('hour', 'day', 'week'):
+            for group_by in ('shop', 'category'):
+                with self.subTest(interval=interval, group_by=group_by):
+                    self.assertEqual(self.series(interval, group_by), self.expected(interval, group_by))
+
+        rows = self.client.get('/shop/api/analytics/sales/', {'group_by': 'category'}).data['results']
+        self.assertEqual(
+            {(row['category_id'], row['category_name']) for row in rows},
+            {(self.category.pk, 'Snacks'), (self.drink.category_id, 'Drinks'), (None, None)},
+        )
+        rows = self.client.get('/shop/api/analytics/sales/', {'group_by': 'shop'}).data['results']
+        self.assertEqual({row['shop_id'] for row in rows}, {self.shop.pk, self.second_shop.pk})
+
+    def test_date_range_and_shop(self):
+        start = self.first_day + timedelta(days=1, hours=6)
+        end = self.first_day + timedelta(days=3, hours=12, minutes=30)
+        series = self.series('day', start_date=start.isoformat(), end_date=end.isoformat())
+        self.assertEqual(series, self.expected('day', start=start, end=end))
+        self.assertEqual(len(series), 3)
+
+        series = self.series('day', 'shop', shop=self.second_shop.pk)
+        self.assertEqual({shop_id for _, shop_id in series}, {self.second_shop.pk})
+        other = self.client.get('/shop/api/analytics/sales/', {'shop': self.other_shop.pk})
+        self.assertEqual(other.status_code, 400)
+
+    def test_invalid_interval_and_group_by(self):
+        self.assertEqual(self.client.get('/shop/api/analytics/sales/', {'interval': 'year'}).status_code, 400)
+        self.assertEqual(self.client.get('/shop/api/analytics/sales/', {'group_by': 'product'}).status_code, 400)
+
+
+class TopSellersTests(SalesHistoryTestCase):
+    """
+    GET /analytics/top-products/ ranks exactly like totals computed from the
+    raw sale items, also when partial edge days reorder the rollup's ranking.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        # Whole day 6 sits between partial days 5 and 7 of the window below
+        cls.edge_category = ProductCategory.objects.create(name='Edge', shop=cls.shop)
+        cls.loss, cls.steady, cls.small, cls.late = Product.objects.bulk_create([
+            Product(name=name, price=Decimal('10.00'), mrp=Decimal('7.00'), inventory=1000, shop=cls.shop,
+                    category=cls.edge_category)
+            for name in ('Loss', 'Steady', 'Small', 'Late')
+        ])
+        whole_day = cls.first_day + timedelta(days=6, hours=10)
+        cls.sell(cls.shop, whole_day, {cls.loss: 4, cls.steady: 3, cls.small: 2, cls.late: 1})
+        cls.sell(cls.shop, cls.first_day + timedelta(days=5, hours=18), {cls.late: 1})
+        # Sold below cost at the edge: 4 * 3.00 profit from the rollup, minus 5 * 2.00
+        cls.loss.price = Decimal('5.00')
+        cls.sell(cls.shop, cls.first_day + timedelta(days=7, hours=6), {cls.loss: 5})
+
+    def setUp(self):
+        super().setUp()
+        cache.clear()
+
+    def top(self, **params):
+        response = self.client.get('/shop/api/analytics/top-products/', params)
+        self.assertEqual(response.status_code, 200, response.content)
+        return response.data['results']
+
+    def expected(self, metric, limit, by='product', start=None, end=None, category=None):
+        items = SaleItem.objects.filter(sale__shop__owner=self.user).select_related('product__category')
+        if start is not None:
+            items = items.filter(sale__sale_date__gte=start)
+        if end is not None:
+            items = items.filter(sale__sale_date__lte=end)
+        if category is not None:
+            items = items.filter(product__category_id=category)
+
+        totals = {}
+        for item in items:
+            key = item.product.category_id if by == 'category' else item.product_id
+            row = totals.setdefault(key, {'quantity': 0, 'revenue': 0, 'profit': 0})
+            cost = item.unit_mrp if item.unit_mrp is not None else item.unit_price
+            row['quantity'] += item.quantity
+            row['revenue'] += item.quantity * item.unit_price
+            row['profit'] += item.quantity * (item.unit_price - cost)
+        ranked = sorted(totals.items(), key=lambda entry: (-entry[1][metric], entry[0] is None, entry[0] or 0))
+        return [(key, row[metric]) for key, row in ranked[:limit]]
+
+    def ranking(self, rows, metric, by='product'):
+        total = Decimal if metric != 'quantity' else int
+        return [(row[f'{by}_id'], total(row[f'total_{metric}'])) for row in rows]
+
+    def test_edge_days_reorder_the_rollup_ranking(self):
+        start = self.first_day + timedelta(days=5, hours=12)
+        end = self.first_day + timedelta(days=7, hours=12)
+        params = {'start_date': start.isoformat(), 'end_date': end.isoformat(), 'category': self.edge_category.pk}
+
+        # Loss leads the whole day, but its edge sale drops it to the bottom
+        rows = self.top(metric='profit', limit=1, **params)
+        self.assertEqual([(row['name'], row['total_profit']) for row in rows], [('Steady', '9.00')])
+        rows = self.top(metric='profit', limit=4, **params)
+        self.assertEqual([row['name'] for row in rows], ['Steady', 'Small', 'Late', 'Loss'])
+        self.assertEqual(rows[-1]['total_profit'], '2.00')
+
+        for metric in ('quantity', 'revenue', 'profit'):
+            for limit in (1, 2, 3):
+                with self.subTest(metric=metric, limit=limit):
+                    self.assertEqual(
+                        self.ranking(self.top(metric=metric, limit=limit, **params), metric),
+                        self.expected(metric, limit, start=start, end=end, category=self.edge_category.pk),
+                    )
+
+    def test_rankings_match_the_raw_sales(self):
+        ranges = [
+            (None, None),
+            (self.first_day + timedelta(hours=6), self.first_day + timedelta(days=3, hours=12)),
+            (self.first_day + timedelta(days=2, hours=1), self.first_day + timedelta(days=2, hours=13)),
+            (self.first_day + timedelta(days=1), None),
+        ]
+        for start, end in ranges:
+            params = {}
+            if start is not None:
+                params['start_date'] = start.isoformat()
+            if end is not None:
+                params['end_date'] = end.isoformat()
+            for metric in ('quantity', 'revenue', 'profit'):
+                for by in ('product', 'category'):
+                    with self.subTest(start=start, end=end, metric=metric, by=by):
+                        rows = self.top(metric=metric, limit=3, group_by=by, **params)
+                        self.assertEqual(self.ranking(rows, metric, by), self.expected(metric, 3, by, start, end))
+
+    def test_other_owners_sales_are_left_out(self):
+        product_ids = {row['product_id'] for row in self.top(limit=100)}
+        self.assertNotIn(self.other_product.pk, product_ids)
+        response = self.client.get('/shop/api/analytics/top-products/', {'shop': self.other_shop.pk})
+        self.assertEqual(response.status_code, 400)
+
+
+class CatalogCacheTests(ShopAPITestCase):
+    """
+    Catalog reads carry an ETag per caller, URL and catalog version; every
+    write that can change them moves the ETag on.
+    """
+
+    def setUp(self):
+        super().setUp()
+        cache.clear()
+
+    def etag(self, url):
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        return response['ETag']
+
+    def assertETagChangedBy(self, url, change):
+        etag = self.etag(url)
+        with self.captureOnCommitCallbacks(execute=True):
+            change()
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+
+    def test_a_matching_etag_is_not_modified(self):
+        for url in ('/shop/api/products/', f'/shop/api/products/{self.products[0].pk}/'):
+            with self.subTest(url=url):
+                etag = self.etag(url)
+                response = self.client.get(url, HTTP_IF_NONE_MATCH=f'"other", {etag}')
+                self.assertEqual(response.status_code, 304)
+                self.assertEqual(response['ETag'], etag)
+
+    def test_a_wildcard_does_not_hide_missing_or_foreign_products(self):
+        other = User.objects.create_user('bob', 'bob@example.com', 'password')
+        foreign = Product.objects.create(
+            name='Elsewhere', price=Decimal('1.00'), shop=Shop.objects.create(name='Other Shop', owner=other)
+        )
+        for pk in (foreign.pk, foreign.pk + 1000):
+            with self.subTest(pk=pk):
+                response = self.client.get(f'/shop/api/products/{pk}/', HTTP_IF_NONE_MATCH='*')
+                self.assertEqual(response.status_code, 404)
+
+    def test_product_saves_change_the_etag(self):
+        product = self.products[0]
+        self.assertETagChangedBy('/shop/api/products/', lambda: self.client.patch(
+            f'/shop/api/products/{product.pk}/', {'name': 'Renamed'}, format='json'
+        ))
+
+    def test_checkouts_change_the_etag(self):
+        self.assertETagChangedBy(
+            f'/shop/api/products/{self.products[0].pk}/', lambda: self.checkout(self.products[:1])
+        )
+
+    def test_category_renames_change_the_etag(self):
+        url = '/shop/api/products/'
+        self.assertETagChangedBy(url, lambda: self.client.patch(
+            f'/shop/api/product-categories/{self.category.pk}/', {'name': 'Crisps'}, format='json'
+        ))
+        self.assertEqual(self.client.get(url).data['results'][0]['category_name'], 'Crisps')
+
+    def test_callers_do_not_share_etags_or_responses(self):
+        url = '/shop/api/products/'
+        etag = self.etag(url)
+        other = User.objects.create_user('bob', 'bob@example.com', 'password')
+        Product.objects.create(
+            name='Elsewhere', price=Decimal('1.00'), shop=Shop.objects.create(name='Other Shop', owner=other)
+        )
+        self.client.force_authenticate(other)
+
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+        self.assertEqual([row['name'] for row in response.data['results']], ['Elsewhere'])
+
+
+class CursorPaginationTests(ShopAPITestCase):
+    """
+    Rows inserted while a client pages through a list don't repeat or skip
+    the rows it hasn't read yet.
+    """
+
+    def setUp(self):
+        super().setUp()
+        cache.clear()
+
+    def walk(self, url, params, between_pages=None):
+        rows = []
+        response = self.client.get(url, params)
+        while True:
+            self.assertEqual(response.status_code, 200)
+            rows.extend(response.data['results'])
+            if between_pages is not None:
+                between_pages()
+                between_pages = None
+            if not response.data['next']:
+                return rows
+            response = self.client.get(response.data['next'])
+
+    def test_sales_inserted_while_paging(self):
+        now = timezone.now()
+        sales = Sale.objects.bulk_create([
+            Sale(shop=self.shop, receipt_number=f'seed-{i}') for i in range(10)
+        ])
+        for i, sale in enumerate(sales):
+            sale.sale_date = now - timedelta(minutes=i)
+        Sale.objects.bulk_update(sales, ['sale_date'])
+
+        def insert():
+            # Newer than the first page, so they sort before the cursor
+            for _ in range(3):
+                Sale.objects.create(shop=self.shop)
+
+        rows = self.walk('/shop/api/sales/', {'page_size': 4}, insert)
+
+        self.assertEqual([row['id'] for row in rows], [sale.pk for sale in sales])
+
+    def test_products_inserted_while_paging(self):
+        def insert():
+            for name in ('Product 00a', 'Product 10a'):
+                Product.objects.create(name=name, price=Decimal('1.00'), shop=self.shop)
+
+        rows = self.walk('/shop/api/products/', {'page_size': 5}, insert)
+
+        # Only the product after the cursor shows up, and nothing is read twice
+        expected = [product.name for product in self.products]
+        expected.insert(expected.index('Product 10') + 1, 'Product 10a')
+        self.assertEqual([row['name'] for row in rows], expected)
+
+
+class ProductSearchTests(ShopAPITestCase):
+    """
+    Search keeps up with product writes through the index triggers (the FTS5
+    table on SQLite, search_vector on PostgreSQL).
+    """
+
+    def setUp(self):
+        super().setUp()
+        cache.clear()
+        self.drinks = ProductCategory.objects.create(name='Beverages', shop=self.shop)
+
+    def create(self, name, **fields):
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post('/shop/api/products/', {
+                'name': name, 'price': '2.00', 'shop': self.shop.pk, **fields,
+            }, format='json')
+        self.assertEqual(response.status_code, 201, response.content)
+        return response.data['id']
+
+    def search(self, text):
+        response = self.client.get('/shop/api/products/search/', {'q': text})
+        self.assertEqual(response.status_code, 200)
+        return [row['name'] for row in response.data]
+
+    def test_prefixes_match(self):
+        self.create('Chocolate Bar')
+        self.assertEqual(self.search('choc'), ['Chocolate Bar'])
+        self.assertEqual(self.search('chocolate ba'), ['Chocolate Bar'])
+
+    def test_category_names_match(self):
+        self.create('Lemon Fizz', category=self.drinks.pk)
+        self.assertEqual(self.search('bever'), ['Lemon Fizz'])
+
+    def test_name_matches_rank_first(self):
+        self.create('Lemonade', description='Tastes a little like cola')
+        self.create('Cola Classic')
+        self.assertEqual(self.search('cola'), ['Cola Classic', 'Lemonade'])
+
+    def test_renames_and_deletes_reach_the_index(self):
+        product_id = self.create('Ginger Beer')
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.patch(f'/shop/api/products/{product_id}/', {'name': 'Root Beer'}, format='json')
+        self.assertEqual(self.search('ginger'), [])
+        self.assertEqual(self.search('root'), ['Root Beer'])
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.assertEqual(self.client.delete(f'/shop/api/products/{product_id}/').status_code, 204)
+        self.assertEqual(self.search('root'), [])
+
+    def test_bulk_imports_are_found(self):
+        self.create('Iced Tea')
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post('/shop/api/products/bulk/', {'shop': self.shop.pk, 'products': [
+                {'name': 'Iced Tea', 'price': '2.50', 'description': 'Peach flavoured'},
+                {'name': 'Kombucha', 'price': '4.00', 'category': 'Beverages'},
+            ]}, format='json')
+        self.assertEqual((response.data['created'], response.data['updated']), (1, 1))
+
+        self.assertEqual(self.search('peach'), ['Iced Tea'])
+        self.assertEqual(self.search('kombu'), ['Kombucha'])
+        self.assertEqual(self.search('beverages'), ['Kombucha'])
+
+
+class CodeLookupTests(ShopAPITestCase):
+    """
+    Scanner lookups are served from the in-process LRU until the catalog
+    version of the shop moves on.
+    """
+
+    def setUp(self):
+        super().setUp()
+        cache.clear()
+        code_cache.entries.clear()
+        self.product = self.products[0]
+        Product.objects.filter(pk=self.product.pk).update(sku='SKU-1', barcode='4000001')
+
+    def product_queries(self, url):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(url)
+        return response, [query for query in queries if 'FROM "shop_product"' in query['sql']]
+
+    def test_hits_and_misses_are_cached(self):
+        for url, status in (('/shop/api/products/by-code/SKU-1/', 200), ('/shop/api/products/by-code/NOPE/', 404)):
+            with self.subTest(url=url):
+                response, queries = self.product_queries(url)
+                self.assertEqual((response.status_code, len(queries)), (status, 1))
+                response, queries = self.product_queries(url)
+                self.assertEqual((response.status_code, len(queries)), (status, 0))
+
+        response = self.client.get('/shop/api/products/by-code/4000001/')
+        self.assertEqual(response.data['id'], self.product.pk)
+
+    def test_product_updates_invalidate_cached_codes(self):
+        self.assertEqual(self.client.get('/shop/api/products/by-code/SKU-1/').data['price'], '10.00')
+        self.assertEqual(self.client.get('/shop/api/products/by-code/SKU-9/').status_code, 404)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.patch(
+                f'/shop/api/products/{self.product.pk}/', {'sku': 'SKU-9', 'price': '12.00'}, format='json'
+            )
+
+        self.assertEqual(self.client.get('/shop/api/products/by-code/SKU-1/').status_code, 404)
+        self.assertEqual(self.client.get('/shop/api/products/by-code/SKU-9/').data['price'], '12.00')
+
+    def test_codes_shared_by_several_shops_need_a_shop(self):
+        other = Shop.objects.create(name='Second Shop', owner=self.user)
+        Product.objects.create(name='Twin', price=Decimal('1.00'), sku='SKU-1', shop=other)
+
+        self.assertEqual(self.client.get('/shop/api/products/by-code/SKU-1/').status_code, 400)
+        response = self.client.post('/shop/api/products/by-code/', {'codes': ['SKU-1', '4000001']}, format='json')
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.data['ambiguous'], ['SKU-1'])
+
+        response = self.client.post(
+            '/shop/api/products/by-code/', {'shop': self.shop.pk, 'codes': ['SKU-1', 'NOPE']}, format='json'
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['products']['SKU-1']['id'], self.product.pk)
+        self.assertEqual(response.data['missing'], ['NOPE'])
+
+
+class SparseFieldsTests(ShopAPITestCase):
+    """
+    ?fields= and ?omit= narrow list rows the same way on the fast path and the
+    serializer path, and survive cursor links.
+    """
+
+    def setUp(self):
+        super().setUp()
+        cache.clear()
+
+    def keys(self, url, params):
+        response = self.client.get(url, params)
+        self.assertEqual(response.status_code, 200, response.content)
+        return list(response.data['results'][0])
+
+    def test_fields_and_omit(self):
+        self.assertEqual(self.keys('/shop/api/products/', {'fields': 'name,id'}), ['id', 'name'])
+        self.assertEqual(self.keys('/shop/api/products/', {'fields': ['id', 'price']}), ['id', 'price'])
+
+        everything = self.keys('/shop/api/products/', {})
+        narrowed = self.keys('/shop/api/products/', {'omit': 'description,category_name'})
+        self.assertEqual(narrowed, [name for name in everything if name not in ('description', 'category_name')])
+
+    def test_unknown_fields_are_rejected(self):
+        for params, param in (({'fields': 'id,bogus'}, 'fields'), ({'omit': 'bogus'}, 'omit')):
+            with self.subTest(params=params):
+                response = self.client.get('/shop/api/products/', params)
+                self.assertEqual(response.status_code, 400)
+                self.assertEqual(list(response.data), [param])
+
+        response = self.client.get('/shop/api/sales/', {'fields': 'id', 'omit': 'id'})
+        self.assertEqual(response.status_code, 400)
+
+    def test_fast_path_and_serializer_agree(self):
+        self.checkout(self.products[:3])
+        for url, params in (
+            ('/shop/api/products/', {'fields': 'id,name,category_name,price'}),
+            ('/shop/api/products/', {'omit': 'description'}),
+            ('/shop/api/sales/', {}),
+            ('/shop/api/sales/', {'fields': 'receipt_number,total_sales'}),
+            ('/shop/api/sale-items/', {'fields': 'id,receipt_number,product_price'}),
+        ):
+            with self.subTest(url=url, params=params):
+                fast = self.client.get(url, params).data['results']
+                cache.clear()
+                with mock.patch.object(ValuesSerializer, 'for_serializer', return_value=None):
+                    serialized = self.client.get(url, params).data['results']
+                self.assertEqual(json.loads(JSONRenderer().render(fast)), json.loads(JSONRenderer().render(serialized)))
+
+    def test_cursor_links_keep_the_fields(self):
+        response = self.client.get('/shop/api/products/', {'fields': 'id,name', 'page_size': 5})
+        pages = 1
+        while response.data['next']:
+            response = self.client.get(response.data['next'])
+            pages += 1
+            self.assertEqual(list(response.data['results'][0]), ['id', 'name'])
+        self.assertEqual(pages, 4)
+
+
+class AsyncListTests(ShopAPITestCase):
+    """
+    The async product and sale lists return the same pages as the viewsets.
+    """
+
+    def setUp(self):
+        super().setUp()
+        cache.clear()
+        self.token = Token.objects.create(user=self.user)
+
+    def pages(self, url, params, **headers):
+        pages = []
+        response = self.client.get(url, params, **headers)
+        while True:
+            self.assertEqual(response.status_code, 200, response.content)
+            body = json.loads(response.content)
+            pages.append(body['results'])
+            if not body['next']:
+                return pages
+            response = self.client.get(body['next'], **headers)
+
+    def test_same_pages_as_the_viewsets(self):
+        now = timezone.now()
+        sales = [self.checkout(self.products[i:i + 2]) for i in range(7)]
+        # Two sales share a date, so the cursor has to step through a tie
+        for i, sale in enumerate(sales):
+            sale.sale_date = now - timedelta(minutes=min(i, 5))
+        Sale.objects.bulk_update(sales, ['sale_date'])
+
+        for name, params in (
+            ('products', {'page_size': 6}),
+            ('products', {'page_size': 6, 'ordering': 'updated'}),
+            ('sales', {'page_size': 3}),
+        ):
+            with self.subTest(name=name, params=params):
+                expected = self.pages(f'/shop/api/{name}/', params)
+                self.assertGreater(len(expected), 2)
+                self.assertEqual(
+                    self.pages(f'/shop/api/async/{name}/', params, HTTP_AUTHORIZATION=f'Token {self.token.key}'),
+                    expected,
+                )
+
+    def test_no_count_or_offset(self):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get('/shop/api/async/sales/', HTTP_AUTHORIZATION=f'Token {self.token.key}')
+        self.assertEqual(response.status_code, 200)
+        self.assertNotIn('count', json.loads(response.content))
+        sql = ' '.join(query['sql'] for query in queries.captured_queries)
+        self.assertNotIn('COUNT(', sql.upper())
+        self.assertNotIn('OFFSET', sql.upper())
+
+    def test_invalid_cursor(self):
+        response = self.client.get('/shop/api/async/products/', {'cursor': 'bogus'},
+                                   HTTP_AUTHORIZATION=f'Token {self.token.key}')
+        self.assertEqual(response.status_code, 404)
+
+
+class ProductImportTests(ShopAPITestCase):
+    """
+    POST /products/bulk/ upserts on (shop, name) and reports bad rows without
+    dropping the good ones.
+    """
+
+    def setUp(self):
+        super().setUp()
+        self.other_user = User.objects.create_user('bob', 'bob@example.com', 'password')
+        self.other_shop = Shop.objects.create(name='Other Shop', owner=self.other_user)
+        self.other_category = ProductCategory.objects.create(name='Drinks', shop=self.other_shop)
+
+    def bulk(self, rows, shop=None):
+        return self.client.post('/shop/api/products/bulk/', {
+            'shop': (shop or self.shop).pk, 'products': rows,
+        }, format='json')
+
+    def test_upsert_on_name(self):
+        existing = self.products[0]
+        response = self.bulk([
+            {'name': existing.name, 'price': '12.50'},
+            {'name': 'Brand new', 'price': '3.00', 'inventory': 4, 'category': 'Snacks'},
+        ])
+        self.assertEqual(response.status_code, 200, response.content)
+        self.assertEqual(response.data, {'created': 1, 'updated': 1, 'errors': []})
+
+        existing.refresh_from_db()
+        self.assertEqual(existing.price, Decimal('12.50'))
+        # Optional fields the row left out are not overwritten
+        self.assertEqual(
+            (existing.inventory, existing.mrp, existing.category_id), (1000, Decimal('7.00'), self.category.pk)
+        )
+        created = Product.objects.get(shop=self.shop, name='Brand new')
+        self.assertEqual((created.inventory, created.category_id), (4, self.category.pk))
+        self.assertEqual(Product.objects.filter(shop=self.shop).count(), self.product_count + 1)
+
+        # The same name in another shop is another product
+        self.client.force_authenticate(self.other_user)
+        self.assertEqual(self.bulk([{'name': existing.name, 'price': '1.00'}], shop=self.other_shop).data['created'], 1)
+
+    def test_row_errors_keep_the_valid_rows(self):
+        rows = [
+            {'name': 'Good 1', 'price': '1.00'},
+            {'name': 'No price'},
+            {'name': 'Good 2', 'price': '2.00', 'inventory': 3},
+            {'name': 'Negative', 'price': '1.00', 'inventory': -1},
+            {'name': 'Good 3', 'price': '3.00'},
+        ]
+        result = import_products(self.shop, rows, batch_size=2)
+        self.assertEqual((result['created'], result['updated']), (3, 0))
+        self.assertEqual([error['row'] for error in result['errors']], [1, 3])
+        self.assertIn('price', result['errors'][0]['errors'])
+        self.assertIn('inventory', result['errors'][1]['errors'])
+        self.assertEqual(
+            set(Product.objects.filter(name__startswith='Good').values_list('name', flat=True)),
+            {'Good 1', 'Good 2', 'Good 3'},
+        )
+        self.assertFalse(Product.objects.filter(name__in=['No price', 'Negative']).exists())
+
+    def test_one_movement_per_changed_product(self):
+        unchanged, restocked, _ = self.products[:3]
+        response = self.bulk([
+            {'name': unchanged.name, 'price': '10.00', 'inventory': 1000},
+            {'name': restocked.name, 'price': '10.00', 'inventory': 900},
+            # A later row for the same name wins
+            {'name': restocked.name, 'price': '10.00', 'inventory': 1200},
+            {'name': 'Price only', 'price': '1.00'},
+            {'name': 'Stocked', 'price': '1.00', 'inventory': 6},
+        ])
+        self.assertEqual(response.status_code, 200, response.content)
+
+        movements = InventoryMovement.objects.filter(kind=InventoryMovement.IMPORT)
+        self.assertEqual(
+            sorted(movements.values_list('product__name', 'quantity')),
+            [(restocked.name, 200), ('Stocked', 6)],
+        )
+        restocked.refresh_from_db()
+        self.assertEqual(restocked.inventory, 1200)
+
+    def test_categories_of_other_shops_are_rejected(self):
+        response = self.bulk([
+            {'name': 'Cola', 'price': '1.00', 'category': 'Drinks'},
+            {'name': 'Crisps', 'price': '1.00', 'category': 'Snacks'},
+        ])
+        self.assertEqual(response.status_code, 200, response.content)
+        self.assertEqual(response.data['created'], 1)
+        self.assertEqual(response.data['errors'], [{'row': 0, 'errors': {'category': ["Unknown category Drinks."]}}])
+        self.assertFalse(Product.objects.filter(category=self.other_category).exists())
+
+        response = self.bulk([{'name': 'Cola', 'price': '1.00'}], shop=self.other_shop)
+        self.assertEqual(response.status_code, 400)
+        self.assertFalse(Product.objects.filter(shop=self.other_shop).exists())
+
+
+class InventoryAdjustmentTests(ShopAPITestCase):
+    """
+    POST /products/adjust-inventory/ changes many products with one locked
+    read and one UPDATE, all or nothing.
+    """
+
+    def adjust(self, adjustments, shop=None, **data):
+        return self.client.post('/shop/api/products/adjust-inventory/', {
+            'shop': (shop or self.shop).pk, 'adjustments': adjustments, **data,
+        }, format='json')
+
+    def test_locks_in_id_order_and_updates_once(self):
+        products = sorted(self.products[:5], key=lambda product: -product.pk)
+        with CaptureQueriesContext(connection) as queries:
+            response = self.adjust([{'product': product.pk, 'delta': -1} for product in products])
+        self.assertEqual(response.status_code, 200, response.content)
+
+        # Besides the low-stock check, which filters on reorder_level
+        selects = [query['sql'] for query in queries.captured_queries if query['sql'].startswith('SELECT')
+                   and 'FROM "shop_product"' in query['sql'] and 'reorder_level' not in query['sql'].split('WHERE')[1]]
+        self.assertEqual(len(selects), 1)
+        # Every writer locks the rows in the same order, so two adjustments can't deadlock
+        self.assertIn('ORDER BY "shop_product"."id" ASC', selects[0])
+        if connection.features.has_select_for_update:
+            self.assertIn('FOR UPDATE', selects[0])
+        updates = [query['sql'] for query in queries.captured_queries
+                   if query['sql'].startswith('UPDATE "shop_product" SET "inventory"')]
+        self.assertEqual(len(updates), 1)
+        adjusted = Product.objects.filter(pk__in=[product.pk for product in products])
+        self.assertEqual(set(adjusted.values_list('inventory', flat=True)), {999})
+
+    def test_ledger_rows(self):
+        first, second, third = self.products[:3]
+        response = self.adjust([
+            {'product': first.pk, 'delta': 5},
+            {'product': second.pk, 'absolute': 950},
+            # Applied in order: +5, then -2
+            {'product': first.pk, 'delta': -2},
+            {'product': third.pk, 'absolute': 1000},
+        ], reason='Stock take')
+        self.assertEqual(response.status_code, 200, response.content)
+        self.assertEqual(response.data['products'], [
+            {'product': first.pk, 'inventory': 1003},
+            {'product': second.pk, 'inventory': 950},
+            {'product': third.pk, 'inventory': 1000},
+        ])
+
+        movements = InventoryMovement.objects.filter(kind=InventoryMovement.ADJUSTMENT)
+        self.assertEqual(
+            sorted(movements.values_list('product_id', 'quantity', 'reason', 'user_id')),
+            sorted([(first.pk, 3, 'Stock take', self.user.pk), (second.pk, -50, 'Stock take', self.user.pk)]),
+        )
+
+    def test_results_below_zero_are_rejected(self):
+        first, second = self.products[:2]
+        response = self.adjust([
+            {'product': first.pk, 'delta': -10},
+            {'product': second.pk, 'delta': -1001},
+        ])
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.data['adjustments'], [f"Not enough inventory for product {second.name}."])
+        self.assertEqual(
+            set(Product.objects.filter(pk__in=[first.pk, second.pk]).values_list('inventory', flat=True)), {1000}
+        )
+        self.assertFalse(InventoryMovement.objects.exists())
+
+        self.assertEqual(self.adjust([{'product': first.pk, 'absolute': -1}]).status_code, 400)
+        self.assertEqual(self.adjust([{'product': first.pk, 'delta': 1, 'absolute': 1}]).status_code, 400)
+
+    def test_foreign_products_are_rejected(self):
+        other_user = User.objects.create_user('bob', 'bob@example.com', 'password')
+        other_shop = Shop.objects.create(name='Other Shop', owner=other_user)
+        foreign = Product.objects.create(name='Cola', price=Decimal('1.00'), inventory=10, shop=other_shop)
+
+        response = self.adjust([
+            {'product': self.products[0].pk, 'delta': 1},
+            {'product': foreign.pk, 'delta': 1},
+        ])
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.data['adjustments'], [f"Invalid product {foreign.pk} for this shop."])
+        self.assertEqual(self.adjust([{'product': foreign.pk, 'delta': 1}], shop=other_shop).status_code, 400)
+
+        foreign.refresh_from_db()
+        self.products[0].refresh_from_db()
+        self.assertEqual((foreign.inventory, self.products[0].inventory), (10, 1000))
+        self.assertFalse(InventoryMovement.objects.exists())
+
+
+class IndexPlanTests(TestCase):
+    """
+    The tenant-scoped filters of the viewsets are answered from their composite
+    indexes rather than by scanning every shop's rows.
+    """
+    shops = 4
+    rows_per_shop = 250
+
+    @classmethod
+    def setUpTestData(cls):
+        shops = Shop.objects.bulk_create([
+            Shop(name=f'Shop {i}', owner=User.objects.create_user(f'owner{i}', f'owner{i}@example.com'))
+            for i in range(cls.shops)
+        ])
+        now = timezone.now()
+        products = Product.objects.bulk_create([
+            Product(name=f'Product {i}', price=Decimal('10.00'), inventory=i % 50, shop=shop)
+            for shop in shops for i in range(cls.rows_per_shop)
+        ])
+        sales = Sale.objects.bulk_create([
+            Sale(shop=shop, receipt_number=f'{shop.pk}-{i:08d}') for shop in shops for i in range(cls.rows_per_shop)
+        ])
+        Sale.objects.update(sale_date=now)
+        SaleItem.objects.bulk_create([
+            SaleItem(sale=sale, product=product, quantity=1, unit_price=product.price)
+            for sale, product in zip(sales, products)
+        ])
+        DailyProductSales.objects.bulk_create([
+            DailyProductSales(shop=product.shop, product=product, day=(now - timedelta(days=i % 30)).date())
+            for i, product in enumerate(products)
+        ])
+        cls.shop = shops[0]
+        cls.product = products[0]
+        cls.since = now - timedelta(days=7)
+        with connection.cursor() as cursor:
+            cursor.execute('ANALYZE')
+
+    def assertUsesIndex(self, queryset, index_name):
+        if connection.vendor == 'postgresql':
+            # Tables this small would otherwise always be read sequentially
+            with connection.cursor() as cursor:
+                cursor.execute('SET LOCAL enable_seqscan = off')
+        plan = queryset.explain()
+        self.assertIn(index_name, plan)
+
+    def test_sales_by_shop_and_date(self):
+        self.assertUsesIndex(
+            Sale.objects.filter(shop_id__in=[self.shop.pk], sale_date__gte=self.since).order_by('-sale_date', '-id'),
+            'shop_sale_shop_date_idx',
+        )
+
+    def test_products_by_shop_and_inventory(self):
+        self.assertUsesIndex(
+            Product.objects.filter(shop_id__in=[self.shop.pk], inventory__lte=5), 'shop_product_shop_inv_idx'
+        )
+
+    def test_products_by_shop_and_added_at(self):
+        self.assertUsesIndex(
+            Product.objects.filter(shop_id__in=[self.shop.pk], added_at__gte=self.since), 'shop_product_shop_added_idx'
+        )
+
+    def test_sale_items_by_product_and_sale_date(self):
+        self.assertUsesIndex(
+            SaleItem.objects.filter(product_id=self.product.pk, sale__sale_date__gte=self.since)
+            .values('quantity', 'unit_price'),
+            'shop_saleitem_prod_sale_idx',
+        )
+
+    def test_daily_sales_by_shop_and_day(self):
+        self.assertUsesIndex(
+            DailyProductSales.objects.filter(shop_id__in=[self.shop.pk], day__gte=self.since.date()),
+            'shop_dailysales_shop_day_idx',
+        )
+
+    def test_products_sold_for_a_tenant(self):
+        # The querysets ProductSoldViewSet runs, edges included, for one of several tenants
+        request = Request(RequestFactory().get('/shop/api/products-sold/'))
+        request.user = self.shop.owner
+        view = ProductSoldViewSet(request=request, format_kwarg=None)
+        product_ids = [self.product.pk]
+        querysets = product_sales_querysets(
+            view.get_queryset().filter(product_id__in=product_ids),
+            DailyProductSales.objects.filter(shop_id__in=user_shop_ids(request), product_id__in=product_ids),
+            self.since - timedelta(hours=3), timezone.now(),
+        )
+
+        self.assertEqual(len(querysets), 2)
+        self.assertIn('"shop_id" IN', str(querysets[1].query))
+        self.assertNoFullScan(querysets[0], 'shop_dailyproductsales')
+        self.assertNoFullScan(querysets[1], 'shop_saleitem', 'shop_sale')
+
+    def assertNoFullScan(self, queryset, *tables):
+        if connection.vendor == 'postgresql':
+            with connection.cursor() as cursor:
+                cursor.execute('SET LOCAL enable_seqscan = off')
+        plan = queryset.explain()
+        for table in tables:
+            # "Seq Scan on" on PostgreSQL, a bare "SCAN" (table or whole index) on SQLite
+            self.assertNotRegex(plan, rf'(Seq Scan on|\bSCAN) {table}\b')
+
+    @skipUnless(connection.vendor == 'postgresql', 'pg_trgm indexes are PostgreSQL only')
+    def test_product_name_contains(self):
+        self.assertUsesIndex(
+            Product.objects.filter(shop_id__in=[self.shop.pk], name__icontains='duct 12'),
+            'shop_product_name_trgm_idx',
+        )
+
+
+class QueryBudgetTests(TestCase):
+    """
+    Fixed query counts per endpoint on shops with hundreds of rows, so that a
+    serializer reading a relation per row fails here instead of in production.
+    """
+    rows = 200
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('alice', 'alice@example.com', 'password')
+        other = User.objects.create_user('bob', 'bob@example.com', 'password')
+        cls.shop = Shop.objects.create(name='Corner Shop', owner=cls.user)
+        other_shop = Shop.objects.create(name='Other Shop', owner=other)
+        categories = ProductCategory.objects.bulk_create([
+            ProductCategory(name=f'Category {i}', shop=shop) for shop in (cls.shop, other_shop) for i in range(10)
+        ])
+        products = Product.objects.bulk_create([
+            Product(
+                name=f'Product {i:03d}', price=Decimal('10.00'), mrp=Decimal('7.00'), inventory=1000,
+                shop=category.shop, category=category,
+            )
+            for i, category in enumerate(categories * (cls.rows // 10))
+        ])
+        sales = Sale.objects.bulk_create([
+            Sale(shop=product.shop, receipt_number=f'seed-{i}', total_amount=Decimal('20.00'))
+            for i, product in enumerate(products)
+        ])
+        SaleItem.objects.bulk_create([
+            SaleItem(sale=sale, product=product, quantity=2, unit_price=product.price, unit_mrp=product.mrp)
+            for sale, product in zip(sales, products)
+        ])
+        cls.product = products[0]
+        cls.sale = sales[0]
+        cls.sale_item = cls.sale.items.get()
+
+    def setUp(self):
+        # Catalog responses are cached across requests
+        cache.clear()
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def assertQueries(self, count, method, url, data=None, status=200):
+        with self.assertNumQueries(count):
+            if method == 'get':
+                response = self.client.get(url, data)
+            else:
+                response = getattr(self.client, method)(url, data, format='json')
+        self.assertEqual(response.status_code, status, response.content)
+        return response
+
+    def test_product_list(self):
+        response = self.assertQueries(2, 'get', '/shop/api/products/', {'page_size': 100})
+        self.assertEqual(len(response.data['results']), 100)
+
+    def test_product_retrieve(self):
+        self.assertQueries(2, 'get', f'/shop/api/products/{self.product.pk}/')
+
+    def test_product_create(self):
+        # Opening stock is recorded in the inventory ledger, in the same transaction;
+        # without a reorder_level there is no low-stock check
+        self.assertQueries(7, 'post', '/shop/api/products/', {
+            'name': 'New product', 'price': '1.00', 'inventory': 5, 'shop': self.shop.pk,
+        }, status=201)
+
+    def test_sale_list(self):
+        response = self.assertQueries(2, 'get', '/shop/api/sales/?page_size=100')
+        self.assertEqual(len(response.data['results']), 100)
+
+    def test_sale_retrieve(self):
+        self.assertQueries(2, 'get', f'/shop/api/sales/{self.sale.pk}/')
+
+    def test_sale_create(self):
+        self.assertQueries(9, 'post', '/shop/api/sales/', {'shop': self.shop.pk}, status=201)
+
+    def test_sale_item_list(self):
+        response = self.assertQueries(2, 'get', '/shop/api/sale-items/?page_size=100')
+        self.assertEqual(len(response.data['results']), 100)
+
+    def test_sale_item_retrieve(self):
+        self.assertQueries(2, 'get', f'/shop/api/sale-items/{self.sale_item.pk}/')
+
+    def test_sale_item_create(self):
+        product = Product.objects.filter(shop=self.shop).exclude(saleitem__sale=self.sale).first()
+        self.assertQueries(17, 'post', '/shop/api/sale-items/', {
+            'sale': self.sale.pk, 'product': product.pk, 'quantity': 1,
+        }, status=201)
+
+
+class ExportTests(ShopAPITestCase):
+
+    def seed_sales(self, count):
+        start = Sale.objects.count()
+        Sale.objects.bulk_create([
+            Sale(shop=self.shop, receipt_number=f'seed-{i}', total_amount=Decimal('12.50'), item_count=1)
+            for i in range(start, start + count)
+        ], batch_size=1000)
+
+    def export_peak_memory(self, url):
+        """
+        Stream the whole export, returning (data rows, peak bytes allocated meanwhile).
+        """
+        tracemalloc.start()
+        try:
+            response = self.client.get(url)
+            self.assertEqual(response.status_code, 200)
+            lines = sum(chunk.count(b'\n') for chunk in response.streaming_content)
+            return lines - 1, tracemalloc.get_traced_memory()[1]
+        finally:
+            tracemalloc.stop()
+
+    def test_csv_is_the_default_whatever_the_accept_header(self):
+        self.seed_sales(3)
+        response = self.client.get('/shop/api/sales/export/', HTTP_ACCEPT='application/json')
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['Content-Type'], 'text/csv')
+        self.assertEqual(len(b''.join(response.streaming_content).splitlines()), 4)
+
+    def test_ndjson(self):
+        self.seed_sales(3)
+        response = self.client.get('/shop/api/sales/export/?format=ndjson')
+
+        self.assertEqual(response['Content-Type'], 'application/x-ndjson')
+        self.assertEqual(len(b''.join(response.streaming_content).splitlines()), 3)
+
+    def test_peak_memory_does_not_grow_with_the_export(self):
+        self.seed_sales(5000)
+        rows, small_peak = self.export_peak_memory('/shop/api/sales/export/')
+        self.assertEqual(rows, 5000)
+
+        self.seed_sales(20000)
+        rows, large_peak = self.export_peak_memory('/shop/api/sales/export/')
+        self.assertEqual(rows, 25000)
+        # Five times the rows may not cost more than a fraction more memory
+        self.assertLess(large_peak, small_peak * 1.5)
+
+
+class InventoryLedgerTests(ShopAPITestCase):
+    """
+    Every way stock can change leaves a movement, so the ledger adds up to the stock.
+    """
+
+    def assertLedgerMatchesStock(self, product):
+        product.refresh_from_db()
+        self.assertEqual(
+            sum(InventoryMovement.objects.filter(product=product).values_list('quantity', flat=True)),
+            product.inventory,
+        )
+
+    def test_sales_deletes_and_admin_edits(self):
+        response = self.client.post('/shop/api/products/', {
+            'name': 'Tea', 'price': '4.00', 'inventory': 50, 'shop': self.shop.pk,
+        }, format='json')
+        product = Product.objects.get(pk=response.data['id'])
+
+        sale = self.checkout([product], quantity=5)
+        self.assertLedgerMatchesStock(product)
+
+        self.assertEqual(self.client.delete(f'/shop/api/sales/{sale.pk}/').status_code, 204)
+        self.assertLedgerMatchesStock(product)
+        self.assertEqual(product.inventory, 50)
+
+        request = RequestFactory().post('/admin/')
+        request.user = self.user
+        product.inventory = 42
+        site._registry[Product].save_model(request, product, form=None, change=True)
+        self.assertLedgerMatchesStock(product)
+        self.assertEqual(product.inventory_movements.first().reason, 'Changed in admin')
+
+
+class RendererTests(ShopAPITestCase):
+    """
+    The list fast path and ORJSONRenderer send the same bytes as the
+    serializers and JSONRenderer they stand in for.
+    """
+
+    def assertSameJSON(self, data, rendered=None):
+        self.assertEqual(ORJSONRenderer().render(data if rendered is None else rendered), JSONRenderer().render(data))
+
+    def test_fast_path_matches_the_serializers(self):
+        self.checkout(self.products[:3], quantity=2)
+        request = Request(RequestFactory().get('/'))
+        request.user = self.user
+        for serializer_class, queryset in (
+            (ProductSerializer, Product.objects.select_related('category').order_by('pk')),
+            (SaleItemSerializer, SaleItem.objects.select_related('sale').order_by('pk')),
+        ):
+            with self.subTest(serializer=serializer_class.__name__):
+                context = {'request': request}
+                fast = ValuesSerializer.for_serializer(serializer_class(context=context))
+                self.assertSameJSON(
+                    serializer_class(queryset, many=True, context=context).data, fast.render(fast.values(queryset))
+                )
+
+    def test_floats_are_rendered_like_json_renderer(self):
+        for data in ({'big': 1.5e300, 'small': 1e-05}, {1.5e300: 'key'}, [{'nested': (0.1,)}], {'raw': Decimal('1.5e300')}):
+            with self.subTest(data=data):
+                self.assertSameJSON(data)
+
+        for value in (float('nan'), float('inf')):
+            with self.subTest(value=value), self.assertRaises(ValueError):
+                ORJSONRenderer().render({'value': value})
@@ -1,6 +1,8 @@
 from django.urls import path, include
 from rest_framework.routers import DefaultRouter
-from .views import ShopViewSet, ProductCategoryViewSet, ProductViewSet, SaleViewSet, SaleItemViewSet, ProductSoldViewSet
+from . import async_views
+from .views import ShopViewSet, ProductCategoryViewSet, ProductViewSet, SaleViewSet, SaleItemViewSet, ProductSoldViewSet, \
+    AnalyticsViewSet
 
 router = DefaultRouter()
 
@@ -11,7 +13,11 @@ router.register(r'products', ProductViewSet, basename='product')
 router.register(r'sales', SaleViewSet, basename='sale')
 router.register(r'sale-items', SaleItemViewSet, basename='saleitem')
 router.register(r'products-sold', ProductSoldViewSet, basename='productsold')
+router.register(r'analytics', AnalyticsViewSet, basename='analytics')
 
 urlpatterns = [
+    path('api/async/products/', async_views.product_list, name='async-product-list'),
+    path('api/async/sales/', async_views.sale_list, name='async-sale-list'),
+    path('api/async/products-sold/', async_views.products_sold, name='async-products-sold'),
     path('api/', include(router.urls)),
 ]
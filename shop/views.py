@@ -1,17 +1,33 @@
-from rest_framework import viewsets
+from rest_framework import mixins, viewsets, status
+from rest_framework.decorators import action
 from rest_framework.response import Response
-from .models import Shop, Product, ProductCategory, Sale, SaleItem
+from .models import Shop, Product, ProductCategory, Sale, SaleItem, DailyProductSales, InventoryMovement
 from .serializers import ShopSerializer, ProductCategorySerializer, ProductSerializer, \
-    SaleSerializer, SaleItemSerializer, ProductSoldSerializer
+    SaleSerializer, SaleListSerializer, SaleItemSerializer, ProductSoldSerializer, CheckoutSerializer, \
+    InventoryAdjustmentSerializer, SalesSeriesSerializer, TopSellerSerializer
 from .filters import ProductFilter, SaleFilter, SaleItemFilter
 from rest_framework.permissions import IsAuthenticated  # Assuming permission for authentication
-from .permissions import IsShopOwner  # Use IsShopOwner instead of CustomPermission
-from django.db.models import F, Sum, Subquery, OuterRef, ExpressionWrapper, DecimalField
+from .permissions import IsShopOwner, user_shop_ids  # Use IsShopOwner instead of CustomPermission
+from .reports import parse_bound, parse_ids, product_sales_totals, stock_at, daily_stock, sales_series, top_sellers, \
+    INTERVALS, BREAKDOWNS, RANKINGS
+from .cache import get_versions
+from .pagination import ProductCursorPagination, SaleCursorPagination, SaleItemCursorPagination
+from .mixins import CatalogCacheMixin, ExportMixin, SparseFieldsMixin, ValuesListMixin
+from .imports import import_products
+from .search import search_products
+from .codes import resolve_codes
+from activity.mixins import ActivityLoggingMixin
+from django.core.cache import cache
+from django.db.models import F
 from django.shortcuts import get_object_or_404
+from django.db import transaction
+from django.utils import timezone
+from datetime import timedelta
+import hashlib
 
 
 # View for Shop
-class ShopViewSet(viewsets.ModelViewSet):
+class ShopViewSet(ActivityLoggingMixin, viewsets.ModelViewSet):
     serializer_class = ShopSerializer
     permission_classes = [IsAuthenticated, IsShopOwner]
 
@@ -19,7 +35,7 @@ class ShopViewSet(viewsets.ModelViewSet):
         return Shop.objects.filter(owner=self.request.user)
 
 
-class ProductCategoryViewSet(viewsets.ModelViewSet):
+class ProductCategoryViewSet(CatalogCacheMixin, viewsets.ModelViewSet):
     """
     ViewSet for managing Product Categories.
     Only returns categories associated with the logged-in user's shop(s).
@@ -32,10 +48,17 @@ class ProductCategoryViewSet(viewsets.ModelViewSet):
         """
         Restrict queryset to categories belonging to the authenticated user's shop(s).
         """
-        user = self.request.user
-        if user.is_authenticated:
-            return ProductCategory.objects.filter(shop__owner=user)
-        return ProductCategory.objects.none()
+        return ProductCategory.objects.filter(shop_id__in=user_shop_ids(self.request))
+
+    def list(self, request, *args, **kwargs):
+        return self.cached_response(
+            request, lambda: super(ProductCategoryViewSet, self).list(request, *args, **kwargs)
+        )
+
+    def retrieve(self, request, *args, **kwargs):
+        return self.cached_response(
+            request, lambda: super(ProductCategoryViewSet, self).retrieve(request, *args, **kwargs)
+        )
 
     def get_serializer_context(self):
         """
@@ -46,15 +69,174 @@ class ProductCategoryViewSet(viewsets.ModelViewSet):
         return context
 
 
-class ProductViewSet(viewsets.ModelViewSet):
+class ProductViewSet(ActivityLoggingMixin, CatalogCacheMixin, SparseFieldsMixin, ValuesListMixin, viewsets.ModelViewSet):
     serializer_class = ProductSerializer
     filterset_class = ProductFilter
     permission_classes = [IsAuthenticated, IsShopOwner]
+    pagination_class = ProductCursorPagination
 
     def get_queryset(self):
-        return Product.objects.filter(shop__owner=self.request.user)
+        # ProductSerializer.category_name reads the category of every row
+        return Product.objects.filter(shop_id__in=user_shop_ids(self.request)).select_related('category')
 
     def list(self, request, *args, **kwargs):
+        return self.cached_response(request, lambda: self.list_products(request))
+
+    def retrieve(self, request, *args, **kwargs):
+        return self.cached_response(request, lambda: super(ProductViewSet, self).retrieve(request, *args, **kwargs))
+
+    @transaction.atomic
+    def perform_create(self, serializer):
+        super().perform_create(serializer)
+        product = serializer.instance
+        if product.inventory:
+            self.record_adjustment(product, product.inventory)
+
+    @transaction.atomic
+    def perform_update(self, serializer):
+        previous = Product.objects.select_for_update().values_list('inventory', flat=True).get(pk=serializer.instance.pk)
+        super().perform_update(serializer)
+        product = serializer.instance
+        if product.inventory != previous:
+            self.record_adjustment(product, product.inventory - previous)
+
+    def record_adjustment(self, product, quantity):
+        InventoryMovement.objects.create(
+            shop_id=product.shop_id, product=product, kind=InventoryMovement.ADJUSTMENT,
+            quantity=quantity, user=self.request.user,
+        )
+
+    @action(detail=True, methods=['get'], url_path='stock-history')
+    def stock_history(self, request, pk=None):
+        """
+        Stock at a point in time (?at=) or closing stock per day between start_date and end_date.
+        """
+        product = self.get_object()
+        try:
+            at = parse_bound(request.query_params.get('at'))
+            start = parse_bound(request.query_params.get('start_date'))
+            end = parse_bound(request.query_params.get('end_date'))
+        except ValueError:
+            return Response({"error": "Invalid date."}, status=400)
+
+        if at is not None:
+            return Response({"product": product.pk, "at": at, "inventory": stock_at(product, at)})
+
+        last_day = timezone.localdate(end) if end else timezone.localdate()
+        first_day = timezone.localdate(start) if start else last_day - timedelta(days=29)
+        if first_day > last_day or (last_day - first_day).days > 366:
+            return Response({"error": "The date range must cover 1 to 367 days."}, status=400)
+
+        history = [{"day": day, "inventory": level} for day, level in daily_stock(product, first_day, last_day)]
+        return Response({"product": product.pk, "history": history})
+
+    @action(detail=False, methods=['get'])
+    def search(self, request):
+        """
+        Ranked search over product name, description and category for ?q=, with
+        prefix matching for type-ahead; ?shop narrows it to one shop.
+        """
+        text = request.query_params.get('q', '').strip()
+        if not text:
+            return Response({"error": "A search query is required."}, status=400)
+        try:
+            limit = min(int(request.query_params.get('limit', 20)), 100)
+        except ValueError:
+            return Response({"error": "Invalid limit."}, status=400)
+
+        shop_ids = user_shop_ids(request)
+        if request.query_params.get('shop'):
+            shop_ids = shop_ids & {int(request.query_params['shop'])} \
+                if request.query_params['shop'].isdigit() else frozenset()
+
+        return self.cached_response(request, lambda: Response(
+            self.get_serializer(search_products(shop_ids, text, max(limit, 1)), many=True).data
+        ))
+
+    def get_code_shop_ids(self, shop_id):
+        shop_ids = user_shop_ids(self.request)
+        if shop_id in (None, ''):
+            return shop_ids
+        try:
+            return shop_ids & {int(shop_id)}
+        except (TypeError, ValueError):
+            return frozenset()
+
+    def render_products(self, products):
+        return self.get_serializer(products, many=True).data
+
+    @action(detail=False, methods=['get'], url_path=r'by-code/(?P<code>[^/]+)')
+    def by_code(self, request, code=None):
+        """
+        The product with this SKU or barcode, for POS scanners. Pass ?shop when the
+        user runs several shops that may share codes.
+        """
+        shop_ids = self.get_code_shop_ids(request.query_params.get('shop'))
+        matches = [data for data in resolve_codes(shop_ids, [code], self.render_products).values() if data]
+        if not matches:
+            return Response({"error": "No product with this code."}, status=404)
+        if len(matches) > 1:
+            return Response({"error": "The code matches products in several shops; pass ?shop."}, status=400)
+        return Response(matches[0])
+
+    @action(detail=False, methods=['post'], url_path='by-code')
+    def by_codes(self, request):
+        """
+        Resolve a basket of scanned codes at once: {"shop": id, "codes": [...]}.
+        Like by-code, codes found in several of the user's shops need "shop".
+        """
+        codes = request.data.get('codes')
+        if not isinstance(codes, list) or not codes or len(codes) > 500:
+            return Response({"error": "A list of 1 to 500 codes is required."}, status=400)
+        codes = list(dict.fromkeys(str(code) for code in codes))
+        shop_ids = self.get_code_shop_ids(request.data.get('shop'))
+
+        matches = {}
+        for (shop_id, code), data in resolve_codes(shop_ids, codes, self.render_products).items():
+            if data is not None:
+                matches.setdefault(code, []).append(data)
+        ambiguous = [code for code in codes if len(matches.get(code, ())) > 1]
+        if ambiguous:
+            return Response(
+                {"error": "Some codes match products in several shops; pass shop.", "ambiguous": ambiguous},
+                status=400,
+            )
+        products = {code: matches[code][0] for code in codes if code in matches}
+        return Response({"products": products, "missing": [code for code in codes if code not in products]})
+
+    @action(detail=False, methods=['post'], url_path='bulk')
+    def bulk(self, request):
+        """
+        Create or update many products of one shop, matched on name.
+        """
+        shop_id = request.data.get('shop')
+        rows = request.data.get('products')
+        if not isinstance(rows, list):
+            return Response({"error": "A list of products is required."}, status=400)
+        try:
+            shop = Shop.objects.get(pk=shop_id, pk__in=user_shop_ids(request))
+        except (Shop.DoesNotExist, ValueError, TypeError):
+            return Response({"error": "Invalid shop."}, status=400)
+
+        result = import_products(shop, rows)
+        if result['created'] or result['updated']:
+            label = f"{result['created']} new and {result['updated']} existing products"
+            self.log_activity('imported', shop, label=label)
+        return Response(result)
+
+    @action(detail=False, methods=['post'], url_path='adjust-inventory')
+    def adjust_inventory(self, request):
+        """
+        Apply stock take or delivery changes to many products of one shop at once.
+        """
+        serializer = InventoryAdjustmentSerializer(data=request.data, context=self.get_serializer_context())
+        serializer.is_valid(raise_exception=True)
+        shop = serializer.save()
+        for product_id in serializer.changed:
+            self.log_activity('adjusted', shop, label=f"inventory of product #{product_id}")
+        return Response(serializer.data)
+
+    def list_products(self, request):
         queryset = self.get_queryset()
 
 
@@ -78,24 +260,33 @@ class ProductViewSet(viewsets.ModelViewSet):
 
         queryset = self.filter_queryset(queryset)
 
-        # Apply pagination
-        page = self.paginate_queryset(queryset)
-        if page is not None:
-            serializer = self.get_serializer(page, many=True)
-            return self.get_paginated_response(serializer.data)
-
+        # Pages are built from .values() rows rather than Product instances
+        return self.values_list_response(queryset)
 
-        serializer = self.get_serializer(queryset, many=True)
-        return Response(serializer.data)
 
-
-class SaleViewSet(viewsets.ModelViewSet):
+class SaleViewSet(ActivityLoggingMixin, ExportMixin, SparseFieldsMixin, ValuesListMixin, viewsets.ModelViewSet):
     serializer_class = SaleSerializer
     filterset_class = SaleFilter
     permission_classes = [IsAuthenticated, IsShopOwner]
+    pagination_class = SaleCursorPagination
+    export_fields = {
+        'id': 'id',
+        'receipt_number': 'receipt_number',
+        'shop': 'shop_id',
+        'sale_date': 'sale_date',
+        'total_amount': 'total_amount',
+        'total_cost': 'total_cost',
+        'item_count': 'item_count',
+    }
 
     def get_queryset(self):
-        return Sale.objects.filter(shop__owner=self.request.user)
+        return Sale.objects.filter(shop_id__in=user_shop_ids(self.request))
+
+    def get_serializer_class(self):
+        # The browsable API renders its POST form for the list with a cloned POST request
+        if self.action == 'list' and self.request.method == 'GET':
+            return SaleListSerializer
+        return super().get_serializer_class()
 
     def list(self, request, *args, **kwargs):
         queryset = self.filter_queryset(self.get_queryset())
@@ -109,93 +300,176 @@ class SaleViewSet(viewsets.ModelViewSet):
             queryset = queryset.filter(sale_date__lte=end_date)
 
 
-        product_price_subquery = Subquery(
-            Product.objects.filter(id=OuterRef('items__product_id')).values('price')[:1]
-        )
-        product_mrp_subquery = Subquery(
-            Product.objects.filter(id=OuterRef('items__product_id')).values('mrp')[:1]
-        )
-
-        total_profit_annotation = ExpressionWrapper(
-            product_price_subquery - product_mrp_subquery,
-            output_field=DecimalField()
-        )
-
-        aggregated_sales = queryset.annotate(
-            total_sales=Sum(product_price_subquery * F('items__quantity')),
-            total_profit=Sum(total_profit_annotation * F('items__quantity'))  # Calculate total profit
-        ).values('id', 'receipt_number', 'sale_date', 'total_sales', 'total_profit')
+        # Totals are maintained on the Sale row, so min_amount/max_amount are
+        # handled by SaleFilter as plain column filters
+        return self.values_list_response(queryset.annotate(
+            sales_total=F('total_amount'),
+            profit_total=F('total_amount') - F('total_cost'),
+        ))
 
-        min_amount = request.query_params.get('min_amount', None)
-        max_amount = request.query_params.get('max_amount', None)
-
-        if min_amount is not None:
-            aggregated_sales = aggregated_sales.filter(total_sales__gte=min_amount)
-        if max_amount is not None:
-            aggregated_sales = aggregated_sales.filter(total_sales__lte=max_amount)
-
-        # Apply pagination
-        page = self.paginate_queryset(aggregated_sales)
-        if page is not None:
-            return self.get_paginated_response(page)
-
-        return Response(list(aggregated_sales))
+    @action(detail=False, methods=['post'])
+    def checkout(self, request):
+        """
+        Create a Sale and all of its SaleItems from a single basket payload.
+        """
+        serializer = CheckoutSerializer(data=request.data, context=self.get_serializer_context())
+        serializer.is_valid(raise_exception=True)
+        sale = serializer.save()
+        self.log_activity('created', sale)
+        return Response(serializer.data, status=status.HTTP_201_CREATED)
 
 
-class SaleItemViewSet(viewsets.ModelViewSet):
+class SaleItemViewSet(ActivityLoggingMixin, ExportMixin, SparseFieldsMixin, ValuesListMixin, viewsets.ModelViewSet):
     serializer_class = SaleItemSerializer
     permission_classes = [IsAuthenticated, IsShopOwner]
     filterset_class = SaleItemFilter
+    pagination_class = SaleItemCursorPagination
+    export_fields = {
+        'id': 'id',
+        'sale': 'sale_id',
+        'receipt_number': 'sale__receipt_number',
+        'sale_date': 'sale__sale_date',
+        'product': 'product_id',
+        'quantity': 'quantity',
+        'unit_price': 'unit_price',
+        'unit_mrp': 'unit_mrp',
+    }
 
     def get_queryset(self):
-        return SaleItem.objects.filter(sale__shop__owner=self.request.user)
+        # SaleItemSerializer.receipt_number and IsShopOwner both go through the sale
+        return SaleItem.objects.filter(sale__shop_id__in=user_shop_ids(self.request)).select_related('sale')
+
+    def list(self, request, *args, **kwargs):
+        return self.values_list_response(self.filter_queryset(self.get_queryset()))
 
 
-class ProductSoldViewSet(viewsets.ModelViewSet):
+class ProductSoldViewSet(mixins.ListModelMixin, viewsets.GenericViewSet):
     """
-    ViewSet to return total quantity and total sales value for a product sold in a given time range.
+    ViewSet to return total quantity and total sales value for products sold in a given time range.
     """
 
     permission_classes = [IsAuthenticated, IsShopOwner]
     serializer_class = ProductSoldSerializer
+    max_products = 500
 
     def get_queryset(self):
-        """
-        This method is not necessary for aggregated data, so we'll handle aggregation in the list method.
-        """
-        return SaleItem.objects.all()
+        return SaleItem.objects.filter(sale__shop_id__in=user_shop_ids(self.request))
 
     def list(self, request, *args, **kwargs):
-        product_id = request.query_params.get('product')
+        # ?product=1,2 and ?product=1&product=2 both work
+        products = request.query_params.getlist('product')
         start_date = request.query_params.get('start_date')
         end_date = request.query_params.get('end_date')
 
-        if not product_id:
+        if not products:
             return Response({"error": "Product ID is required."}, status=400)
 
         try:
-            product_id = int(product_id)
+            product_ids = parse_ids(products)
         except ValueError:
             return Response({"error": "Invalid Product ID."}, status=400)
+        if not product_ids or len(product_ids) > self.max_products:
+            return Response({"error": f"Between 1 and {self.max_products} product IDs are allowed."}, status=400)
 
-        queryset = SaleItem.objects.filter(product_id=product_id)
+        try:
+            start = parse_bound(start_date)
+            end = parse_bound(end_date)
+        except ValueError:
+            return Response({"error": "Invalid date range."}, status=400)
+
+        # Whole days come from the DailyProductSales rollup, only partial edge days scan SaleItem;
+        # both sides are limited to the caller's shops, and each is read exactly once
+        aggregated_data = product_sales_totals(
+            self.get_queryset().filter(product_id__in=product_ids),
+            DailyProductSales.objects.filter(shop_id__in=user_shop_ids(request), product_id__in=product_ids),
+            start, end,
+        )
 
-        if start_date:
-            queryset = queryset.filter(sale__sale_date__gte=start_date)
-        if end_date:
-            queryset = queryset.filter(sale__sale_date__lte=end_date)
+        return Response(self.get_serializer(aggregated_data, many=True).data)
 
-        product_price_subquery = Subquery(
-            Product.objects.filter(id=OuterRef('product_id')).values('price')[:1]
-        )
 
-        aggregated_data = queryset.values('product_id').annotate(
-            total_quantity_sold=Sum('quantity'),
-            total_sales_value=Sum(F('quantity') * product_price_subquery)
-        )
+class AnalyticsViewSet(viewsets.ViewSet):
+    """
+    Aggregated reports over the sales of the user's shops.
+    """
+    permission_classes = [IsAuthenticated]
+
+    def get_shop_ids(self, request):
+        shop_ids = user_shop_ids(request)
+        shop_id = request.query_params.get('shop')
+        if not shop_id:
+            return shop_ids
+        try:
+            shop_id = int(shop_id)
+        except ValueError:
+            return None
+        return frozenset([shop_id]) if shop_id in shop_ids else None
 
-        if not aggregated_data:
-            return Response([])
+    @action(detail=False, methods=['get'])
+    def sales(self, request):
+        """
+        Revenue, profit, item and receipt counts bucketed by ?interval=hour|day|week|month,
+        optionally broken down with ?group_by=shop|category.
+        """
+        interval = request.query_params.get('interval', 'day')
+        group_by = request.query_params.get('group_by') or None
+        if interval not in INTERVALS:
+            return Response({"error": f"interval must be one of: {', '.join(INTERVALS)}."}, status=400)
+        if group_by is not None and group_by not in BREAKDOWNS:
+            return Response({"error": f"group_by must be one of: {', '.join(BREAKDOWNS)}."}, status=400)
 
-        return Response(aggregated_data)
+        shop_ids = self.get_shop_ids(request)
+        if shop_ids is None:
+            return Response({"error": "Invalid shop."}, status=400)
 
+        try:
+            start = parse_bound(request.query_params.get('start_date'))
+            end = parse_bound(request.query_params.get('end_date'))
+        except ValueError:
+            return Response({"error": "Invalid date range."}, status=400)
+
+        results = SalesSeriesSerializer(sales_series(shop_ids, interval, group_by, start, end), many=True).data
+        return Response({"interval": interval, "group_by": group_by, "results": results})
+
+    @action(detail=False, methods=['get'], url_path='top-products')
+    def top_products(self, request):
+        """
+        Best sellers ranked by ?metric=quantity|revenue|profit over start_date/end_date,
+        optionally within one ?category or ranking categories with ?group_by=category.
+        """
+        metric = request.query_params.get('metric', 'quantity')
+        group_by = request.query_params.get('group_by') or 'product'
+        if metric not in RANKINGS:
+            return Response({"error": f"metric must be one of: {', '.join(RANKINGS)}."}, status=400)
+        if group_by not in ('product', 'category'):
+            return Response({"error": "group_by must be product or category."}, status=400)
+
+        shop_ids = self.get_shop_ids(request)
+        if shop_ids is None:
+            return Response({"error": "Invalid shop."}, status=400)
+
+        try:
+            limit = min(int(request.query_params.get('limit', 10)), 100)
+            category = request.query_params.get('category')
+            category = int(category) if category else None
+            start = parse_bound(request.query_params.get('start_date'))
+            end = parse_bound(request.query_params.get('end_date'))
+        except ValueError:
+            return Response({"error": "Invalid limit, category or date range."}, status=400)
+        if limit < 1:
+            return Response({"error": "Invalid limit, category or date range."}, status=400)
+
+        # Any sale in one of the shops bumps its sales version, and any product or
+        # category rename its catalog version, so stale rankings are never read
+        params = (
+            sorted(shop_ids), get_versions('sales', shop_ids), get_versions('catalog', shop_ids),
+            metric, group_by, limit, category, start, end,
+        )
+        key = 'sales:top:' + hashlib.md5(repr(params).encode()).hexdigest()
+        results = cache.get(key)
+        if results is None:
+            results = TopSellerSerializer(
+                top_sellers(shop_ids, metric, limit, start, end, category, group_by), many=True
+            ).data
+            cache.set(key, results, 300)
+        return Response({"metric": metric, "group_by": group_by, "results": results})
@@ -10,6 +10,7 @@ For the full list of settings and their values, see
 https://docs.djangoproject.com/en/5.1/ref/settings/
 """
 
+import os
 from pathlib import Path
 from datetime import timedelta
 
@@ -38,6 +39,7 @@ INSTALLED_APPS = [
     'django.contrib.sessions',
     'django.contrib.messages',
     'django.contrib.staticfiles',
+    'django.contrib.postgres',
     'core',
     'shop',
     'notification',
@@ -98,6 +100,35 @@ DATABASES = {
 }
 
 
+# Cache
+# https://docs.djangoproject.com/en/5.1/topics/cache/
+# Catalog reads are cached per shop; point REDIS_URL at any Redis-protocol
+# server in production so all workers share the cache and its versions.
+
+if os.environ.get('REDIS_URL'):
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+            'LOCATION': os.environ['REDIS_URL'],
+        }
+    }
+else:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        }
+    }
+
+
+# Activity log
+# Events are buffered per process and bulk-inserted by a background thread;
+# ACTIVITY_SYNC writes every event immediately (tests, one-off scripts).
+
+ACTIVITY_SYNC = os.environ.get('ACTIVITY_SYNC') == '1'
+ACTIVITY_BATCH_SIZE = 200
+ACTIVITY_FLUSH_INTERVAL = 5
+
+
 # Password validation
 # https://docs.djangoproject.com/en/5.1/ref/settings/#auth-password-validators
 
@@ -145,6 +176,11 @@ AUTH_USER_MODEL = 'core.User'
 REST_FRAMEWORK = {
     # 'COERCE_DECIMAL_TO_STRING': False,
     'DEFAULT_FILTER_BACKENDS': ['django_filters.rest_framework.DjangoFilterBackend'],
+    # Same output as JSONRenderer, encoded with orjson when it is installed
+    'DEFAULT_RENDERER_CLASSES': (
+        'shop.renderers.ORJSONRenderer',
+        'rest_framework.renderers.BrowsableAPIRenderer',
+    ),
     'DEFAULT_AUTHENTICATION_CLASSES': (
         'rest_framework.authentication.TokenAuthentication',
     ),